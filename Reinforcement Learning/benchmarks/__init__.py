@@ -0,0 +1,13 @@
+"""
+Benchmark suite of the environment, observation, rendering and learning hot
+paths. Run from the Reinforcement Learning directory:
+
+    python -m benchmarks                                  # run every case
+    python -m benchmarks -k stepN                         # cases matching stepN
+    python -m benchmarks --save benchmarks/baselines/main.json
+    python -m benchmarks --compare benchmarks/baselines/main.json --threshold 0.1
+
+Each case reports units per second (env steps, agent decisions, updates)
+and the p50/p90/p99 latency of a single call. --compare exits with status 1
+when a case got slower than the baseline by more than the threshold.
+"""
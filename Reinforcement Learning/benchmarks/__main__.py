@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+import argparse
+import sys
+import warnings
+
+from benchmarks import cases  # noqa: F401, registers the cases
+from benchmarks import harness
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__)
+    parser.add_argument("-k", "--pattern", help="only run the cases whose name contains this string")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply the number of timed calls of every case")
+    parser.add_argument("--save", metavar="PATH", help="write the results to a JSON baseline")
+    parser.add_argument("--compare", metavar="PATH", help="compare the results with a JSON baseline")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="relative slowdown of the metric counted as a regression (default 0.1)")
+    parser.add_argument("--metric", default="p50_us", choices=["mean_us", "p50_us", "p90_us", "p99_us"])
+    parser.add_argument("--list", action="store_true", help="list the cases and exit")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for bench in harness.CASES:
+            for name, _ in bench.variants():
+                if not args.pattern or args.pattern in name:
+                    print(name)
+        return 0
+
+    warnings.filterwarnings("ignore")
+    document = harness.run(args.pattern, args.scale)
+
+    if args.save:
+        harness.save(document, args.save)
+        print(f"Saved {len(document['results'])} results to {args.save}")
+
+    if args.compare:
+        baseline = harness.load(args.compare)
+        if args.pattern:
+            baseline["results"] = {name: result for name, result in baseline["results"].items()
+                                   if args.pattern in name}
+        rows = harness.compare(document, baseline, args.threshold, args.metric)
+        print()
+        print(harness.format_comparison(rows, args.metric))
+
+        regressions = [row for row in rows if row[-1] == "REGRESSION"]
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}")
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,232 @@
+"""
+Hot paths of the environment, observation, rendering and learning code.
+Environments of any size are built with RoomEnv, a walled room with the
+goal in the far corner: WarehouseEnv sizes come in whole 8x8 bays
+(2 + 8 * k cells per side) and its internal walls would change the
+amount of work from one size to the next.
+"""
+from __future__ import annotations
+
+import itertools
+
+import numpy as np
+
+from minigrid.core.mission import MissionSpace
+from minigrid.core.world_object import Goal
+from benchmarks.harness import case, grid
+from warehouse.envs.grid import ArrayGrid, Grid
+from warehouse.envs.minigrid_env_mod import MiniGridEnvMod
+
+SIZES = (10, 20, 40)
+GRID_CLASSES = {"Grid": Grid, "ArrayGrid": ArrayGrid}
+
+
+class RoomEnv(MiniGridEnvMod):
+    """
+    Walled room of any size with the first two agents in the top corners
+    and the others row by row from the top-left one
+    """
+
+    def __init__(self, size=10, max_steps=10**9, agent_view_size=3, **kwargs):
+        super().__init__(
+            mission_space=MissionSpace(mission_func=lambda: "Reach the target location"),
+            grid_size=size,
+            agent_view_size=agent_view_size,
+            max_steps=max_steps,
+            **kwargs,
+        )
+
+    def _gen_grid(self, width, height):
+        self.grid = self.grid_cls(width, height)
+        self.grid.wall_rect(0, 0, width, height)
+        self.put_obj(Goal(), width - 2, height - 2)
+
+        corners = [(1, 1), (width - 2, 1)]
+        cells = [
+            (i, j)
+            for j in range(1, height - 1)
+            for i in range(1, width - 1)
+            if (i, j) not in corners and (i, j) != (width - 2, height - 2)
+        ]
+        self.agent_pos[:] = (corners + cells)[: self.n_agents]
+        self.agent_dir[:] = 1
+
+
+def make_grid(size: int, grid_cls=Grid) -> Grid:
+    env = RoomEnv(size, array_grid=grid_cls is ArrayGrid)
+    env.reset()
+    return env.grid
+
+
+def make_env(size: int = 10, **kwargs) -> RoomEnv:
+    env = RoomEnv(size, **kwargs)
+    env.reset()
+    return env
+
+
+def cycle_actions():
+    # Every movement action in turn, the agents stay next to their start
+    return itertools.cycle(range(5))
+
+
+@case("stepN", grid(size=SIZES, agents=(1, 2, 32), fast_step=(False, True), obs_mode=("grid", "state")))
+def bench_stepN(size, agents, fast_step, obs_mode):
+    env = make_env(size, fast_step=fast_step, obs_mode=obs_mode, n_agents=max(agents, 2))
+    actions = cycle_actions()
+    agent_ids = range(1, agents + 1)
+
+    def tick():
+        action = next(actions)
+        for agentN in agent_ids:
+            env.stepN(action, agentN, 0)
+
+    return tick, agents
+
+
+@case("step_all", grid(size=SIZES, agents=(2, 32), fast_step=(False, True), obs_mode=("grid", "state"),
+                       agent_collisions=(False, True)))
+def bench_step_all(size, agents, fast_step, obs_mode, agent_collisions):
+    # Same ticks as the stepN case, as one joint step. The packed rows of
+    # agents block each other when they collide
+    env = make_env(size, fast_step=fast_step, obs_mode=obs_mode, n_agents=agents,
+                   agent_collisions=agent_collisions)
+    actions = cycle_actions()
+
+    def tick():
+        env.step_all(np.full(agents, next(actions)))
+
+    return tick, agents
+
+
+@case("gen_obs", grid(size=SIZES, obs_mode=("grid", "state"), n_agents=(2, 32)))
+def bench_gen_obs(size, obs_mode, n_agents):
+    env = make_env(size, obs_mode=obs_mode, n_agents=n_agents)
+    return env.gen_obs, 1
+
+
+@case("Grid.slice", grid(size=SIZES, grid_cls=GRID_CLASSES, view=(3, 7)))
+def bench_slice(size, grid_cls, view):
+    g = make_grid(size, GRID_CLASSES[grid_cls])
+    return (lambda: g.slice(1, 1, view, view)), 1
+
+
+@case("Grid.encode", grid(size=SIZES, grid_cls=GRID_CLASSES))
+def bench_encode(size, grid_cls):
+    g = make_grid(size, GRID_CLASSES[grid_cls])
+    return g.encode, 1
+
+
+@case("Grid.render", grid(size=SIZES), calls=50)
+def bench_render(size):
+    g = make_grid(size)
+    return (lambda: g.render(32, (1, 1), (size - 2, 1), 1, 1)), 1
+
+
+@case("Grid.process_vis", grid(size=SIZES, grid_cls=GRID_CLASSES))
+def bench_process_vis(size, grid_cls):
+    # process_vis clears the hidden cells, so it runs on a fresh copy
+    g = make_grid(size, GRID_CLASSES[grid_cls])
+    g.vert_wall(size // 2, 1, size // 2)
+    array = g.encode()
+    decode = GRID_CLASSES[grid_cls].decode
+    return (lambda: decode(array)[0].process_vis((1, size - 2))), 1
+
+
+@case("gen_highlight_mask", grid(size=SIZES, view=(3, 7, 15)))
+def bench_highlight_mask(size, view):
+    env = make_env(size, agent_view_size=view)
+    return env.gen_highlight_mask, 1
+
+
+@case("get_frame", grid(size=SIZES, atlas_render=(False, True)), calls=200)
+def bench_get_frame(size, atlas_render):
+    # Frame after one step of each agent, the usual per-step render
+    env = make_env(size, fast_step=True, obs_mode="state", render_mode="rgb_array",
+                   atlas_render=atlas_render)
+    actions = cycle_actions()
+
+    def frame():
+        action = next(actions)
+        env.stepN(action, 1, 0)
+        env.stepN(action, 2, 0)
+        env.get_frame(env.highlight, env.tile_size)
+
+    return frame, 1
+
+
+@case("observationToState", grid(view=(3, 7)))
+def bench_observation_to_state(view):
+    from main import observationToState
+
+    cells = make_grid(10).slice(0, 0, view, view).grid
+    return (lambda: observationToState(cells)), 1
+
+
+def make_dqn(batch_size=64, memory=None, n_features=9, n_actions=5):
+    import model
+    import replay
+
+    if memory == "uniform":
+        memory = replay.ReplayBuffer(100000, n_features)
+    elif memory == "prioritized":
+        memory = replay.PrioritizedReplayBuffer(100000, n_features)
+
+    if memory is not None:
+        rng = np.random.default_rng(0)
+        n = 10 * batch_size
+        memory.store_batch(rng.integers(-1, 2, (n, n_features)), rng.integers(0, n_actions, n),
+                           rng.random(n), rng.integers(-1, 2, (n, n_features)), rng.random(n) < 0.01)
+
+    return model.DQN(n_features=n_features, n_actions=n_actions, lr=1e-3, reward_decay=0.99,
+                     epsilon=0.0, eps_dec=0.0, eps_min=0.0, memory=memory, batch_size=batch_size)
+
+
+@case("DQN.choose_action")
+def bench_choose_action():
+    import torch as t
+
+    agent = make_dqn()
+    state = t.zeros((1, 9))
+    return (lambda: agent.choose_action(state)), 1
+
+
+@case("MultiAgentDQN.choose_actions", grid(agents=(2, 8, 32)))
+def bench_choose_actions(agents):
+    import model
+
+    learner = model.MultiAgentDQN(n_agents=agents, n_features=9, n_actions=5, lr=1e-3, reward_decay=0.99,
+                                  epsilon=0.0, eps_dec=0.0, eps_min=0.0)
+    states = np.zeros((agents, 9), dtype=np.float32)
+    return (lambda: learner.choose_actions(states)), agents
+
+
+@case("DQN.learn", grid(memory=("uniform", "prioritized"), batch_size=(32, 64, 256))
+      + [{"memory": None, "batch_size": 1}], calls=500)
+def bench_learn(memory, batch_size):
+    agent = make_dqn(batch_size, memory)
+    state = np.zeros(9, dtype=np.float32)
+    state_ = np.ones(9, dtype=np.float32)
+    return (lambda: agent.learn(state, 1, 0.0, state_, False)), 1
+
+
+@case("WarehouseVecEnv.step", grid(num_envs=(1, 64, 1024), n_agents=(2, 8), agent_collisions=(False, True)),
+      calls=500)
+def bench_vec_step(num_envs, n_agents, agent_collisions):
+    from warehouse.envs import WarehouseVecEnv
+
+    env = WarehouseVecEnv(num_envs, n_agents=n_agents, agent_collisions=agent_collisions, seed=0)
+    env.reset()
+    rng = np.random.default_rng(0)
+    actions = rng.integers(0, 5, (64, num_envs, n_agents))
+    ticks = itertools.cycle(actions)
+    return (lambda: env.step(next(ticks))), num_envs * n_agents
+
+
+@case("WarehouseVecEnv.render", grid(num_envs=(1, 16, 64), tile_size=(8, 32)), calls=50)
+def bench_vec_render(num_envs, tile_size):
+    from warehouse.envs import WarehouseVecEnv
+
+    env = WarehouseVecEnv(num_envs, seed=0)
+    env.reset()
+    out = np.empty((num_envs, env.height * tile_size, env.width * tile_size, 3), dtype=np.uint8)
+    return (lambda: env.render(tile_size, out=out)), num_envs
@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+import itertools
+import json
+import os
+import platform
+import time
+from typing import Callable
+
+import numpy as np
+
+# Latency percentiles kept for every case
+PERCENTILES = (50, 90, 99)
+
+
+class Case:
+    """
+    One benchmarked hot path. setup(**params) builds everything the call
+    needs and returns (fn, items): fn runs one call and items is the number
+    of units (env steps, samples...) it processes, used for the rate.
+    """
+
+    def __init__(self, name: str, setup: Callable, params: list[dict], calls: int) -> None:
+        self.name = name
+        self.setup = setup
+        self.params = params
+        self.calls = calls
+
+    def variants(self):
+        for params in self.params:
+            yield variant_name(self.name, params), params
+
+
+CASES: list[Case] = []
+
+
+def case(name: str, params: list[dict] | None = None, calls: int = 2000):
+    """
+    Register a setup function as a benchmark case, run once per entry of
+    params
+    """
+
+    def register(setup):
+        CASES.append(Case(name, setup, params or [{}], calls))
+        return setup
+
+    return register
+
+
+def grid(**values) -> list[dict]:
+    """
+    Every combination of the given parameter values
+    """
+
+    keys = list(values)
+    return [dict(zip(keys, combo)) for combo in itertools.product(*values.values())]
+
+
+def variant_name(name: str, params: dict) -> str:
+    if not params:
+        return name
+    return "{}[{}]".format(name, ",".join(f"{k}={v}" for k, v in params.items()))
+
+
+def measure(fn: Callable, calls: int, items: int = 1, warmup: int | None = None) -> dict:
+    """
+    Time calls individually and summarize the latencies in microseconds
+    """
+
+    warmup = max(1, calls // 10) if warmup is None else warmup
+    for _ in range(warmup):
+        fn()
+
+    times = np.empty(calls, dtype=np.int64)
+    clock = time.perf_counter_ns
+    for k in range(calls):
+        start = clock()
+        fn()
+        times[k] = clock() - start
+
+    times_us = times / 1e3
+    mean_us = float(times_us.mean())
+    result = {
+        "calls": calls,
+        "items": items,
+        "per_sec": items / mean_us * 1e6,
+        "mean_us": mean_us,
+    }
+    for q, value in zip(PERCENTILES, np.percentile(times_us, PERCENTILES)):
+        result[f"p{q}_us"] = float(value)
+    return result
+
+
+def run(pattern: str | None = None, scale: float = 1.0, report: Callable | None = print) -> dict:
+    """
+    Run the registered cases whose variant name contains pattern and return
+    a results document, ready to be saved as a baseline
+    """
+
+    results = {}
+    for bench in CASES:
+        for name, params in bench.variants():
+            if pattern and pattern not in name:
+                continue
+            fn, items = bench.setup(**params)
+            result = measure(fn, max(1, int(bench.calls * scale)), items)
+            result["params"] = {k: str(v) for k, v in params.items()}
+            results[name] = result
+            if report is not None:
+                report(format_result(name, result))
+
+    return {"meta": environment_info(), "results": results}
+
+
+def environment_info() -> dict:
+    import torch
+
+    return {
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "torch": torch.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "node": platform.node(),
+    }
+
+
+def format_result(name: str, result: dict) -> str:
+    return "{:<64} {:>12.0f}/s  mean {:>9.2f}  p50 {:>9.2f}  p90 {:>9.2f}  p99 {:>9.2f} us".format(
+        name, result["per_sec"], result["mean_us"], result["p50_us"], result["p90_us"], result["p99_us"]
+    )
+
+
+def save(document: dict, path: str) -> None:
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(document, f, indent=2, sort_keys=True)
+
+
+def load(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(current: dict, baseline: dict, threshold: float = 0.1, metric: str = "p50_us") -> list[tuple]:
+    """
+    (name, baseline, current, ratio, status) of every case of either
+    document. A case regresses when its latency metric grew by more than
+    threshold, and counts as faster when it shrank by the same factor.
+    """
+
+    current = current["results"]
+    baseline = baseline["results"]
+
+    rows = []
+    for name in sorted(set(current) | set(baseline)):
+        if name not in baseline:
+            rows.append((name, None, current[name][metric], None, "new"))
+            continue
+        if name not in current:
+            rows.append((name, baseline[name][metric], None, None, "missing"))
+            continue
+
+        before = baseline[name][metric]
+        after = current[name][metric]
+        ratio = after / before
+        if ratio > 1 + threshold:
+            status = "REGRESSION"
+        elif ratio < 1 / (1 + threshold):
+            status = "faster"
+        else:
+            status = "ok"
+        rows.append((name, before, after, ratio, status))
+
+    return rows
+
+
+def format_comparison(rows: list[tuple], metric: str) -> str:
+    lines = ["{:<64} {:>12} {:>12} {:>8}  {}".format("case", "baseline", "current", "ratio", metric)]
+    for name, before, after, ratio, status in rows:
+        lines.append("{:<64} {:>12} {:>12} {:>8}  {}".format(
+            name,
+            "-" if before is None else f"{before:.2f}",
+            "-" if after is None else f"{after:.2f}",
+            "-" if ratio is None else f"{ratio:.2f}x",
+            status,
+        ))
+    return "\n".join(lines)
@@ -0,0 +1,154 @@
+import copy
+import glob
+import os
+import random
+import threading
+
+import numpy as np
+import torch as t
+
+
+def unique_path(dir: str, stem: str, ext: str) -> str:
+    """
+    Path of a new file dir/stem + ext, suffixed " (1)", " (2)"... when the
+    name is taken. The file is created empty so that a concurrent caller
+    cannot pick the same name.
+    """
+    os.makedirs(dir, exist_ok=True)
+    k = 0
+    while True:
+        path = os.path.join(dir, stem + (" ({})".format(k) if k else "") + ext)
+        try:
+            open(path, "xb").close()
+            return path
+        except FileExistsError:
+            k += 1
+
+
+def rng_state(env=None) -> dict:
+    """
+    State of the Python, NumPy and torch generators, and of the env's own
+    generator when given
+    """
+    state = {"python": random.getstate(),
+             "numpy": np.random.get_state(),
+             "torch": t.get_rng_state()}
+    if t.cuda.is_available():
+        state["cuda"] = t.cuda.get_rng_state_all()
+    if env is not None:
+        state["env"] = env.unwrapped.np_random.bit_generator.state
+    return state
+
+
+def set_rng_state(state: dict, env=None) -> None:
+    random.setstate(state["python"])
+    np.random.set_state(state["numpy"])
+    t.set_rng_state(state["torch"])
+    if "cuda" in state and t.cuda.is_available():
+        t.cuda.set_rng_state_all(state["cuda"])
+    if env is not None and "env" in state:
+        env.unwrapped.np_random.bit_generator.state = state["env"]
+
+
+def snapshot(obj):
+    """
+    Deep copy of a checkpoint, with tensors cloned to the CPU, so that
+    training can go on while it is written
+    """
+    if isinstance(obj, t.Tensor):
+        return obj.detach().to("cpu", copy=True)
+    if isinstance(obj, dict):
+        return {k: snapshot(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(snapshot(v) for v in obj)
+    return copy.deepcopy(obj)
+
+
+class Checkpointer:
+    """
+    Writes training checkpoints from a background thread. save() copies the
+    state on the calling thread and returns at once; the writer thread
+    saves it to a temporary file, renames it over the final name and
+    deletes all but the last keep checkpoints, or none with keep=None. If
+    a checkpoint is still being written when the next one comes in, only
+    the newest pending one is kept, so the training loop never waits for
+    the disk. The directory and the thread are only created by the first
+    save, loading alone touches neither.
+    """
+    def __init__(self, dir: str, keep: int | None = 3, prefix: str = "checkpoint") -> None:
+        if keep is not None and keep < 1:
+            raise ValueError(f"keep must be at least 1, or None to keep every checkpoint, got: {keep}")
+        self.dir = dir
+        self.keep = keep
+        self.prefix = prefix
+
+        self._pending = None
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def path(self, step: int) -> str:
+        return os.path.join(self.dir, "{}-{:08d}.pt".format(self.prefix, step))
+
+    def checkpoints(self) -> list:
+        """
+        Paths of the complete checkpoints, oldest first
+        """
+        return sorted(glob.glob(os.path.join(self.dir, glob.escape(self.prefix) + "-*.pt")))
+
+    def latest(self):
+        paths = self.checkpoints()
+        return paths[-1] if paths else None
+
+    def save(self, state: dict, step: int) -> None:
+        state = snapshot(state)
+        if self._thread is None:
+            os.makedirs(self.dir, exist_ok=True)
+            self._thread = threading.Thread(target=self._run, name="Checkpointer", daemon=True)
+            self._thread.start()
+        with self._cond:
+            self._pending = (state, step)
+            self._cond.notify()
+
+    def load(self, path: str = None):
+        """
+        Checkpoint at path, by default the latest one, None if there is none
+        """
+        path = path or self.latest()
+        if path is None:
+            return None
+        return t.load(path, map_location="cpu", weights_only=False)
+
+    def close(self) -> None:
+        """
+        Write the pending checkpoint, if any, and stop the writer thread
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while self._pending is None and not self._closed:
+                    self._cond.wait()
+                if self._pending is None:
+                    return
+                state, step = self._pending
+                self._pending = None
+            self._write(state, step)
+
+    def _write(self, state: dict, step: int) -> None:
+        path = self.path(step)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            t.save(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+        if self.keep is not None:
+            for old in self.checkpoints()[:-self.keep]:
+                os.remove(old)
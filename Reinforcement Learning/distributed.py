@@ -0,0 +1,207 @@
+"""
+Ape-X style training: K actor processes each run their own WarehouseEnv
+with a CPU copy of the Q-network and stream transitions into a
+shared-memory replay buffer, while the learner in the main process trains
+from it and periodically broadcasts updated weights back to the actors.
+"""
+from __future__ import annotations
+
+import os
+import queue
+import warnings
+
+import gymnasium as gym
+import numpy as np
+import torch as t
+import torch.multiprocessing as mp
+from tensorboardX import SummaryWriter
+
+import warehouse, model, replay
+
+
+def actor_epsilon(actor_id: int, n_actors: int, base: float = 0.4, alpha: float = 7.0) -> float:
+    """
+    Fixed exploration rate of an actor, spread from base to nearly greedy
+    across actors as in Ape-X
+    """
+
+    if n_actors == 1:
+        return base
+    return base ** (1 + alpha * actor_id / (n_actors - 1))
+
+
+def run_actor(actor_id, n_actors, memory, shared_net, version, weights_lock, stop, scores, config):
+    """
+    Collect transitions for every robot with the latest published network
+    and write them to the shared replay in chunks of flush_every
+    """
+
+    warnings.filterwarnings("ignore")
+    # One thread per actor, the cores are shared between the processes
+    t.set_num_threads(1)
+    np.random.seed(config["seed"] + actor_id)
+
+    env = gym.make("WarehouseEnv-v0", agent1_pos=(2, 3), agent2_pos=(7, 6), goal_pos=(4, 8),
+                   max_steps=config["steps"], fast_step=True, obs_mode="state",
+                   view_cache_dir=config["view_cache_dir"]).unwrapped
+    n_agents = env.n_agents
+    n_actions = env.action_space.n - 1
+    epsilon = actor_epsilon(actor_id, n_actors)
+
+    net = model.FeedForwardNN(memory.n_features, n_actions)
+    net.load_state_dict(shared_net.state_dict())
+    local_version = version.value
+
+    # Local chunk of transitions, flushed to the shared replay in one write
+    flush_every = config["flush_every"]
+    states = np.zeros((flush_every, memory.n_features), dtype=np.float32)
+    actions = np.zeros(flush_every, dtype=np.int64)
+    rewards = np.zeros(flush_every, dtype=np.float32)
+    states_ = np.zeros((flush_every, memory.n_features), dtype=np.float32)
+    dones = np.zeros(flush_every, dtype=np.float32)
+    n = 0
+
+    while not stop.is_set():
+        obs = env.reset()
+        state = [obs["state%d" % (k + 1)] for k in range(n_agents)]
+        done = [False] * n_agents
+        score = 0
+
+        for j in range(config["steps"]):
+            # All robots act in one joint step, the ones at the goal stay
+            active = [not d for d in done]
+            joint = np.full(n_agents, env.actions.stay)
+            for k in range(n_agents):
+                if not active[k]:
+                    continue
+
+                if np.random.random() > epsilon:
+                    with t.no_grad():
+                        joint[k] = int(net(t.from_numpy(state[k])).argmax())
+                else:
+                    joint[k] = np.random.choice(n_actions)
+
+            obs_, reward, terminated, truncated, _ = env.step_all(joint, active)
+            for k in range(n_agents):
+                if not active[k]:
+                    continue
+
+                done[k] = terminated.item(k)
+                states[n] = state[k]
+                actions[n] = joint[k]
+                rewards[n] = reward[k]
+                states_[n] = state[k] = obs_["state%d" % (k + 1)]
+                dones[n] = done[k]
+                score += reward[k]
+                n += 1
+
+                if n == flush_every:
+                    memory.store_batch(states, actions, rewards, states_, dones)
+                    n = 0
+
+                    # Pick up the latest weights published by the learner
+                    if version.value != local_version:
+                        with weights_lock:
+                            net.load_state_dict(shared_net.state_dict())
+                            local_version = version.value
+
+            if all(done) or truncated or stop.is_set():
+                break
+
+        scores.put((actor_id, score))
+
+
+if __name__ == "__main__":
+    warnings.filterwarnings("ignore")
+
+    # Number of actor processes, the learner runs in this process
+    nActors = max(1, (os.cpu_count() or 2) - 1)
+    updates = 100000
+    steps = 5000
+
+    config = {
+        "seed": 0,
+        "steps": steps,
+        # transitions an actor collects before writing them to the replay
+        "flush_every": 64,
+        # the view table of the layout, computed by the first actor
+        "view_cache_dir": "./view_tables",
+    }
+
+    replayCapacity = 1000000
+    batchSize = 512
+    # learner updates between two weight broadcasts
+    publishEvery = 100
+    # learner updates between two refreshes of its target network
+    targetUpdateEvery = 100
+
+    env = gym.make("WarehouseEnv-v0", max_steps=steps)
+    n_features = env.observation_space.n
+    n_actions = env.action_space.n - 1
+
+    mp.set_start_method("spawn")
+
+    learner = model.DQN(
+        n_features=n_features,
+        n_actions=n_actions,
+        lr=1e-3,
+        reward_decay=0.99,
+        epsilon=0.0,
+        eps_dec=0.0,
+        eps_min=0.0,
+        target_update_every=targetUpdateEvery)
+
+    memory = replay.SharedReplayBuffer(replayCapacity, n_features)
+
+    # CPU copy of the weights in shared memory, read by every actor
+    shared_net = model.FeedForwardNN(n_features, n_actions)
+    shared_net.load_state_dict(learner.net.state_dict())
+    shared_net.share_memory()
+    version = mp.Value("i", 0)
+    weights_lock = mp.Lock()
+
+    stop = mp.Event()
+    scores = mp.Queue()
+
+    actors = [mp.Process(target=run_actor,
+                         args=(k, nActors, memory, shared_net, version, weights_lock, stop, scores, config),
+                         daemon=True)
+              for k in range(nActors)]
+    for actor in actors:
+        actor.start()
+
+    writer = SummaryWriter("./logs")
+    episode = 0
+
+    try:
+        update = 0
+        while update < updates:
+            while True:
+                try:
+                    actor_id, score = scores.get_nowait()
+                except queue.Empty:
+                    break
+                writer.add_scalar("SCORES", score, episode)
+                episode += 1
+
+            if len(memory) < batchSize:
+                stop.wait(0.1)
+                continue
+
+            loss = learner.learn_batch(*memory.sample(batchSize))
+            update += 1
+
+            if update % publishEvery == 0:
+                with weights_lock:
+                    shared_net.load_state_dict(learner.net.state_dict())
+                    version.value += 1
+                writer.add_scalar("loss", loss, update)
+                writer.add_scalar("replay_size", len(memory), update)
+                print(f"Update {update}: loss = {loss:.4f}, transitions = {len(memory)}, episodes = {episode}")
+    finally:
+        stop.set()
+        for actor in actors:
+            actor.join(timeout=10)
+        learner.save_model("./saved_models")
+        writer.close()
+        memory.close()
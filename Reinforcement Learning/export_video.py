@@ -0,0 +1,298 @@
+"""
+Offline rendering of episodes to GIF, MP4 or PNG sequences. Episodes come
+either from trajectories recorded with trajectory.TrajectoryRecorder, or
+from a greedy, seeded replay of a saved model. Every episode is rendered
+with MiniGridEnvMod.get_frame and encoded by one process of a pool, so
+reviewing many episodes neither needs the live Window nor slows training.
+
+One frame is written at the start of an episode and one after every tick,
+once each active robot has moved.
+"""
+from __future__ import annotations
+
+import glob
+import multiprocessing as mp
+import os
+import shutil
+import subprocess
+import warnings
+
+import numpy as np
+
+FORMATS = ("gif", "mp4", "png")
+
+
+class FrameWriter:
+    """
+    Streams RGB frames to path: a .gif or .mp4 file, or a directory of
+    numbered .png files. MP4 encoding pipes the raw frames to ffmpeg.
+    """
+
+    def __init__(self, path: str, fmt: str, fps: int = 10) -> None:
+        assert fmt in FORMATS, f"Unknown format: {fmt}"
+        self.path = path
+        self.fmt = fmt
+        self.fps = fps
+        self.n_frames = 0
+        self._images = []
+        self._ffmpeg = None
+
+        if fmt == "png":
+            os.makedirs(path, exist_ok=True)
+        elif fmt == "mp4" and shutil.which("ffmpeg") is None:
+            raise RuntimeError("MP4 export needs ffmpeg on the PATH")
+
+    def write(self, frame: np.ndarray) -> None:
+        from PIL import Image
+
+        if self.fmt == "png":
+            Image.fromarray(frame).save(os.path.join(self.path, "{:06d}.png".format(self.n_frames)),
+                                        compress_level=1)
+        elif self.fmt == "gif":
+            # Palette images take a third of the memory of the RGB frames.
+            # The few colors of a grid all show in the first frame, whose
+            # palette is reused for the others
+            image = Image.fromarray(frame)
+            if self._images:
+                image = image.quantize(palette=self._images[0], dither=Image.Dither.NONE)
+            else:
+                image = image.quantize(colors=64, method=Image.Quantize.FASTOCTREE)
+            self._images.append(image)
+        else:
+            if self._ffmpeg is None:
+                height, width = frame.shape[:2]
+                self._ffmpeg = subprocess.Popen(
+                    ["ffmpeg", "-loglevel", "error", "-y", "-f", "rawvideo", "-pix_fmt", "rgb24",
+                     "-s", f"{width}x{height}", "-r", str(self.fps), "-i", "-",
+                     "-pix_fmt", "yuv420p", "-vcodec", "libx264", self.path],
+                    stdin=subprocess.PIPE)
+            self._ffmpeg.stdin.write(np.ascontiguousarray(frame).tobytes())
+        self.n_frames += 1
+
+    def close(self) -> None:
+        if self.fmt == "gif" and self._images:
+            first, *rest = self._images
+            first.save(self.path, save_all=True, append_images=rest,
+                       duration=int(1000 / self.fps), loop=0, optimize=False)
+            self._images = []
+        elif self._ffmpeg is not None:
+            self._ffmpeg.stdin.close()
+            self._ffmpeg.wait()
+            self._ffmpeg = None
+
+
+_envs = {}
+
+
+def _worker_env(n_agents: int = 2):
+    # One environment per worker process and number of agents, reused
+    # across its episodes. Recorded grids of any size are put in place of
+    # its own with set_grid
+    if n_agents not in _envs:
+        from warehouse.envs.WarehouseEnv import WarehouseEnv
+
+        warnings.filterwarnings("ignore")
+        _envs[n_agents] = WarehouseEnv(render_mode="rgb_array", fast_step=True, obs_mode="state",
+                                       n_agents=n_agents)
+    return _envs[n_agents]
+
+
+def render_recorded(task) -> tuple[str, int]:
+    """
+    Render one recorded episode: its grid encoding, the start positions and
+    directions of its agents and, per agent step, the agent and its
+    position after the step. Shards recorded without start positions start
+    every agent at the position of its first step, facing down
+    """
+
+    layout, starts, agents, pos, pos_, path, fmt, fps, tile_size, frame_every = task
+    if starts is None:
+        ids, first = np.unique(agents, return_index=True)
+        start_pos = np.zeros((int(agents.max()), 2), dtype=pos.dtype)
+        start_pos[ids - 1] = pos[first]
+        starts = (start_pos, np.ones(len(start_pos), dtype=np.int8))
+    start_pos, start_dirs = starts
+    env = _worker_env(len(start_pos))
+    env.reset()
+
+    # Put the recorded agents and layout in place of the env's own
+    env.agent_pos[:] = start_pos
+    env.agent_dir[:] = start_dirs
+    env.set_grid(env.grid_cls.decode(layout)[0])
+
+    writer = FrameWriter(path, fmt, fps)
+    writer.write(env.get_frame(env.highlight, tile_size))
+
+    # A tick ends when the next step is taken by the same or a lower agent
+    tick_end = np.ones(len(agents), dtype=bool)
+    tick_end[:-1] = agents[1:] <= agents[:-1]
+    tick = 0
+    for agentN, (x, y), end in zip(agents.tolist(), pos_.tolist(), tick_end):
+        env.agent_pos[agentN - 1] = (x, y)
+        if end:
+            tick += 1
+            if tick % frame_every == 0:
+                writer.write(env.get_frame(env.highlight, tile_size))
+
+    writer.close()
+    return path, writer.n_frames
+
+
+def render_model(task) -> tuple[str, int]:
+    """
+    Replay a saved FeedForwardNN greedily for one seeded episode, the same
+    seed giving the same episode
+    """
+
+    import torch as t
+
+    import model
+
+    model_path, seed, max_steps, env_kwargs, path, fmt, fps, tile_size, frame_every = task
+    from warehouse.envs.WarehouseEnv import WarehouseEnv
+
+    warnings.filterwarnings("ignore")
+    t.set_num_threads(1)
+    env = WarehouseEnv(render_mode="rgb_array", fast_step=True, obs_mode="state",
+                       max_steps=max_steps, **env_kwargs)
+    n_features = env.observation_space.n
+    net = model.FeedForwardNN(n_features, env.action_space.n - 1)
+    net.load_state_dict(t.load(model_path, map_location="cpu"))
+    net.eval()
+
+    n_agents = env.n_agents
+    obs = env.reset(seed=seed)
+    state = [obs[f"state{k + 1}"] for k in range(n_agents)]
+    done = [False] * n_agents
+    truncated = False
+
+    writer = FrameWriter(path, fmt, fps)
+    writer.write(env.get_frame(env.highlight, tile_size))
+    tick = 0
+    while not all(done) and not truncated:
+        actions = np.full(n_agents, env.actions.stay)
+        with t.no_grad():
+            for k in range(n_agents):
+                if not done[k]:
+                    actions[k] = int(net(t.from_numpy(state[k])).argmax())
+        obs, _, terminated, truncated, _ = env.step_all(actions, [not d for d in done])
+        done = [d or bool(term) for d, term in zip(done, terminated)]
+        state = [obs[f"state{k + 1}"] for k in range(n_agents)]
+        tick += 1
+        if tick % frame_every == 0 or all(done) or truncated:
+            writer.write(env.get_frame(env.highlight, tile_size))
+
+    writer.close()
+    return path, writer.n_frames
+
+
+def recorded_tasks(data_dir: str, out_dir: str, fmt: str, fps: int = 10, tile_size: int = 32,
+                   frame_every: int = 1, max_episodes: int | None = None) -> list:
+    """
+    One render_recorded task per episode of the shards in data_dir.
+    Episodes are identified by recorder (the shard prefix) and episode id,
+    and may span several shards.
+    """
+
+    from trajectory import TrajectoryDataset
+
+    recorders = {}
+    for path in sorted(glob.glob(os.path.join(glob.escape(data_dir), "*.npz"))):
+        prefix = os.path.basename(path).rsplit("-", 1)[0]
+        recorders.setdefault(prefix, []).append(TrajectoryDataset.load(path))
+
+    ext = "" if fmt == "png" else "." + fmt
+    tasks = []
+    for prefix, shards in recorders.items():
+        layouts, agent_starts = {}, {}
+        for shard in shards:
+            layouts.update(zip(shard["layout_episodes"].tolist(), shard["layouts"]))
+            if "starts" in shard:
+                agent_starts.update(zip(shard["layout_episodes"].tolist(),
+                                        zip(shard["starts"], shard["start_dirs"])))
+        episode = np.concatenate([shard["episode"] for shard in shards])
+        agents = np.concatenate([shard["agent"] for shard in shards])
+        pos = np.concatenate([shard["pos"] for shard in shards])
+        pos_ = np.concatenate([shard["pos_"] for shard in shards])
+
+        # Rows are in recording order, so every episode is a contiguous run
+        starts = np.flatnonzero(np.r_[True, episode[1:] != episode[:-1]])
+        for start, end in zip(starts, np.r_[starts[1:], len(episode)]):
+            e = int(episode[start])
+            path = os.path.join(out_dir, f"{prefix}-ep{e:06d}{ext}")
+            tasks.append((layouts[e], agent_starts.get(e), agents[start:end], pos[start:end], pos_[start:end],
+                          path, fmt, fps, tile_size, frame_every))
+
+    return tasks[:max_episodes]
+
+
+def _attach_tiles(tiles_path: str | None):
+    if tiles_path is not None:
+        from warehouse.envs.grid import Grid
+
+        Grid.tile_cache.attach(tiles_path)
+
+
+def export(tasks: list, render, n_workers: int | None = None, tiles_path: str | None = None) -> list:
+    """
+    Render the tasks with a pool of n_workers processes, one episode per
+    task, and return the (path, number of frames) of each. Workers map the
+    tile atlas at tiles_path, if given, instead of drawing the tiles again
+    """
+
+    ctx = mp.get_context("spawn")
+    with ctx.Pool(n_workers or os.cpu_count(), initializer=_attach_tiles, initargs=(tiles_path,)) as pool:
+        results = []
+        for path, n_frames in pool.imap_unordered(render, tasks):
+            print(f"{path}: {n_frames} frames")
+            results.append((path, n_frames))
+    return results
+
+
+if __name__ == "__main__":
+    import time
+
+    # Render the episodes recorded in dataDir, or, when modelPath is set,
+    # replay that model greedily for the given episode seeds
+    dataDir = "./trajectories"
+    modelPath = None
+    seeds = range(16)
+    maxSteps = 5000
+    envKwargs = {"agent1_pos": (2, 3), "agent2_pos": (7, 6), "goal_pos": (4, 8)}
+
+    outDir = "./videos"
+    # "gif", "mp4" (needs ffmpeg) or "png" (one directory of frames per episode)
+    fmt = "gif"
+    fps = 10
+    tileSize = 32
+    # Keep one frame every frameEvery ticks
+    frameEvery = 1
+    maxEpisodes = None
+    nWorkers = os.cpu_count()
+
+    os.makedirs(outDir, exist_ok=True)
+    start = time.perf_counter()
+
+    # Draw the tiles once here, the workers map them from the atlas file,
+    # which is kept for the next runs
+    from warehouse.envs.grid import Grid
+
+    tilesPath = os.path.join(outDir, ".tiles")
+    if os.path.exists(tilesPath + ".json"):
+        Grid.tile_cache.attach(tilesPath)
+    n_tiles = len(Grid.tile_cache)
+    if Grid.tile_cache.prewarm((tileSize,)) > n_tiles:
+        Grid.tile_cache.save(tilesPath)
+
+    if modelPath:
+        ext = "" if fmt == "png" else "." + fmt
+        tasks = [(modelPath, seed, maxSteps, envKwargs, os.path.join(outDir, f"model-seed{seed}{ext}"),
+                  fmt, fps, tileSize, frameEvery) for seed in seeds]
+        results = export(tasks, render_model, nWorkers, tilesPath)
+    else:
+        tasks = recorded_tasks(dataDir, outDir, fmt, fps, tileSize, frameEvery, maxEpisodes)
+        results = export(tasks, render_recorded, nWorkers, tilesPath)
+
+    n_frames = sum(n for _, n in results)
+    elapsed = time.perf_counter() - start
+    print(f"{len(results)} episodes, {n_frames} frames in {elapsed:.1f} s ({n_frames / elapsed:.0f} frames/s)")
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import os
 from time import sleep
 import warnings
 
@@ -12,7 +13,8 @@ import torch as t
 from tensorboardX import SummaryWriter
 import numpy as np
 
-import warehouse, model
+import warehouse, model, replay, tabular, checkpoint, trajectory
+from profiling import PhaseTimer
 
 def observationToState(grid):
     state = []
@@ -36,9 +38,54 @@ if __name__ == "__main__":
     episodes = 100
     steps = 5000
 
-    env = gym.make("WarehouseEnv-v0", agent1_pos=(2, 3), agent2_pos=(7, 6), goal_pos=(4, 8), max_steps = steps)
+    # Experience replay: each agent stores its transitions in a ring buffer of
+    # this capacity and runs one minibatch update every learnEvery steps.
+    # Set replayCapacity to 0 to learn from every single transition instead.
+    # Prioritized replay samples transitions proportionally to their last TD
+    # error, so the rare goal rewards are replayed more often.
+    replayCapacity = 100000
+    prioritizedReplay = True
+    batchSize = 64
+    learnEvery = 4
+    # The minibatch targets bootstrap from a copy of the network refreshed
+    # every targetUpdateEvery updates
+    targetUpdateEvery = 100
+
+    # Directory of a memory-mapped replay on disk (one subdirectory per
+    # learner), for capacities that do not fit in RAM; None keeps the replay
+    # in memory. An existing replay in it is reopened. Sampling from it is
+    # uniform, so it needs prioritizedReplay = False.
+    replayDir = None
+
+    # Use one MultiAgentDQN for both robots (shared network with an agent-ID
+    # input) instead of two independent DQNs, with one batched update per step
+    sharedLearner = False
+
+    # Use a dense Q-table per robot instead of a DQN: the 3x3 views of -1/0/1
+    # cells give at most 3^9 states, so a table update is exact and cheap
+    tabularLearner = False
+
+    # Checkpoints (networks, optimizers, epsilon, RNG state and episode) are
+    # written every checkpointEvery episodes by a background thread, keeping
+    # the last checkpointKeep (None keeps them all). With resume, training
+    # restarts from the latest checkpoint in checkpointDir, if there is one.
+    # Set checkpointEvery to 0 to disable them.
+    checkpointDir = "./checkpoints"
+    checkpointEvery = 10
+    checkpointKeep = 3
+    resume = False
+
+    # Record every step (positions, actions, rewards and done flags) into
+    # .npz shards under recordDir, to train from them later with offline.py.
+    # None disables the recording.
+    recordDir = None
+
+    env = gym.make("WarehouseEnv-v0", agent1_pos=(2, 3), agent2_pos=(7, 6), goal_pos=(4, 8), max_steps = steps, fast_step=True, obs_mode="state")
     agent_view = False
 
+    if recordDir:
+        env.unwrapped.recorder = trajectory.TrajectoryRecorder(recordDir)
+
     writer = SummaryWriter("./logs")
 
     scores = []
@@ -51,63 +98,182 @@ if __name__ == "__main__":
         window.set_caption(env.mission + "\nEpisode: 1")
         window.show(block=False)
 
-    agent1 = model.DQN(
-       n_features=env.observation_space.n,
-       n_actions=env.action_space.n - 1,
-       lr=1e-3,
-       reward_decay=0.99,
-       epsilon=1.0,
-       eps_dec=1e-5,
-       eps_min=1e-2)
-
-    agent2 = model.DQN(
-        n_features=env.observation_space.n,
-        n_actions=env.action_space.n - 1,
-        lr=1e-3,
-        reward_decay=0.99,
-        epsilon=1.0,
-        eps_dec=1e-5,
-        eps_min=1e-2)
-
-    for i in range(episodes):
+    if replayDir and prioritizedReplay:
+        raise ValueError("The memory-mapped replay samples uniformly: set prioritizedReplay = False with replayDir")
+    memoryType = replay.PrioritizedReplayBuffer if prioritizedReplay else replay.ReplayBuffer
+
+    def makeMemory(n_features, name):
+        if not replayCapacity:
+            return None
+        if replayDir:
+            # The -1/0/1 observations fit in int8 columns
+            return replay.MemmapReplayBuffer(replayCapacity, n_features, os.path.join(replayDir, name),
+                                             state_dtype=np.int8)
+        return memoryType(replayCapacity, n_features)
+
+    if sharedLearner:
+        learner = model.MultiAgentDQN(
+            n_agents=2,
+            n_features=env.observation_space.n,
+            n_actions=env.action_space.n - 1,
+            lr=1e-3,
+            reward_decay=0.99,
+            epsilon=1.0,
+            eps_dec=1e-5,
+            eps_min=1e-2,
+            memory=makeMemory(env.observation_space.n + 2, "learner"),
+            batch_size=batchSize,
+            learn_every=learnEvery,
+            target_update_every=targetUpdateEvery)
+        agent1 = agent2 = learner
+    elif tabularLearner:
+        agent1 = tabular.TabularQ(
+            n_features=env.observation_space.n,
+            n_actions=env.action_space.n - 1,
+            lr=0.1,
+            reward_decay=0.99,
+            epsilon=1.0,
+            eps_dec=1e-5,
+            eps_min=1e-2)
+
+        agent2 = tabular.TabularQ(
+            n_features=env.observation_space.n,
+            n_actions=env.action_space.n - 1,
+            lr=0.1,
+            reward_decay=0.99,
+            epsilon=1.0,
+            eps_dec=1e-5,
+            eps_min=1e-2)
+    else:
+        agent1 = model.DQN(
+           n_features=env.observation_space.n,
+           n_actions=env.action_space.n - 1,
+           lr=1e-3,
+           reward_decay=0.99,
+           epsilon=1.0,
+           eps_dec=1e-5,
+           eps_min=1e-2,
+           memory=makeMemory(env.observation_space.n, "agent1"),
+           batch_size=batchSize,
+           learn_every=learnEvery,
+           target_update_every=targetUpdateEvery)
+
+        agent2 = model.DQN(
+            n_features=env.observation_space.n,
+            n_actions=env.action_space.n - 1,
+            lr=1e-3,
+            reward_decay=0.99,
+            epsilon=1.0,
+            eps_dec=1e-5,
+            eps_min=1e-2,
+            memory=makeMemory(env.observation_space.n, "agent2"),
+            batch_size=batchSize,
+            learn_every=learnEvery,
+            target_update_every=targetUpdateEvery)
+
+    # Time spent per phase of the loop, written to TensorBoard every episode
+    timer = PhaseTimer(("act", "env", "obs", "learn", "render", "ui"))
+    learners = [agent1] if agent1 is agent2 else [agent1, agent2]
+
+    checkpointer = None
+    if checkpointEvery or resume:
+        checkpointer = checkpoint.Checkpointer(checkpointDir, keep=checkpointKeep)
+    start = 0
+
+    if resume:
+        state = checkpointer.load()
+        if state is not None:
+            agent1.load_checkpoint_state(state["agent1"])
+            if not sharedLearner:
+                agent2.load_checkpoint_state(state["agent2"])
+            checkpoint.set_rng_state(state["rng"], env)
+            scores, eps1_history, eps2_history, losses = state["history"]
+            start = state["episode"]
+            print("Resuming from", checkpointer.latest(), "at episode", start + 1)
+
+    for i in range(start, episodes):
         print("Episode:", i + 1)
+        timer.reset()
+        updates = sum(agent.n_updates for agent in learners)
         score = 0
         done1 = False
         done2 = False
         reward1 = 0
         reward2 = 0
 
+        # In state mode the observations are float32 arrays that torch can
+        # use without copying
         obs = env.reset()
-        state1 = observationToState(obs["grid1"])
-        state2 = observationToState(obs["grid2"])
+        timer.lap("env")
+        state1 = obs["state1"]
+        state2 = obs["state2"]
+        timer.lap("obs")
 
         if enableUI:
             window.show_img(env.get_frame(agent_pov=agent_view))
             sleep(0.1)
+            timer.lap("ui")
 
         loss_ep = 0
         step = 0
 
         for j in range(steps):
-            if not done1:
-                action1 = agent1.choose_action(t.FloatTensor(state1).unsqueeze(0))
-                obs1_, reward1_, done1, truncated1, u1 = env.stepN(action1, 1, reward1)
-                state1_ = observationToState(obs1_["grid1"])
-                loss1 = agent1.learn(state1, action1, reward1_, state1_)
-                state1 = state1_
-                reward1 = reward1_
-            if not done2:
-                action2 = agent2.choose_action(t.FloatTensor(state2).unsqueeze(0))
-                obs2_, reward2_, done2, truncated2, u2 = env.stepN(action2, 2, reward2)
-                state2_ = observationToState(obs2_["grid2"])
-                loss2 = agent2.learn(state2, action2, reward2_, state2_)
-                state2 = state2_
-                reward2 = reward2_
+            # Both robots act in one joint step, which advances the episode
+            # clock once per tick; the ones at the goal stay in place
+            active = [not done1, not done2]
+            if sharedLearner:
+                # Observations are copied out of the env buffers by np.stack
+                agents = np.flatnonzero(active)
+                states = np.stack([(state1, state2)[k] for k in agents])
+                timer.lap("obs")
+                actions = learner.choose_actions(states, agents)
+                timer.lap("act")
+                jointActions = np.full(2, env.actions.stay)
+                jointActions[agents] = actions
+                obs_, rewards_, dones_, truncated, u = env.step_all(jointActions, active)
+                timer.lap("env")
+                timer.count("env_steps", len(agents))
+                state1, state2 = obs_["state1"], obs_["state2"]
+                if active[0]:
+                    reward1, done1 = rewards_.item(0), dones_.item(0)
+                if active[1]:
+                    reward2, done2 = rewards_.item(1), dones_.item(1)
+                states_ = np.stack([(state1, state2)[k] for k in agents])
+                rewards = rewards_[agents]
+                dones = dones_[agents]
+                timer.lap("obs")
+                loss1 = learner.learn(states, actions, rewards, states_, dones, agents)
+                loss2 = 0
+                timer.lap("learn")
+            else:
+                action1 = action2 = env.actions.stay
+                if active[0]:
+                    action1 = agent1.choose_action(t.from_numpy(state1).unsqueeze(0))
+                if active[1]:
+                    action2 = agent2.choose_action(t.from_numpy(state2).unsqueeze(0))
+                timer.lap("act")
+                obs_, rewards_, dones_, truncated, u = env.step_all([action1, action2], active)
+                timer.lap("env")
+                timer.count("env_steps", sum(active))
+                state1_, state2_ = obs_["state1"], obs_["state2"]
+                timer.lap("obs")
+                if active[0]:
+                    reward1, done1 = rewards_.item(0), dones_.item(0)
+                    loss1 = agent1.learn(state1, action1, reward1, state1_, done1)
+                    state1 = state1_
+                if active[1]:
+                    reward2, done2 = rewards_.item(1), dones_.item(1)
+                    loss2 = agent2.learn(state2, action2, reward2, state2_, done2)
+                    state2 = state2_
+                timer.lap("learn")
 
+            timer.lap()
             env.render()
+            timer.lap("render")
             if enableUI:
                 window.set_caption(env.mission + "\nEpisode: " + str(i + 1) + "    Actions: " + str(j) + "    Reward1: " + str(reward1) + "    Reward2: " + str(reward2))
                 window.show_img(env.get_frame(agent_pov=agent_view))
+                timer.lap("ui")
 
             loss_ep += loss1 + loss2
             loss1 = 0
@@ -123,13 +289,17 @@ if __name__ == "__main__":
                     window.set_caption(env.mission + "\nEpisode: " + str(i + 1) + "    Actions: " + str(j) + "    Combined reward: " + str(score))
                     window.show_img(env.get_frame(agent_pov=agent_view))
                     sleep(0.5)
+                    timer.lap("ui")
 
                 break
-            elif truncated1 or truncated2:
+            elif truncated:
                 print("> Truncated")
                 break
 
-            if enableUI: sleep(0.01)
+            timer.lap()
+            if enableUI:
+                sleep(0.01)
+                timer.lap("ui")
 
         loss_ep /= step
         scores.append(score)
@@ -141,7 +311,27 @@ if __name__ == "__main__":
         writer.add_scalar("epsilon2", agent2.epsilon, i)
         writer.add_scalar("loss_ep", loss_ep, i)
 
+        timer.count("updates", sum(agent.n_updates for agent in learners) - updates)
+        print(">", PhaseTimer.format(timer.write(writer, i)))
+
+        if checkpointEvery and (i + 1) % checkpointEvery == 0:
+            checkpointer.save({"episode": i + 1,
+                               "agent1": agent1.checkpoint_state(),
+                               "agent2": agent2.checkpoint_state(),
+                               "rng": checkpoint.rng_state(env),
+                               "history": (scores, eps1_history, eps2_history, losses)}, i + 1)
+
+    if checkpointer is not None:
+        checkpointer.close()
+    if recordDir:
+        env.unwrapped.recorder.close()
+    for agent in learners:
+        mem = getattr(agent, "memory", None)
+        if mem is not None:
+            mem.close()
+
     agent1.save_model("./saved_models")
-    agent2.save_model("./saved_models")
+    if not sharedLearner:
+        agent2.save_model("./saved_models")
 
     writer.close()
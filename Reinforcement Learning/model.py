@@ -1,11 +1,14 @@
 import torch as t
 import torch.nn as nn
 import numpy as np
-from torch.nn.functional import fractional_max_pool2d_with_indices
+from torch.nn.functional import fractional_max_pool2d_with_indices, mse_loss
 import torch.optim as optim
 import os
 import time
 
+from checkpoint import unique_path
+from replay import ReplayBuffer
+
 
 class FeedForwardNN(nn.Module):
     def __init__(self, n_features, n_actions) -> None:
@@ -21,10 +24,40 @@ class FeedForwardNN(nn.Module):
 
     def forward(self, observation: np.ndarray):
         if isinstance(observation, np.ndarray):
-            observation = t.FloatTensor(observation)
+            observation = t.as_tensor(observation, dtype=t.float32)
         return self.net(observation)
 
 
+class MultiHeadNN(nn.Module):
+    """
+    Shared hidden layers with one output head per agent. The input is the
+    observation followed by a one-hot agent ID, which selects the head.
+    """
+    def __init__(self, n_features, n_agents, n_actions) -> None:
+        super().__init__()
+        self.n_features = n_features
+        self.n_agents = n_agents
+        self.n_actions = n_actions
+
+        self.body = nn.Sequential(
+            nn.Linear(n_features, 64),
+            nn.ReLU(),
+            nn.Linear(64, 64),
+            nn.ReLU()
+        )
+        self.heads = nn.Linear(64, n_agents * n_actions)
+
+    def forward(self, observation: t.Tensor):
+        if isinstance(observation, np.ndarray):
+            observation = t.as_tensor(observation, dtype=t.float32)
+        x = observation.reshape(-1, self.n_features + self.n_agents)
+        obs, agent_id = x[:, :self.n_features], x[:, self.n_features:]
+
+        q = self.heads(self.body(obs)).view(-1, self.n_agents, self.n_actions)
+        q = (q * agent_id.unsqueeze(2)).sum(dim=1)
+        return q.reshape(observation.shape[:-1] + (self.n_actions,))
+
+
 class DQN(nn.Module):
     def __init__(self,
                  n_features,
@@ -33,7 +66,11 @@ class DQN(nn.Module):
                  reward_decay: float,
                  epsilon: float,
                  eps_dec: float,
-                 eps_min: float) -> None:
+                 eps_min: float,
+                 memory: ReplayBuffer = None,
+                 batch_size: int = 64,
+                 learn_every: int = 1,
+                 target_update_every: int = 100) -> None:
         super().__init__()
         # member variables
         self.n_features = n_features
@@ -44,15 +81,34 @@ class DQN(nn.Module):
         self.eps_min = eps_min
         self.epsilon = epsilon
 
+        # experience replay, without a memory every transition is learned
+        # from once, as it arrives
+        self.memory = memory
+        self.batch_size = batch_size
+        self.learn_every = learn_every
+        self.learn_step = 0
+        # number of gradient steps taken
+        self.n_updates = 0
+
         # neural network
-        self.net = FeedForwardNN(n_features, n_actions)
+        self.net = self._make_net()
+
+        # target network the minibatch updates bootstrap from, a copy of
+        # net refreshed every target_update_every updates; it is not trained
+        self.target_update_every = target_update_every
+        self.target_net = self._make_net()
+        self.target_net.requires_grad_(False)
+        self.sync_target()
 
         # optimizer, loss function and device
-        self.optimizer = optim.Adam(self.parameters(), lr=self.lr)
+        self.optimizer = optim.Adam(self.net.parameters(), lr=self.lr)
         self.device = t.device("cuda:0" if t.cuda.is_available() else "cpu")
         self.to(self.device)
         self.lossfunc = nn.MSELoss()
 
+    def _make_net(self) -> nn.Module:
+        return FeedForwardNN(self.n_features, self.n_actions)
+
     def forward(self, state: t.Tensor) -> t.Tensor:
         state = state.to(self.device)
         return self.net(state)
@@ -67,28 +123,107 @@ class DQN(nn.Module):
 
         return action
 
-    def learn(self, state, action, reward, state_):
+    def learn(self, state, action, reward, state_, done=False):
+        if self.memory is not None:
+            return self._learn_from_memory(state, action, reward, state_, done)
+
         self.optimizer.zero_grad()
-        states = t.FloatTensor(state).to(self.device)
+        # as_tensor shares the memory of float32 arrays instead of copying
+        states = t.as_tensor(state, dtype=t.float32, device=self.device)
         actions = t.tensor(action).to(self.device)
         rewards = t.tensor(reward, dtype=t.float32).to(self.device)
-        states_ = t.FloatTensor(state_).to(self.device)
+        states_ = t.as_tensor(state_, dtype=t.float32, device=self.device)
 
         q_pred = self.forward(states)[actions]
 
-        q_target = rewards+self.gamma * self.forward(states_).max()
+        q_target = rewards+self.gamma * self.forward(states_).max() * (1 - done)
 
         loss = self.lossfunc(q_pred, q_target)
         loss.backward()
         self.optimizer.step()
+        self.n_updates += 1
         self._decrement_epsilon()
         return loss.item()
 
+    def _learn_from_memory(self, state, action, reward, state_, done):
+        self.memory.store(state, action, reward, state_, done)
+        self._decrement_epsilon()
+
+        self.learn_step += 1
+        if len(self.memory) < self.batch_size or self.learn_step % self.learn_every:
+            return 0.0
+
+        idx = self.memory.sample_idx(self.batch_size)
+        loss, td_errors = self._update(*self.memory.gather(idx),
+                                       weights=self.memory.weights(idx))
+        self.memory.update_priorities(idx, td_errors)
+        return loss
+
+    def learn_batch(self, states, actions, rewards, states_, dones, weights=None):
+        """
+        One SGD step on a minibatch of transitions given as arrays, the
+        next states being evaluated by the target network. weights are
+        optional importance-sampling weights of the transitions
+        """
+        return self._update(states, actions, rewards, states_, dones, weights)[0]
+
+    def _update(self, states, actions, rewards, states_, dones, weights=None):
+        self.optimizer.zero_grad()
+        states = t.as_tensor(states, dtype=t.float32, device=self.device)
+        actions = t.as_tensor(actions, dtype=t.int64, device=self.device)
+        rewards = t.as_tensor(rewards, dtype=t.float32, device=self.device)
+        states_ = t.as_tensor(states_, dtype=t.float32, device=self.device)
+        dones = t.as_tensor(dones, dtype=t.float32, device=self.device)
+
+        q_pred = self.forward(states).gather(1, actions.unsqueeze(1)).squeeze(1)
+        with t.no_grad():
+            q_next = self.target_net(states_).max(dim=1).values
+
+        q_target = rewards + self.gamma * q_next * (1 - dones)
+
+        if weights is None:
+            loss = self.lossfunc(q_pred, q_target)
+        else:
+            weights = t.as_tensor(weights, dtype=t.float32, device=self.device)
+            loss = (weights * mse_loss(q_pred, q_target, reduction="none")).mean()
+        loss.backward()
+        self.optimizer.step()
+        self.n_updates += 1
+        if self.n_updates % self.target_update_every == 0:
+            self.sync_target()
+
+        td_errors = (q_target - q_pred).detach().cpu().numpy()
+        return loss.item(), td_errors
+
+    def sync_target(self):
+        self.target_net.load_state_dict(self.net.state_dict())
+
     def _decrement_epsilon(self):
         self.epsilon = self.epsilon-self.eps_dec\
             if self.epsilon > self.eps_min else self.eps_min
 
-    def save_model(self, dir: str):
+    def checkpoint_state(self) -> dict:
+        """
+        Everything needed to resume training: network, optimizer state,
+        epsilon and step counters. The replay memory is not included
+        """
+        return {"net": self.net.state_dict(),
+                "target_net": self.target_net.state_dict(),
+                "optimizer": self.optimizer.state_dict(),
+                "epsilon": self.epsilon,
+                "learn_step": self.learn_step,
+                "n_updates": self.n_updates}
+
+    def load_checkpoint_state(self, state: dict):
+        self.net.load_state_dict(state["net"])
+        # Checkpoints written before the target network restart it from net
+        self.target_net.load_state_dict(state.get("target_net", state["net"]))
+        self.optimizer.load_state_dict(state["optimizer"])
+        self.epsilon = state["epsilon"]
+        self.learn_step = state["learn_step"]
+        self.n_updates = state["n_updates"]
+
+    def save_model(self, dir: str, name: str = "DQN"):
         if not os.path.exists(dir):
             os.makedirs(dir)
         save_time = "{}-{}-{} {}-{}-{}".format(time.localtime()[0],
@@ -97,5 +232,102 @@ class DQN(nn.Module):
                                                time.localtime()[3],
                                                time.localtime()[4],
                                                time.localtime()[5], )
-        t.save(self.net.state_dict(), os.path.join(
-            dir, "DQN {}.pth".format(save_time)))
+        # Models saved within the same second get a numbered suffix
+        path = unique_path(dir, "{} {}".format(name, save_time), ".pth")
+        t.save(self.net.state_dict(), path)
+        return path
+
+    def load_model(self, path: str):
+        self.net.load_state_dict(t.load(path, map_location=self.device))
+        self.sync_target()
+
+
+class MultiAgentDQN(DQN):
+    """
+    One learner for any number of agents. Each agent's observation is
+    extended with a one-hot agent ID, which either feeds one shared network
+    or, with per_agent_heads, selects the agent's output head on top of
+    shared hidden layers. Action selection and learning take the
+    observations of several agents at once, so a step costs one batched
+    forward/backward pass whatever the number of agents.
+
+    A replay memory, if given, stores the observations with their agent ID,
+    its n_features must be n_features + n_agents.
+    """
+    def __init__(self,
+                 n_agents: int,
+                 n_features,
+                 n_actions,
+                 lr: float,
+                 reward_decay: float,
+                 epsilon: float,
+                 eps_dec: float,
+                 eps_min: float,
+                 per_agent_heads: bool = False,
+                 memory: ReplayBuffer = None,
+                 batch_size: int = 64,
+                 learn_every: int = 1,
+                 target_update_every: int = 100) -> None:
+        self.n_agents = n_agents
+        self.n_obs_features = n_features
+        self.per_agent_heads = per_agent_heads
+        super().__init__(n_features + n_agents, n_actions, lr, reward_decay,
+                         epsilon, eps_dec, eps_min, memory, batch_size, learn_every,
+                         target_update_every)
+        self.agent_ids = np.eye(n_agents, dtype=np.float32)
+
+    def _make_net(self) -> nn.Module:
+        if self.per_agent_heads:
+            return MultiHeadNN(self.n_obs_features, self.n_agents, self.n_actions)
+        return FeedForwardNN(self.n_features, self.n_actions)
+
+    def with_ids(self, states, agents=None) -> np.ndarray:
+        """
+        Append the one-hot ID of each agent to its observation. agents
+        lists the agent index of every row, by default one row per agent
+        """
+        if agents is None:
+            agents = np.arange(self.n_agents)
+        states = np.asarray(states, dtype=np.float32).reshape(len(agents), -1)
+        return np.concatenate((states, self.agent_ids[agents]), axis=1)
+
+    def choose_actions(self, states, agents=None) -> np.ndarray:
+        """
+        Epsilon-greedy actions for a batch of agents, from a single forward
+        pass over the agents that act greedily
+        """
+        x = self.with_ids(states, agents)
+        actions = np.random.randint(self.n_actions, size=len(x))
+        greedy = np.random.random(len(x)) > self.epsilon
+        if greedy.any():
+            with t.no_grad():
+                q = self.forward(t.as_tensor(x[greedy]))
+            actions[greedy] = q.argmax(dim=1).cpu().numpy()
+
+        return actions
+
+    def learn(self, states, actions, rewards, states_, dones=None, agents=None):
+        """
+        Learn from one transition per agent listed in agents (all agents by
+        default) with a single update, or store them and update from the
+        memory every learn_every calls
+        """
+        x = self.with_ids(states, agents)
+        x_ = self.with_ids(states_, agents)
+        if dones is None:
+            dones = np.zeros(len(x), dtype=np.float32)
+        self._decrement_epsilon()
+
+        if self.memory is None:
+            return self.learn_batch(x, actions, rewards, x_, dones)
+
+        self.memory.store_batch(x, actions, rewards, x_, dones)
+        self.learn_step += 1
+        if len(self.memory) < self.batch_size or self.learn_step % self.learn_every:
+            return 0.0
+
+        idx = self.memory.sample_idx(self.batch_size)
+        loss, td_errors = self._update(*self.memory.gather(idx),
+                                       weights=self.memory.weights(idx))
+        self.memory.update_priorities(idx, td_errors)
+        return loss
@@ -0,0 +1,63 @@
+"""
+Offline training: a DQN learns from trajectories recorded with
+trajectory.TrajectoryRecorder (see recordDir in main.py), possibly on other
+machines, without running the environment. The shards are read and turned
+into transitions one at a time while the learner trains on the previous
+one.
+"""
+from __future__ import annotations
+
+import warnings
+
+import gymnasium as gym
+from tensorboardX import SummaryWriter
+
+import warehouse, model, trajectory
+
+
+if __name__ == "__main__":
+    warnings.filterwarnings("ignore")
+
+    # Directory of the recorded shards
+    dataDir = "./trajectories"
+    epochs = 10
+    batchSize = 512
+    # Train on the steps of one robot (1 or 2), None for both
+    agentN = None
+
+    env = gym.make("WarehouseEnv-v0")
+    n_features = env.observation_space.n
+    n_actions = env.action_space.n - 1
+
+    learner = model.DQN(
+        n_features=n_features,
+        n_actions=n_actions,
+        lr=1e-3,
+        reward_decay=0.99,
+        epsilon=0.0,
+        eps_dec=0.0,
+        eps_min=0.0)
+
+    dataset = trajectory.TrajectoryDataset(dataDir)
+    print(f"{len(dataset.paths)} shards, {len(dataset)} steps")
+
+    writer = SummaryWriter("./logs")
+    update = 0
+
+    for epoch in range(epochs):
+        loss_epoch = 0
+        n = 0
+        for batch in dataset.batches(batchSize, agentN, seed=epoch):
+            loss = learner.learn_batch(*batch)
+            loss_epoch += loss
+            n += 1
+            update += 1
+            if update % 100 == 0:
+                writer.add_scalar("loss", loss, update)
+
+        loss_epoch /= max(n, 1)
+        writer.add_scalar("loss_epoch", loss_epoch, epoch)
+        print(f"Epoch {epoch + 1}: {n} updates, loss = {loss_epoch:.4f}")
+
+    learner.save_model("./saved_models")
+    writer.close()
@@ -0,0 +1,226 @@
+"""
+Exact planning on a compiled warehouse layout. Every agent of the joint
+state is either on one of the free cells of the layout or in an absorbing
+"done" state it enters when it moves onto the goal, collecting a reward of
+1. The Bellman backups below are a broadcast over all joint states and
+joint actions at once.
+
+With agent_collisions, as in the env by default, agents block each other
+by the rules of layout.resolve_moves, applied once to every joint state
+and joint action to build the joint transition table. Agents that are
+done leave the grid, and moves onto the goal are never blocked, so the
+rewards stay the sum of the single-agent ones. Without collisions the
+joint transition is the product of the single-agent tables.
+
+With gamma < 1 the greedy policy takes every agent to the goal along a
+shortest path, which is also optimal for the time-decaying reward of
+WarehouseEnv.
+"""
+from __future__ import annotations
+
+import numpy as np
+
+from warehouse.envs.layout import Layout, resolve_moves
+
+
+class JointMDP:
+    """
+    Single-agent tables of a layout restricted to its free cells, plus the
+    done state (index n_cells) shared by all agents. With agent_collisions
+    the joint successors are also tabulated, as flat joint state indices
+    """
+
+    def __init__(self, layout: Layout, n_agents: int = 2, agent_collisions: bool = True) -> None:
+        self.layout = layout
+        self.n_agents = n_agents
+        self.n_actions = layout.n_actions
+        self.agent_collisions = agent_collisions
+
+        cells = layout.free_cells
+        self.cells = cells
+        self.n_cells = len(cells)
+        self.done = self.n_cells
+
+        # layout cell -> row of the tables, -1 for the blocked cells
+        self.index = np.full(layout.n_cells, -1, dtype=np.int64)
+        self.index[cells] = np.arange(self.n_cells)
+
+        nxt = self.index[layout.next_cell[cells]]
+        hits_goal = layout.hits_goal[cells]
+        self.next_state = np.full((self.n_cells + 1, self.n_actions), self.done, dtype=np.int64)
+        self.next_state[:-1] = np.where(hits_goal, self.done, nxt)
+        self.reward = np.zeros((self.n_cells + 1, self.n_actions), dtype=np.float64)
+        self.reward[:-1] = hits_goal
+
+        self.shape = (self.n_cells + 1,) * n_agents
+        self.n_joint_actions = self.n_actions ** n_agents
+
+        # Agent k varies along axis k of the states and axis n_agents + k of
+        # the actions, so that next_state[..] broadcasts to the full
+        # (states..., actions...) array of joint successors
+        n = n_agents
+        self._next = []
+        self._reward = np.zeros((1,) * 2 * n)
+        for k in range(n):
+            shape = [1] * 2 * n
+            shape[k] = self.n_cells + 1
+            shape[n + k] = self.n_actions
+            self._next.append(self.next_state.reshape(shape))
+            self._reward = self._reward + self.reward.reshape(shape)
+
+        # (states..., actions...) flat index of the joint successor
+        self._joint_next = self._resolve_collisions() if agent_collisions else None
+
+    def _resolve_collisions(self, chunk: int = 4096) -> np.ndarray:
+        """
+        Joint successor of every joint state and joint action, the moves
+        going through layout.resolve_moves. Each (state, action) pair is
+        one instance of a shared occupancy, as in WarehouseVecEnv, with an
+        extra shared cell holding the agents that are done
+        """
+
+        layout = self.layout
+        n = self.n_agents
+        stride = layout.n_cells + 1
+        shared = np.append(layout.goal.ravel(), True)
+
+        # Layout cell and target cell of every state and action
+        state_cell = np.append(self.cells, layout.n_cells)
+        target_cell = np.full((self.n_cells + 1, self.n_actions), layout.n_cells, dtype=np.int64)
+        target_cell[:-1] = layout.next_cell[self.cells]
+
+        dims = self.shape + (self.n_actions,) * n
+        total = int(np.prod(dims))
+        joint_next = np.empty(total, dtype=np.int64)
+        for start in range(0, total, chunk):
+            index = np.arange(start, min(start + chunk, total))
+            coords = np.unravel_index(index, dims)
+            states = np.stack(coords[:n], axis=1)
+            actions = np.stack(coords[n:], axis=1)
+
+            base = np.arange(len(index))[:, None] * stride
+            cells = (base + state_cell[states]).ravel()
+            targets = (base + target_cell[states, actions]).ravel()
+            instance_shared = np.tile(shared, len(index))
+
+            # Agents are numbered in order across the instances, so the
+            # lowest index of an instance still wins. Where agents overlap,
+            # the first one holds the cell
+            occupancy = np.zeros(len(index) * stride, dtype=np.int64)
+            held = np.flatnonzero(~instance_shared[cells])[::-1]
+            occupancy[cells[held]] = held + 1
+            moved = resolve_moves(occupancy, cells, targets, instance_shared)
+
+            blocked = (moved != targets).reshape(states.shape)
+            next_states = np.where(blocked, states, self.next_state[states, actions])
+            joint_next[index] = np.ravel_multi_index(tuple(next_states.T), self.shape)
+
+        return joint_next.reshape(dims)
+
+    def state(self, positions) -> tuple:
+        """
+        Joint state of a sequence of agent positions (x, y), None for an
+        agent that already reached the goal
+        """
+
+        width = self.layout.width
+        state = []
+        for pos in positions:
+            if pos is None:
+                state.append(self.done)
+                continue
+            s = self.index[pos[1] * width + pos[0]]
+            if s < 0:
+                raise ValueError(f"Agent position {tuple(pos)} is not a free cell")
+            state.append(int(s))
+        return tuple(state)
+
+    def q_values(self, values: np.ndarray, gamma: float) -> np.ndarray:
+        """
+        (states..., actions...) array of the one-step lookahead of values
+        """
+
+        if self._joint_next is not None:
+            return self._reward + gamma * values.ravel()[self._joint_next]
+        return self._reward + gamma * values[tuple(self._next)]
+
+    def greedy(self, q: np.ndarray) -> np.ndarray:
+        """
+        (states..., n_agents) array of the best joint action of every state
+        """
+
+        flat = q.reshape(self.shape + (self.n_joint_actions,)).argmax(axis=-1)
+        return np.stack(np.unravel_index(flat, (self.n_actions,) * self.n_agents), axis=-1)
+
+    def policy_values(self, values: np.ndarray, policy: np.ndarray, gamma: float) -> np.ndarray:
+        """
+        One backup of values under a fixed joint policy
+        """
+
+        n = self.n_agents
+        grids = np.indices(self.shape, sparse=True)
+        rewards = sum(self.reward[grids[k], policy[..., k]] for k in range(n))
+        if self._joint_next is not None:
+            actions = np.ravel_multi_index(np.moveaxis(policy, -1, 0), (self.n_actions,) * n)
+            joint_next = self._joint_next.reshape(self.shape + (-1,))
+            next_states = np.take_along_axis(joint_next, actions[..., None], axis=-1)[..., 0]
+            return rewards + gamma * values.ravel()[next_states]
+        next_states = tuple(self.next_state[grids[k], policy[..., k]] for k in range(n))
+        return rewards + gamma * values[next_states]
+
+
+def value_iteration(layout: Layout, n_agents: int = 2, gamma: float = 0.99,
+                    tol: float = 1e-8, max_iters: int = 10000, agent_collisions: bool = True):
+    """
+    Optimal values and greedy joint policy of the layout. Returns the
+    JointMDP, the values indexed by joint state and the (states...,
+    n_agents) policy.
+    """
+
+    mdp = JointMDP(layout, n_agents, agent_collisions)
+    values = np.zeros(mdp.shape, dtype=np.float64)
+
+    for _ in range(max_iters):
+        q = mdp.q_values(values, gamma)
+        new_values = q.reshape(mdp.shape + (-1,)).max(axis=-1)
+        delta = np.abs(new_values - values).max()
+        values = new_values
+        if delta < tol:
+            break
+
+    return mdp, values, mdp.greedy(mdp.q_values(values, gamma))
+
+
+def policy_iteration(layout: Layout, n_agents: int = 2, gamma: float = 0.99,
+                     tol: float = 1e-8, max_iters: int = 100, agent_collisions: bool = True):
+    """
+    Same result as value_iteration, alternating an iterative evaluation of
+    the current policy with a greedy improvement until the policy is stable
+    """
+
+    mdp = JointMDP(layout, n_agents, agent_collisions)
+    values = np.zeros(mdp.shape, dtype=np.float64)
+    policy = np.zeros(mdp.shape + (n_agents,), dtype=np.int64)
+
+    for _ in range(max_iters):
+        while True:
+            new_values = mdp.policy_values(values, policy, gamma)
+            delta = np.abs(new_values - values).max()
+            values = new_values
+            if delta < tol:
+                break
+
+        q = mdp.q_values(values, gamma)
+        new_policy = mdp.greedy(q)
+        # Only switch actions that are strictly better, so ties cannot cycle
+        current = np.take_along_axis(
+            q.reshape(mdp.shape + (-1,)),
+            np.ravel_multi_index(np.moveaxis(policy, -1, 0), (mdp.n_actions,) * n_agents)[..., None],
+            axis=-1)[..., 0]
+        best = q.reshape(mdp.shape + (-1,)).max(axis=-1)
+        improve = best > current + tol
+        if not improve.any():
+            break
+        policy = np.where(improve[..., None], new_policy, policy)
+
+    return mdp, values, policy
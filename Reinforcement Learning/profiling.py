@@ -0,0 +1,60 @@
+from collections import defaultdict
+from time import perf_counter
+
+
+class PhaseTimer:
+    """
+    Wall-clock breakdown of a loop into named phases. lap(phase) charges the
+    time since the previous lap to phase, so timing a phase costs a single
+    clock read; lap() without a phase leaves the time unattributed ("other").
+    Times and counters add up until reset, typically once per episode.
+    """
+
+    def __init__(self, phases=()) -> None:
+        self.phases = list(phases)
+        self.reset()
+
+    def reset(self) -> None:
+        self.totals = dict.fromkeys(self.phases, 0.0)
+        self.counters = defaultdict(int)
+        self.start = self._last = perf_counter()
+
+    def lap(self, phase: str = None) -> None:
+        now = perf_counter()
+        if phase is not None:
+            self.totals[phase] = self.totals.get(phase, 0.0) + now - self._last
+        self._last = now
+
+    def count(self, name: str, n: int = 1) -> None:
+        self.counters[name] += n
+
+    def summary(self) -> dict:
+        """
+        Elapsed time, fraction of it spent in each phase and rate per second
+        of each counter since the last reset
+        """
+
+        elapsed = max(perf_counter() - self.start, 1e-9)
+        fractions = {phase: total / elapsed for phase, total in self.totals.items()}
+        fractions["other"] = max(0.0, 1.0 - sum(fractions.values()))
+        rates = {name: n / elapsed for name, n in self.counters.items()}
+        return {"elapsed": elapsed, "fractions": fractions, "rates": rates}
+
+    def write(self, writer, step: int, prefix: str = "perf") -> dict:
+        """
+        Add the summary to a SummaryWriter as scalars and return it
+        """
+
+        summary = self.summary()
+        writer.add_scalar(f"{prefix}/elapsed", summary["elapsed"], step)
+        for name, rate in summary["rates"].items():
+            writer.add_scalar(f"{prefix}/{name}_per_sec", rate, step)
+        for phase, fraction in summary["fractions"].items():
+            writer.add_scalar(f"{prefix}/fraction_{phase}", fraction, step)
+        return summary
+
+    @staticmethod
+    def format(summary: dict) -> str:
+        rates = ", ".join(f"{name} = {rate:.0f}/s" for name, rate in summary["rates"].items())
+        fractions = ", ".join(f"{phase} {fraction:.0%}" for phase, fraction in summary["fractions"].items())
+        return f"{rates} | {fractions}"
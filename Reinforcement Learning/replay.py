@@ -0,0 +1,348 @@
+import json
+import multiprocessing as mp
+import os
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from warehouse.shm import attach, block_size
+
+
+class ReplayBuffer:
+    """
+    Fixed-capacity experience replay stored in preallocated NumPy ring
+    arrays. Once full, new transitions overwrite the oldest ones.
+    """
+
+    def __init__(self, capacity: int, n_features: int, state_dtype=np.float32) -> None:
+        assert capacity > 0
+        self.capacity = capacity
+        self.n_features = n_features
+
+        self.states = np.zeros((capacity, n_features), dtype=state_dtype)
+        self.actions = np.zeros(capacity, dtype=np.int64)
+        self.rewards = np.zeros(capacity, dtype=np.float32)
+        self.states_ = np.zeros((capacity, n_features), dtype=state_dtype)
+        self.dones = np.zeros(capacity, dtype=np.float32)
+
+        # Next slot to write and number of valid transitions
+        self.ptr = 0
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def store(self, state, action, reward, state_, done=False) -> int:
+        i = self.ptr
+        self.states[i] = state
+        self.actions[i] = action
+        self.rewards[i] = reward
+        self.states_[i] = state_
+        self.dones[i] = done
+
+        self.ptr = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+        return i
+
+    def store_batch(self, states, actions, rewards, states_, dones) -> np.ndarray:
+        n = len(actions)
+        assert n <= self.capacity
+        idx = (self.ptr + np.arange(n)) % self.capacity
+        self.states[idx] = states
+        self.actions[idx] = actions
+        self.rewards[idx] = rewards
+        self.states_[idx] = states_
+        self.dones[idx] = dones
+
+        self.ptr = (self.ptr + n) % self.capacity
+        self.size = min(self.size + n, self.capacity)
+        return idx
+
+    def sample_idx(self, batch_size: int) -> np.ndarray:
+        return np.random.randint(0, self.size, size=batch_size)
+
+    def gather(self, idx: np.ndarray):
+        return (self.states[idx], self.actions[idx], self.rewards[idx],
+                self.states_[idx], self.dones[idx])
+
+    def sample(self, batch_size: int):
+        """
+        Uniformly sample a minibatch, returned as (states, actions, rewards,
+        states_, dones) arrays gathered in one indexing call each
+        """
+
+        return self.gather(self.sample_idx(batch_size))
+
+    def weights(self, idx: np.ndarray):
+        """
+        Importance-sampling weights of sampled transitions, None when the
+        sampling is uniform
+        """
+
+        return None
+
+    def update_priorities(self, idx: np.ndarray, td_errors: np.ndarray) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class SumTree:
+    """
+    Array-based binary sum tree over a fixed number of leaves. Node k has
+    children 2k and 2k + 1, the root is node 1 and leaf i is node
+    n_leaves + i. Updates and lookups walk one level at a time for a whole
+    batch of indices.
+    """
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self.n_leaves = 1 << max(capacity - 1, 0).bit_length()
+        self.tree = np.zeros(2 * self.n_leaves, dtype=np.float64)
+
+    @property
+    def total(self) -> float:
+        return self.tree[1]
+
+    def get(self, idx: np.ndarray) -> np.ndarray:
+        return self.tree[idx + self.n_leaves]
+
+    def update(self, idx: np.ndarray, priorities: np.ndarray) -> None:
+        nodes = np.asarray(idx) + self.n_leaves
+        self.tree[nodes] = priorities
+        while nodes[0] > 1:
+            nodes = np.unique(nodes >> 1)
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+
+    def find(self, values: np.ndarray) -> np.ndarray:
+        """
+        Leaf index of each value, such that the prefix sum of the leaves
+        before it is <= value < the prefix sum including it
+        """
+
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(len(values), dtype=np.int64)
+        while nodes[0] < self.n_leaves:
+            left = self.tree[2 * nodes]
+            right = values >= left
+            values -= np.where(right, left, 0)
+            nodes = 2 * nodes + right
+        return np.minimum(nodes - self.n_leaves, self.capacity - 1)
+
+
+class PrioritizedReplayBuffer(ReplayBuffer):
+    """
+    Proportional prioritized replay: transition i is sampled with
+    probability p_i^alpha / sum_k p_k^alpha, where p_i is its last absolute
+    TD error. New transitions get the highest priority seen so far.
+    The bias is corrected with importance-sampling weights whose exponent
+    beta is annealed towards 1 on every sample.
+    """
+
+    def __init__(self, capacity: int, n_features: int, state_dtype=np.float32,
+                 alpha: float = 0.6, beta: float = 0.4, beta_increment: float = 1e-4,
+                 eps: float = 1e-6) -> None:
+        super().__init__(capacity, n_features, state_dtype)
+        self.alpha = alpha
+        self.beta = beta
+        self.beta_increment = beta_increment
+        self.eps = eps
+
+        self.tree = SumTree(capacity)
+        self.max_priority = 1.0
+
+    def store(self, state, action, reward, state_, done=False) -> int:
+        i = super().store(state, action, reward, state_, done)
+        self.tree.update(np.array([i]), self.max_priority ** self.alpha)
+        return i
+
+    def store_batch(self, states, actions, rewards, states_, dones) -> np.ndarray:
+        idx = super().store_batch(states, actions, rewards, states_, dones)
+        self.tree.update(idx, self.max_priority ** self.alpha)
+        return idx
+
+    def sample_idx(self, batch_size: int) -> np.ndarray:
+        # Stratified: one uniform draw in each of batch_size equal segments
+        segment = self.tree.total / batch_size
+        values = (np.arange(batch_size) + np.random.random(batch_size)) * segment
+        idx = self.tree.find(values)
+
+        self.beta = min(1.0, self.beta + self.beta_increment)
+        return np.minimum(idx, self.size - 1)
+
+    def weights(self, idx: np.ndarray) -> np.ndarray:
+        """
+        (N * P(i))^-beta, normalized by the largest weight of the batch
+        """
+
+        probs = self.tree.get(idx) / self.tree.total
+        weights = (self.size * probs) ** -self.beta
+        return (weights / weights.max()).astype(np.float32)
+
+    def update_priorities(self, idx: np.ndarray, td_errors: np.ndarray) -> None:
+        priorities = np.abs(td_errors) + self.eps
+        self.max_priority = max(self.max_priority, priorities.max())
+        self.tree.update(idx, priorities ** self.alpha)
+
+
+class SharedReplayBuffer(ReplayBuffer):
+    """
+    ReplayBuffer whose columns and counters live in one shared-memory block,
+    so that several processes can write to it and sample from it. Every
+    write and gather holds the buffer lock. The buffer can be handed to a
+    child process, which attaches to the same block by name.
+    """
+
+    def __init__(self, capacity: int, n_features: int, state_dtype=np.float32,
+                 lock=None, name: str = None) -> None:
+        assert capacity > 0
+        self.capacity = capacity
+        self.n_features = n_features
+        self.state_dtype = np.dtype(state_dtype)
+        self.lock = lock if lock is not None else mp.Lock()
+
+        columns = [("_counters", (2,), np.int64),
+                   ("states", (capacity, n_features), self.state_dtype),
+                   ("actions", (capacity,), np.int64),
+                   ("rewards", (capacity,), np.float32),
+                   ("states_", (capacity, n_features), self.state_dtype),
+                   ("dones", (capacity,), np.float32)]
+
+        # Child processes share the resource tracker of their parent, only
+        # the creating process unlinks the block
+        self.owner = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=block_size(columns))
+
+        for attr, array in attach(self.shm.buf, columns).items():
+            setattr(self, attr, array)
+
+    def __getstate__(self):
+        return (self.capacity, self.n_features, self.state_dtype, self.lock, self.shm.name)
+
+    def __setstate__(self, state):
+        capacity, n_features, state_dtype, lock, name = state
+        self.__init__(capacity, n_features, state_dtype, lock, name)
+
+    @property
+    def ptr(self) -> int:
+        return int(self._counters[0])
+
+    @ptr.setter
+    def ptr(self, value: int) -> None:
+        self._counters[0] = value
+
+    @property
+    def size(self) -> int:
+        return int(self._counters[1])
+
+    @size.setter
+    def size(self, value: int) -> None:
+        self._counters[1] = value
+
+    def store(self, state, action, reward, state_, done=False) -> int:
+        with self.lock:
+            return super().store(state, action, reward, state_, done)
+
+    def store_batch(self, states, actions, rewards, states_, dones) -> np.ndarray:
+        with self.lock:
+            return super().store_batch(states, actions, rewards, states_, dones)
+
+    def gather(self, idx: np.ndarray):
+        with self.lock:
+            return super().gather(idx)
+
+    def close(self) -> None:
+        """
+        Detach from the block, the creating process also frees it
+        """
+
+        for attr in ("_counters", "states", "actions", "rewards", "states_", "dones"):
+            delattr(self, attr)
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class MemmapReplayBuffer(ReplayBuffer):
+    """
+    ReplayBuffer whose columns are np.memmap files in a directory, for
+    capacities that do not fit in RAM. Only the pages touched by stores and
+    sampled gathers are loaded, and the OS page cache decides which of them
+    stay in memory. Sampled indices are sorted so that a batch gathers each
+    column in a single forward pass over the file.
+
+    Opening a directory that already holds a buffer of the same capacity,
+    features and dtypes reopens it with the transitions written up to the
+    last flush().
+    """
+
+    def __init__(self, capacity: int, n_features: int, dir: str, state_dtype=np.float32,
+                 action_dtype=np.int16) -> None:
+        assert capacity > 0
+        self.capacity = capacity
+        self.n_features = n_features
+        self.dir = dir
+
+        columns = {"states": ((capacity, n_features), np.dtype(state_dtype)),
+                   "actions": ((capacity,), np.dtype(action_dtype)),
+                   "rewards": ((capacity,), np.dtype(np.float32)),
+                   "states_": ((capacity, n_features), np.dtype(state_dtype)),
+                   "dones": ((capacity,), np.dtype(np.uint8))}
+        meta = {"capacity": int(capacity), "n_features": int(n_features),
+                "columns": {name: dtype.str for name, (_, dtype) in columns.items()}}
+
+        meta_path = os.path.join(dir, "meta.json")
+        reopen = os.path.exists(meta_path)
+        if reopen:
+            with open(meta_path) as f:
+                stored = json.load(f)
+            if stored != meta:
+                raise ValueError(f"Replay in {dir} has a different layout: {stored}")
+        else:
+            os.makedirs(dir, exist_ok=True)
+
+        mode = "r+" if reopen else "w+"
+        self._counters = np.memmap(os.path.join(dir, "counters.dat"), dtype=np.int64, mode=mode, shape=(2,))
+        for name, (shape, dtype) in columns.items():
+            setattr(self, name, np.memmap(os.path.join(dir, name + ".dat"), dtype=dtype, mode=mode, shape=shape))
+
+        if not reopen:
+            # Written last, a directory without it is not a complete buffer
+            with open(meta_path + ".tmp", "w") as f:
+                json.dump(meta, f)
+            os.replace(meta_path + ".tmp", meta_path)
+
+    @property
+    def ptr(self) -> int:
+        return int(self._counters[0])
+
+    @ptr.setter
+    def ptr(self, value: int) -> None:
+        self._counters[0] = value
+
+    @property
+    def size(self) -> int:
+        return int(self._counters[1])
+
+    @size.setter
+    def size(self, value: int) -> None:
+        self._counters[1] = value
+
+    def sample_idx(self, batch_size: int) -> np.ndarray:
+        return np.sort(super().sample_idx(batch_size))
+
+    def flush(self) -> None:
+        """
+        Write the columns to disk, then the counters, so a reopened buffer
+        never counts a transition whose data was not written
+        """
+
+        for attr in ("states", "actions", "rewards", "states_", "dones"):
+            getattr(self, attr).flush()
+        self._counters.flush()
+
+    def close(self) -> None:
+        self.flush()
+        for attr in ("_counters", "states", "actions", "rewards", "states_", "dones"):
+            delattr(self, attr)
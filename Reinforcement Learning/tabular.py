@@ -0,0 +1,123 @@
+import numpy as np
+import os
+import time
+
+from checkpoint import unique_path
+
+
+class TabularQ:
+    """
+    Q-learning on a dense table, a drop-in alternative to model.DQN for
+    observations whose cells only take the values -1, 0 and 1. A state is
+    indexed by its base-3 code, so a 3x3 view has 3^9 = 19683 rows.
+    """
+    def __init__(self,
+                 n_features,
+                 n_actions,
+                 lr: float,
+                 reward_decay: float,
+                 epsilon: float,
+                 eps_dec: float,
+                 eps_min: float) -> None:
+        # member variables
+        self.n_features = n_features
+        self.n_actions = n_actions
+        self.lr = lr
+        self.gamma = reward_decay
+        self.eps_dec = eps_dec
+        self.eps_min = eps_min
+        self.epsilon = epsilon
+        # number of learn / learn_batch calls
+        self.n_updates = 0
+
+        # Q-table, one row per base-3 state code
+        self.q_table = np.zeros((3 ** n_features, n_actions), dtype=np.float64)
+        self.powers = 3 ** np.arange(n_features, dtype=np.int64)
+
+    def state_code(self, states) -> np.ndarray:
+        """
+        Base-3 code of one state or of a batch of states (last axis)
+        """
+        digits = np.rint(np.asarray(states, dtype=np.float32)).astype(np.int64) + 1
+        return digits @ self.powers
+
+    def choose_action(self, state) -> int:
+        if np.random.random() > self.epsilon:
+            code = self.state_code(np.asarray(state).reshape(-1))
+            action = int(self.q_table[code].argmax())
+        else:
+            action = np.random.choice(self.n_actions)
+
+        return action
+
+    def choose_actions(self, states) -> np.ndarray:
+        """
+        Epsilon-greedy actions for a batch of states
+        """
+        codes = self.state_code(states)
+        actions = self.q_table[codes].argmax(axis=1)
+        explore = np.random.random(len(codes)) <= self.epsilon
+        actions[explore] = np.random.randint(self.n_actions, size=explore.sum())
+        return actions
+
+    def learn(self, state, action, reward, state_, done=False):
+        s = self.state_code(np.asarray(state).reshape(-1))
+        s_ = self.state_code(np.asarray(state_).reshape(-1))
+
+        q_target = reward + self.gamma * self.q_table[s_].max() * (1 - done)
+        td_error = q_target - self.q_table[s, action]
+        self.q_table[s, action] += self.lr * td_error
+        self.n_updates += 1
+
+        self._decrement_epsilon()
+        return float(td_error ** 2)
+
+    def learn_batch(self, states, actions, rewards, states_, dones):
+        """
+        One Q-learning update for every transition of a batch. Targets use
+        the table before the update; updates of the same entry add up.
+        Epsilon decays once per batch, as per learn call.
+        """
+        s = self.state_code(states)
+        s_ = self.state_code(states_)
+        actions = np.asarray(actions, dtype=np.int64)
+
+        q_target = (np.asarray(rewards)
+                    + self.gamma * self.q_table[s_].max(axis=1) * (1 - np.asarray(dones, dtype=np.float64)))
+        td_errors = q_target - self.q_table[s, actions]
+        np.add.at(self.q_table, (s, actions), self.lr * td_errors)
+        self.n_updates += 1
+
+        self._decrement_epsilon()
+        return float(np.mean(td_errors ** 2))
+
+    def _decrement_epsilon(self):
+        self.epsilon = self.epsilon-self.eps_dec\
+            if self.epsilon > self.eps_min else self.eps_min
+
+    def checkpoint_state(self) -> dict:
+        return {"q_table": self.q_table,
+                "epsilon": self.epsilon,
+                "n_updates": self.n_updates}
+
+    def load_checkpoint_state(self, state: dict):
+        self.q_table = np.array(state["q_table"], dtype=np.float64)
+        self.epsilon = state["epsilon"]
+        self.n_updates = state["n_updates"]
+
+    def save_model(self, dir: str, name: str = "TabularQ"):
+        if not os.path.exists(dir):
+            os.makedirs(dir)
+        save_time = "{}-{}-{} {}-{}-{}".format(time.localtime()[0],
+                                               time.localtime()[1],
+                                               time.localtime()[2],
+                                               time.localtime()[3],
+                                               time.localtime()[4],
+                                               time.localtime()[5], )
+        # Models saved within the same second get a numbered suffix
+        path = unique_path(dir, "{} {}".format(name, save_time), ".npy")
+        np.save(path, self.q_table)
+        return path
+
+    def load_model(self, path: str):
+        self.q_table = np.load(path)
@@ -0,0 +1,32 @@
+import glob
+
+import numpy as np
+from PIL import Image
+
+import export_video
+import trajectory
+from warehouse.envs import WarehouseEnv
+
+
+def test_render_recorded_matches_live_frames(tmp_path):
+    env = WarehouseEnv(render_mode="rgb_array", fast_step=True, obs_mode="state",
+                       n_agents=3, size=18, max_steps=15)
+    env.recorder = trajectory.TrajectoryRecorder(str(tmp_path / "rec"), prefix="r")
+    rng = np.random.default_rng(0)
+
+    # The last agent never acts, so it is in no recorded step
+    env.reset(seed=0)
+    frames = [env.get_frame(env.highlight, 8).copy()]
+    for _ in range(15):
+        env.step_all(rng.integers(0, 4, 3), [True, True, False])
+        frames.append(env.get_frame(env.highlight, 8).copy())
+    env.recorder.close()
+
+    out_dir = tmp_path / "out"
+    out_dir.mkdir()
+    [task] = export_video.recorded_tasks(str(tmp_path / "rec"), str(out_dir), "png", tile_size=8)
+    path, n_frames = export_video.render_recorded(task)
+
+    rendered = [np.array(Image.open(p)) for p in sorted(glob.glob(path + "/*.png"))]
+    assert n_frames == len(frames)
+    assert all((a == b).all() for a, b in zip(rendered, frames))
@@ -0,0 +1,107 @@
+import numpy as np
+
+from minigrid.core.world_object import Door, Goal, Wall
+from warehouse.envs.grid import ArrayGrid, Grid, _propagate_vis
+
+
+def random_grid(rng, width=7, height=7):
+    grid = Grid(width, height)
+    for x, y in rng.integers(0, (width, height), (12, 2)).tolist():
+        kind = rng.integers(4)
+        if kind == 0:
+            grid.set(x, y, Goal())
+        elif kind == 1:
+            grid.set(x, y, Door("yellow", is_open=bool(rng.integers(2))))
+        else:
+            grid.set(x, y, Wall())
+    return grid
+
+
+def propagate_vis_loop(see_through, agent_pos):
+    """
+    The cell by cell loop of minigrid's Grid.process_vis, as a reference
+    """
+
+    height, width = see_through.shape
+    mask = np.zeros(shape=(width, height), dtype=bool)
+    mask[agent_pos[0], agent_pos[1]] = True
+
+    for j in reversed(range(0, height)):
+        for i in range(0, width - 1):
+            if not mask[i, j] or not see_through[j, i]:
+                continue
+            mask[i + 1, j] = True
+            if j > 0:
+                mask[i + 1, j - 1] = True
+                mask[i, j - 1] = True
+
+        for i in reversed(range(1, width)):
+            if not mask[i, j] or not see_through[j, i]:
+                continue
+            mask[i - 1, j] = True
+            if j > 0:
+                mask[i - 1, j - 1] = True
+                mask[i, j - 1] = True
+
+    return mask
+
+
+def test_array_grid_matches_grid():
+    rng = np.random.default_rng(0)
+    for _ in range(50):
+        grid = random_grid(rng)
+        array_grid = ArrayGrid.from_array(grid.encode())
+        assert (array_grid.encode() == grid.encode()).all()
+
+        for x, y in rng.integers(-3, 7, (5, 2)).tolist():
+            assert (array_grid.slice(x, y, 5, 5).encode() == grid.slice(x, y, 5, 5).encode()).all()
+        assert (array_grid.rotate_left().encode() == grid.rotate_left().encode()).all()
+
+        agent_pos = tuple(rng.integers(0, 7, 2).tolist())
+        assert (array_grid.process_vis(agent_pos) == grid.process_vis(agent_pos)).all()
+        assert (array_grid.encode() == grid.encode()).all()
+
+
+def test_array_grid_set_get():
+    grid = ArrayGrid(5, 4)
+    door = Door("red")
+    grid.set(2, 1, door)
+    assert grid.get(2, 1) is door
+    assert ("red", "door") in grid and door in grid
+
+    # A door opened through its object shows in the encoding
+    door.is_open = True
+    assert grid.encode()[2, 1, 2] == door.encode()[2]
+
+    grid.set(2, 1, None)
+    assert grid.get(2, 1) is None
+    assert (grid.encode() == Grid(5, 4).encode()).all()
+
+
+def test_propagate_vis_matches_loop():
+    rng = np.random.default_rng(0)
+    for _ in range(500):
+        height, width = rng.integers(1, 9, 2)
+        see_through = rng.random((height, width)) > rng.random()
+        agent_pos = (int(rng.integers(width)), int(rng.integers(height)))
+
+        expected = propagate_vis_loop(see_through, agent_pos)
+        assert (_propagate_vis(see_through, agent_pos) == expected).all()
+
+
+def test_process_vis_clears_hidden_cells():
+    rng = np.random.default_rng(1)
+    for _ in range(50):
+        grid = Grid(7, 7)
+        for x, y in rng.integers(0, 7, (12, 2)).tolist():
+            grid.set(x, y, Wall())
+        array_grid = ArrayGrid.from_array(grid.encode())
+        see_through = np.array(
+            [cell is None for cell in grid.grid], dtype=bool
+        ).reshape(7, 7)
+
+        mask = grid.process_vis((3, 6))
+        assert (mask == propagate_vis_loop(see_through, (3, 6))).all()
+        assert (array_grid.process_vis((3, 6)) == mask).all()
+        assert (array_grid.encode() == grid.encode()).all()
+        assert all(grid.get(x, y) is None for x, y in zip(*np.nonzero(~mask)))
@@ -0,0 +1,108 @@
+import numpy as np
+
+from warehouse.envs.WarehouseEnv import WarehouseEnv
+from warehouse.envs.layout import compile_layout, resolve_moves
+
+
+def test_compiled_layout_matches_step():
+    # The layout holds the moves of one agent on its own
+    env = WarehouseEnv(
+        agent1_pos=(2, 3), agent2_pos=(7, 6), goal_pos=(4, 8), agent_collisions=False
+    )
+    env.reset()
+    layout = compile_layout(env.grid)
+
+    for cell in layout.free_cells:
+        y, x = divmod(int(cell), layout.width)
+        for action in range(layout.n_actions):
+            env.agent1_pos = (x, y)
+            env.step_count = 0
+            _, _, terminated, _, _ = env.stepN(action, 1, 0)
+            ax, ay = env.agent1_pos
+            assert layout.next_cell[cell, action] == ay * layout.width + ax
+            assert layout.hits_goal[cell, action] == terminated
+
+
+def resolve_pairwise(cells, targets, shared):
+    """
+    The rules of resolve_moves checked agent against agent, as a reference
+    """
+
+    n = len(cells)
+    targets = list(targets)
+    moving = [targets[a] != cells[a] for a in range(n)]
+    while True:
+        blocked = []
+        for a in range(n):
+            if not moving[a] or shared[targets[a]]:
+                continue
+            for b in range(n):
+                if b == a:
+                    continue
+                held = cells[b] == targets[a] and (not moving[b] or targets[b] == cells[a])
+                if held or (b < a and moving[b] and targets[b] == targets[a]):
+                    blocked.append(a)
+                    break
+        if not blocked:
+            return targets
+        for a in blocked:
+            targets[a] = cells[a]
+            moving[a] = False
+
+
+def random_moves(rng, n_cells, n_agents, shared):
+    # Agents on distinct cells, outside of the shared ones
+    free = np.flatnonzero(~shared)
+    cells = rng.choice(free, n_agents, replace=False)
+    # Stay, move to a neighbouring cell or anywhere, to get all kinds of conflicts
+    near = np.clip(cells + rng.integers(-1, 2, n_agents), 0, n_cells - 1)
+    anywhere = rng.integers(0, n_cells, n_agents)
+    targets = np.where(rng.random(n_agents) < 0.5, near, anywhere)
+    return cells, targets
+
+
+def test_resolve_moves_matches_pairwise_rules():
+    rng = np.random.default_rng(0)
+    n_cells = 10
+    for _ in range(3000):
+        shared = rng.random(n_cells) < 0.2
+        n_agents = int(rng.integers(1, min(6, (~shared).sum()) + 1))
+        cells, targets = random_moves(rng, n_cells, n_agents, shared)
+
+        occupancy = np.zeros(n_cells, dtype=np.int64)
+        occupancy[cells] = np.arange(1, n_agents + 1)
+        moved = resolve_moves(occupancy, cells, targets, shared)
+
+        expected = resolve_pairwise(cells.tolist(), targets.tolist(), shared)
+        assert moved.tolist() == expected
+
+        # The occupancy follows the agents, the shared cells staying free
+        after = np.zeros(n_cells, dtype=np.int64)
+        held = ~shared[moved]
+        after[moved[held]] = np.flatnonzero(held) + 1
+        assert (occupancy == after).all()
+
+
+def test_resolve_moves_cases():
+    shared = np.zeros(4, dtype=bool)
+
+    # Swap: both blocked
+    occupancy = np.array([1, 2, 0, 0])
+    assert resolve_moves(occupancy, np.array([0, 1]), np.array([1, 0]), shared).tolist() == [0, 1]
+
+    # Chain: the agent in front leaves, the one behind follows
+    occupancy = np.array([1, 2, 0, 0])
+    assert resolve_moves(occupancy, np.array([0, 1]), np.array([1, 2]), shared).tolist() == [1, 2]
+    assert occupancy.tolist() == [0, 1, 2, 0]
+
+    # Same target: the lowest index wins, and a blocked agent blocks the
+    # one moving into its cell
+    occupancy = np.array([1, 0, 2, 3])
+    moved = resolve_moves(occupancy, np.array([0, 2, 3]), np.array([1, 1, 2]), shared)
+    assert moved.tolist() == [1, 2, 3]
+
+    # Any number of agents on a shared cell
+    shared = np.array([False, True, False, False])
+    occupancy = np.array([1, 0, 2, 0])
+    assert resolve_moves(occupancy, np.array([0, 2]), np.array([1, 1]), shared).tolist() == [1, 1]
+    assert occupancy.tolist() == [0, 0, 0, 0]
@@ -0,0 +1,40 @@
+import numpy as np
+import torch as t
+
+from model import MultiAgentDQN
+
+
+def test_multi_agent_actions_match_per_agent_forward():
+    for per_agent_heads in (False, True):
+        agent = MultiAgentDQN(4, 9, 5, 1e-3, 0.9, 0.0, 0.0, 0.0, per_agent_heads=per_agent_heads)
+        states = np.random.default_rng(0).random((4, 9)).astype(np.float32)
+
+        x = agent.with_ids(states)
+        assert (x[:, 9:] == np.eye(4)).all()
+
+        actions = agent.choose_actions(states)
+        with t.no_grad():
+            for k in range(4):
+                q = agent.forward(t.as_tensor(x[k:k + 1]))
+                assert actions[k] == q.argmax(dim=1).item()
+
+
+def test_multi_agent_learn_subset_of_agents():
+    agent = MultiAgentDQN(3, 9, 5, 1e-2, 0.9, 0.0, 0.0, 0.0)
+    rng = np.random.default_rng(1)
+    agents = np.array([0, 2])
+    states = rng.random((2, 9)).astype(np.float32)
+    rewards = np.array([1.0, 0.0], dtype=np.float32)
+    dones = np.ones(2, dtype=np.float32)
+
+    x = t.as_tensor(agent.with_ids(states, agents))
+    with t.no_grad():
+        before = agent.forward(x)[:, 1]
+    for _ in range(200):
+        agent.learn(states, np.array([1, 1]), rewards, states, dones, agents)
+    with t.no_grad():
+        after = agent.forward(x)[:, 1]
+
+    # Terminal transitions: Q moves to the reward of each agent
+    assert np.allclose(after.numpy(), rewards, atol=0.05)
+    assert not np.allclose(before.numpy(), rewards, atol=0.05)
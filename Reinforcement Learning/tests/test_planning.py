@@ -0,0 +1,78 @@
+import numpy as np
+
+import planning
+from warehouse.envs.layout import Layout, resolve_moves
+
+
+def small_layout():
+    # 4x3 room split by a wall with one opening, the goal in a corner of
+    # the top row: agents coming from the bottom row queue at the opening
+    blocked = np.zeros((3, 4), dtype=bool)
+    blocked[1, [0, 2, 3]] = True
+    goal = np.zeros((3, 4), dtype=bool)
+    goal[0, 0] = True
+    return Layout(4, 3, blocked, goal)
+
+
+def step(mdp, states, actions):
+    """
+    One tick of the joint state, the moves resolved by resolve_moves on the
+    occupancy of the agents still on the grid
+    """
+
+    layout = mdp.layout
+    on_grid = [k for k, s in enumerate(states) if s != mdp.done]
+    cells = mdp.cells[[states[k] for k in on_grid]]
+    targets = layout.next_cell[cells, [actions[k] for k in on_grid]]
+    shared = layout.goal.ravel()
+
+    occupancy = np.zeros(layout.n_cells, dtype=np.int64)
+    held = ~shared[cells]
+    occupancy[cells[held]] = np.flatnonzero(held) + 1
+    moved = resolve_moves(occupancy, cells, targets, shared)
+
+    next_states = list(states)
+    for k, cell, target, moved_to in zip(on_grid, cells, targets, moved):
+        next_states[k] = mdp.next_state[states[k], actions[k]] if moved_to == target else states[k]
+    return tuple(next_states)
+
+
+def test_joint_transitions_resolve_collisions():
+    rng = np.random.default_rng(0)
+    mdp = planning.JointMDP(small_layout(), 3)
+    for _ in range(2000):
+        states = rng.integers(0, mdp.n_cells + 1, 3)
+        on_grid = states[states != mdp.done]
+        if len(np.unique(on_grid)) < len(on_grid):
+            continue
+        actions = rng.integers(0, mdp.n_actions, 3)
+        expected = np.ravel_multi_index(step(mdp, tuple(states), tuple(actions)), mdp.shape)
+        assert mdp._joint_next[tuple(states) + tuple(actions)] == expected
+
+
+def test_value_and_policy_iteration_agree():
+    layout = small_layout()
+    for agent_collisions in (True, False):
+        _, values, _ = planning.value_iteration(layout, 2, 0.9, agent_collisions=agent_collisions)
+        _, values_pi, _ = planning.policy_iteration(layout, 2, 0.9, agent_collisions=agent_collisions)
+        assert np.allclose(values, values_pi)
+
+    # Blocking each other can only cost the agents time
+    _, values, _ = planning.value_iteration(layout, 2, 0.9)
+    _, free_values, _ = planning.value_iteration(layout, 2, 0.9, agent_collisions=False)
+    assert (values <= free_values + 1e-9).all()
+    assert (values < free_values - 1e-3).any()
+
+
+def test_greedy_policy_reaches_values():
+    mdp, values, policy = planning.value_iteration(small_layout(), 2, 0.9)
+    for start in np.ndindex(mdp.n_cells, mdp.n_cells):
+        if start[0] == start[1]:
+            continue
+        states, ret = start, 0.0
+        for t in range(50):
+            actions = tuple(policy[states])
+            ret += 0.9 ** t * mdp.reward[states, actions].sum()
+            states = step(mdp, states, actions)
+        assert states == (mdp.done, mdp.done)
+        assert np.isclose(ret, values[start])
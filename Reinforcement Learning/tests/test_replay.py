@@ -0,0 +1,49 @@
+import numpy as np
+
+from replay import PrioritizedReplayBuffer, SumTree
+
+
+def test_sum_tree_update_and_total():
+    rng = np.random.default_rng(0)
+    for capacity in (1, 2, 5, 8, 13):
+        tree = SumTree(capacity)
+        priorities = np.zeros(capacity)
+        for _ in range(20):
+            idx = rng.choice(capacity, int(rng.integers(1, capacity + 1)), replace=False)
+            priorities[idx] = rng.random(len(idx))
+            tree.update(idx, priorities[idx])
+
+            assert np.isclose(tree.total, priorities.sum())
+            assert np.allclose(tree.get(np.arange(capacity)), priorities)
+
+
+def test_sum_tree_find_prefix_sums():
+    rng = np.random.default_rng(1)
+    capacity = 11
+    priorities = rng.random(capacity)
+    priorities[[2, 7]] = 0
+    tree = SumTree(capacity)
+    tree.update(np.arange(capacity), priorities)
+
+    values = rng.random(1000) * tree.total
+    expected = np.searchsorted(np.cumsum(priorities), values, side="right")
+    assert (tree.find(values) == expected).all()
+    # Leaves of zero priority are never found
+    assert not np.isin(tree.find(values), [2, 7]).any()
+
+
+def test_prioritized_sampling_follows_priorities():
+    np.random.seed(0)
+    memory = PrioritizedReplayBuffer(4, 1, alpha=1.0, eps=0.0)
+    for i in range(4):
+        memory.store(np.zeros(1), i, 0.0, np.zeros(1))
+    memory.update_priorities(np.arange(4), np.array([1.0, 0.0, 3.0, 0.0]))
+
+    idx = memory.sample_idx(4000)
+    counts = np.bincount(idx, minlength=4) / len(idx)
+    assert counts[1] == counts[3] == 0
+    assert abs(counts[2] - 0.75) < 0.03
+
+    weights = memory.weights(np.array([0, 2]))
+    assert weights.max() <= 1
+    assert weights[0] > weights[1]
@@ -0,0 +1,27 @@
+import numpy as np
+
+from tabular import TabularQ
+
+
+def test_learn_batch_matches_learn():
+    rng = np.random.default_rng(0)
+    # Distinct states, all moving to a state outside of the batch, so the
+    # order of the updates does not matter
+    states = np.array([np.unravel_index(i, (3,) * 4) for i in range(0, 80, 9)]) - 1.0
+    states_ = np.ones_like(states)
+    actions = rng.integers(0, 3, len(states))
+    rewards = rng.random(len(states))
+    dones = rng.random(len(states)) < 0.3
+
+    batch, single = [TabularQ(4, 3, lr=0.5, reward_decay=0.9, epsilon=1.0, eps_dec=0.1, eps_min=0.05)
+                     for _ in range(2)]
+    batch.q_table[:] = single.q_table[:] = rng.random(batch.q_table.shape)
+
+    batch.learn_batch(states, actions, rewards, states_, dones)
+    for transition in zip(states, actions, rewards, states_, dones):
+        single.learn(*transition)
+    assert np.allclose(batch.q_table, single.q_table)
+
+    # Epsilon decays once per call, for a batch as for a single transition
+    assert batch.n_updates == 1
+    assert np.isclose(batch.epsilon, 0.9)
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from warehouse.envs import WarehouseEnv, WarehouseVecEnv
+from warehouse.envs.layout import compile_layout
+
+
+def padded_views(wall, goal, view_size):
+    """
+    Views cut out of the -1 (wall) / 0 / 1 (goal) map padded with walls,
+    one row per cell, as a reference
+    """
+
+    pad = view_size // 2
+    padded = np.pad(np.select([wall, goal], [-1, 1], 0), pad, constant_values=-1)
+    height, width = wall.shape
+    return np.array([
+        padded[y:y + view_size, x:x + view_size].ravel()
+        for y in range(height) for x in range(width)
+    ])
+
+
+@pytest.mark.parametrize("size", [10, 18])
+def test_vec_env_obs_match_padded_map(size):
+    vec = WarehouseVecEnv(8, n_agents=3, size=size, agent_view_size=5, seed=0)
+    obs = vec.reset()
+    for _ in range(20):
+        for e in range(vec.num_envs):
+            goal = np.zeros_like(vec.wall)
+            goal[vec.goal_pos[e, 1], vec.goal_pos[e, 0]] = True
+            expected = padded_views(vec.wall, goal, vec.agent_view_size)
+            cells = vec.agent_pos[e, :, 1] * vec.width + vec.agent_pos[e, :, 0]
+            assert (obs[e] == expected[cells]).all()
+        obs, *_ = vec.step(vec.np_random.integers(0, 5, (vec.num_envs, vec.n_agents)))
+
+
+def test_vec_env_layout_and_rewards_match_env():
+    env = WarehouseEnv(size=18, max_steps=30)
+    env.reset()
+    wall = compile_layout(env.grid).wall
+
+    vec = WarehouseVecEnv(16, size=18, max_steps=30, seed=0)
+    assert (vec.height, vec.width) == wall.shape
+    assert (vec.wall == wall).all()
+
+    vec.reset()
+    for _ in range(60):
+        step_count = vec.step_count + 1
+        _, rewards, terminated, _, _ = vec.step(
+            vec.np_random.integers(0, 5, (vec.num_envs, vec.n_agents))
+        )
+        for e, k in zip(*np.nonzero(terminated)):
+            env.step_count = step_count[e]
+            assert rewards[e, k] == env._reward()
+        assert (rewards[~terminated] == 0).all()
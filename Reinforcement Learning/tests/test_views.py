@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from warehouse.envs import WarehouseEnv, views
+
+
+def padded_views(wall, goal, view_size):
+    """
+    Views cut out of the -1 (wall) / 0 / 1 (goal) map padded with walls,
+    one row per cell, as a reference
+    """
+
+    pad = view_size // 2
+    padded = np.pad(np.select([wall, goal], [-1, 1], 0), pad, constant_values=-1)
+    height, width = wall.shape
+    return np.array([
+        padded[y:y + view_size, x:x + view_size].ravel()
+        for y in range(height) for x in range(width)
+    ])
+
+
+def random_layout(rng, height, width):
+    wall = rng.random((height, width)) < 0.3
+    goal = np.zeros_like(wall)
+    goal.ravel()[rng.choice(np.flatnonzero(~wall), 2, replace=False)] = True
+    return wall, goal
+
+
+@pytest.mark.parametrize("view_size", [1, 3, 5, 7])
+def test_view_tables_match_padded_map(view_size):
+    rng = np.random.default_rng(view_size)
+    wall, goal = random_layout(rng, 6, 9)
+
+    table = views.view_table(wall, view_size)
+    assert table.shape == (wall.size, view_size ** 2)
+    assert not table.flags.writeable
+    assert (table == padded_views(wall, np.zeros_like(goal), view_size)).all()
+
+    table = views.goal_view_table(wall, goal, view_size)
+    assert (table == padded_views(wall, goal, view_size)).all()
+
+
+def test_load_view_table_cache(tmp_path, monkeypatch):
+    rng = np.random.default_rng(0)
+    wall, _ = random_layout(rng, 5, 5)
+    monkeypatch.setattr(views, "_tables", {})
+
+    table = views.load_view_table(wall, 3, cache_dir=str(tmp_path))
+    assert views.load_view_table(wall, 3, cache_dir=str(tmp_path)) is table
+    files = list(tmp_path.iterdir())
+    assert [f.name for f in files] == [views.layout_key(wall, 3) + ".npy"]
+
+    # A new process maps the file rather than computing the table again
+    monkeypatch.setattr(views, "_tables", {})
+    loaded = views.load_view_table(wall, 3, cache_dir=str(tmp_path))
+    assert isinstance(loaded, np.memmap)
+    assert (loaded == table).all()
+
+
+def test_env_states_match_padded_map():
+    env = WarehouseEnv(agent1_pos=(2, 3), agent2_pos=(7, 6), goal_pos=(4, 8))
+    env.reset()
+    layout = env.get_layout()
+    expected = padded_views(layout.wall, layout.goal, env.agent_view_size)
+
+    for y, x in np.argwhere(~layout.blocked):
+        env.agent_pos[0] = (x, y)
+        assert (env.gen_state(1) == expected[y * env.width + x]).all()
+
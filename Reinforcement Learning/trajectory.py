@@ -0,0 +1,240 @@
+"""
+Recording of environment trajectories into columnar .npz shards, and a
+loader that turns them back into DQN transitions without re-simulating.
+
+A recorder set as env.recorder is called by MiniGridEnvMod.reset, stepN
+and step_all. It keeps the steps in memory and writes them in bulk, one
+shard per chunk_size steps. A shard holds one row per agent step:
+
+    episode, agent, step     episode id, agent (1 to N), env step count
+    action                   action taken
+    pos, pos_                (x, y) of the agent before and after the step
+    reward, terminated, truncated
+
+plus the grid encoding of every episode it references, from which the
+loader rebuilds each agent's -1/0/1 view, the start positions and
+directions of its agents and the agent view size.
+"""
+from __future__ import annotations
+
+import glob
+import io
+import os
+import socket
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from minigrid.core.constants import OBJECT_TO_IDX
+from warehouse.envs.views import goal_view_table
+
+STEP_COLUMNS = (
+    ("episode", np.int64),
+    ("agent", np.int16),
+    ("step", np.int32),
+    ("action", np.int8),
+    ("x", np.int16),
+    ("y", np.int16),
+    ("x_", np.int16),
+    ("y_", np.int16),
+    ("reward", np.float32),
+    ("terminated", bool),
+    ("truncated", bool),
+)
+
+
+class TrajectoryRecorder:
+    """
+    Streams the steps of an environment into dir/<prefix>-<n>.npz shards.
+    The default prefix (host name and process id) keeps the shards of
+    recorders on different machines or processes apart.
+    """
+
+    def __init__(self, dir: str, chunk_size: int = 100000, prefix: str | None = None,
+                 compress: bool = False) -> None:
+        self.dir = dir
+        self.chunk_size = chunk_size
+        self.prefix = prefix or "{}-{}".format(socket.gethostname(), os.getpid())
+        self.compress = compress
+        os.makedirs(dir, exist_ok=True)
+
+        self.episode = -1
+        self.view_size = None
+        self.n_shards = 0
+        self._layouts: dict[int, np.ndarray] = {}
+        self._starts: dict[int, tuple[np.ndarray, np.ndarray]] = {}
+        self._steps: list[tuple] = []
+
+    def record_reset(self, env) -> None:
+        self.episode += 1
+        self.view_size = env.agent_view_size
+        self._layouts[self.episode] = env.grid.encode()
+        self._starts[self.episode] = (env.agent_pos.astype(np.int16), env.agent_dir.astype(np.int8))
+
+    def record_step(self, env, agentN: int, action: int, pos, result) -> None:
+        _, reward, terminated, truncated, _ = result
+        x, y = pos
+        x_, y_ = env.agent_pos[agentN - 1].tolist()
+        self._steps.append((self.episode, agentN, env.step_count, action,
+                            x, y, x_, y_, reward, terminated, truncated))
+        if len(self._steps) >= self.chunk_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Write the recorded steps to a new shard
+        """
+
+        if not self._steps:
+            return
+
+        columns = {name: np.array(values, dtype=dtype)
+                   for (name, dtype), values in zip(STEP_COLUMNS, zip(*self._steps))}
+        episodes = np.unique(columns["episode"])
+        shard = {
+            "episode": columns["episode"],
+            "agent": columns["agent"],
+            "step": columns["step"],
+            "action": columns["action"],
+            "pos": np.stack((columns["x"], columns["y"]), axis=1),
+            "pos_": np.stack((columns["x_"], columns["y_"]), axis=1),
+            "reward": columns["reward"],
+            "terminated": columns["terminated"],
+            "truncated": columns["truncated"],
+            "layout_episodes": episodes,
+            "layouts": np.stack([self._layouts[e] for e in episodes]),
+            "starts": np.stack([self._starts[e][0] for e in episodes]),
+            "start_dirs": np.stack([self._starts[e][1] for e in episodes]),
+            "view_size": np.array(self.view_size),
+        }
+
+        path = os.path.join(self.dir, "{}-{:06d}.npz".format(self.prefix, self.n_shards))
+        save = np.savez_compressed if self.compress else np.savez
+        with open(path + ".tmp", "wb") as f:
+            save(f, **shard)
+        os.replace(path + ".tmp", path)
+        self.n_shards += 1
+
+        # Only the layout of the running episode can still be referenced
+        self._layouts = {self.episode: self._layouts[self.episode]}
+        self._starts = {self.episode: self._starts[self.episode]}
+        self._steps = []
+
+    def close(self) -> None:
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def view_tables(layouts: np.ndarray, view_size: int) -> np.ndarray:
+    """
+    (E, H * W, view_size ** 2) view tables of grid encodings (E, W, H, 3),
+    the views.goal_view_table of each layout as MiniGridEnvMod.load_views
+    builds them
+    """
+
+    types = layouts[..., 0].transpose(0, 2, 1)
+    wall = types == OBJECT_TO_IDX["wall"]
+    goal = types == OBJECT_TO_IDX["goal"]
+    return np.stack([goal_view_table(wall[e], goal[e], view_size) for e in range(len(layouts))])
+
+
+def views(tables: np.ndarray, table_index: np.ndarray, pos: np.ndarray, width: int) -> np.ndarray:
+    """
+    Flattened views centred on pos, rows of the view tables of layouts of
+    the given width looked up in one indexing operation
+    """
+
+    return tables[table_index, pos[:, 1] * width + pos[:, 0]]
+
+
+class TrajectoryDataset:
+    """
+    Recorded shards of a directory (or a list of shard paths) read back as
+    (states, actions, rewards, states_, dones) transitions, shard by shard
+    """
+
+    def __init__(self, paths) -> None:
+        if isinstance(paths, str):
+            paths = sorted(glob.glob(os.path.join(glob.escape(paths), "*.npz")))
+        self.paths = list(paths)
+
+    def __len__(self) -> int:
+        n = 0
+        for path in self.paths:
+            with np.load(path) as shard:
+                n += len(shard["action"])
+        return n
+
+    @staticmethod
+    def load(path: str) -> dict:
+        with open(path, "rb") as f:
+            data = io.BytesIO(f.read())
+        with np.load(data) as shard:
+            return {name: shard[name] for name in shard.files}
+
+    @staticmethod
+    def transitions(shard: dict, agent: int | None = None):
+        """
+        Transitions of a loaded shard, of one agent or of all of them
+        """
+
+        rows = slice(None) if agent is None else shard["agent"] == agent
+        view_size = int(shard["view_size"])
+        tables = view_tables(shard["layouts"], view_size)
+        table_index = np.searchsorted(shard["layout_episodes"], shard["episode"][rows])
+        width = shard["layouts"].shape[1]
+
+        states = views(tables, table_index, shard["pos"][rows].astype(np.int64), width)
+        states_ = views(tables, table_index, shard["pos_"][rows].astype(np.int64), width)
+        return (states, shard["action"][rows].astype(np.int64), shard["reward"][rows],
+                states_, shard["terminated"][rows].astype(np.float32))
+
+    def shards(self, agent: int | None = None):
+        """
+        Transitions of every shard, the next shard being read and decoded
+        in a background thread while the current one is used
+        """
+
+        def read(path):
+            return self.transitions(self.load(path), agent)
+
+        if not self.paths:
+            return
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            future = pool.submit(read, self.paths[0])
+            for path in self.paths[1:]:
+                transitions = future.result()
+                future = pool.submit(read, path)
+                yield transitions
+            yield future.result()
+
+    def batches(self, batch_size: int, agent: int | None = None, shuffle: bool = True, seed=None):
+        """
+        Minibatches for DQN.learn_batch, shuffled within each shard
+        """
+
+        rng = np.random.default_rng(seed)
+        for transitions in self.shards(agent):
+            n = len(transitions[1])
+            order = rng.permutation(n) if shuffle else np.arange(n)
+            for start in range(0, n - batch_size + 1, batch_size):
+                idx = order[start : start + batch_size]
+                yield tuple(column[idx] for column in transitions)
+
+    def fill(self, memory, agent: int | None = None) -> int:
+        """
+        Store the transitions into a replay memory, return how many
+        """
+
+        n = 0
+        for transitions in self.shards(agent):
+            for start in range(0, len(transitions[1]), memory.capacity):
+                chunk = tuple(column[start : start + memory.capacity] for column in transitions)
+                memory.store_batch(*chunk)
+                n += len(chunk[1])
+        return n
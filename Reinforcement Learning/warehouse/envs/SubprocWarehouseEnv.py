@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from warehouse.shm import attach, block_size
+
+
+def _buffer_layout(num_envs: int, n_agents: int, n_features: int):
+    """
+    (name, shape, dtype) of every array kept in the shared block
+    """
+
+    return [
+        ("actions", (num_envs, n_agents), np.int64),
+        ("obs", (num_envs, n_agents, n_features), np.float32),
+        ("final_obs", (num_envs, n_agents, n_features), np.float32),
+        ("rewards", (num_envs, n_agents), np.float64),
+        ("terminated", (num_envs, n_agents), bool),
+        ("truncated", (num_envs, n_agents), bool),
+        ("active", (num_envs, n_agents), bool),
+        ("final", (num_envs,), bool),
+    ]
+
+
+def _worker(remote, parent_remote, shm_name, layout, index, n_agents, env_kwargs):
+    import warnings
+
+    from warehouse.envs.WarehouseEnv import WarehouseEnv
+
+    warnings.filterwarnings("ignore")
+    parent_remote.close()
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    buf = attach(shm.buf, layout)
+
+    env = WarehouseEnv(obs_mode="state", fast_step=True, **env_kwargs)
+    done = np.zeros(n_agents, dtype=bool)
+
+    def write_obs(obs, out):
+        for k in range(n_agents):
+            out[k] = obs[f"state{k + 1}"]
+
+    try:
+        while True:
+            cmd, data = remote.recv()
+
+            if cmd == "step":
+                # One joint step as in the training loop, the agents that
+                # already reached the goal stay in place
+                active = ~done
+                obs, rewards, terminated, truncated, _ = env.step_all(buf["actions"][index], active)
+                buf["active"][index] = active
+                buf["rewards"][index] = rewards
+                buf["terminated"][index] = terminated
+                buf["truncated"][index] = np.logical_and(active, truncated)
+                done = done | np.asarray(terminated, dtype=bool)
+
+                finished = done.all() or buf["truncated"][index].any()
+                buf["final"][index] = finished
+                if finished:
+                    write_obs(obs, buf["final_obs"][index])
+                    obs = env.reset()
+                    done[:] = False
+                write_obs(obs, buf["obs"][index])
+                remote.send(None)
+
+            elif cmd == "reset":
+                write_obs(env.reset(seed=data), buf["obs"][index])
+                done[:] = False
+                remote.send(None)
+
+            elif cmd == "close":
+                break
+
+            else:
+                raise ValueError(f"Unknown command: {cmd}")
+    finally:
+        env.close()
+        del buf
+        shm.close()
+        remote.close()
+
+
+class SubprocWarehouseEnv:
+    """
+    Runs one WarehouseEnv per worker process. Actions, observations,
+    rewards and flags are exchanged through NumPy arrays in a single
+    shared-memory block; the pipes only carry the step/reset commands and
+    an acknowledgement, so nothing is pickled per step.
+
+    step follows the semantics of WarehouseVecEnv.step, including the
+    automatic reset of finished episodes. The arrays it returns are views
+    of the shared block and are overwritten by the next step.
+
+    With a view_cache_dir in env_kwargs, the workers share the view table
+    of the layout through that directory instead of each computing it.
+    """
+
+    def __init__(self, num_envs: int, env_kwargs: dict | None = None, context: str = "spawn"):
+        from warehouse.envs.WarehouseEnv import WarehouseEnv
+
+        env_kwargs = dict(env_kwargs or {})
+
+        # Agent count and view size as the workers' envs resolve them
+        env = WarehouseEnv(obs_mode="state", fast_step=True, **env_kwargs)
+        self.num_envs = num_envs
+        self.n_agents = env.n_agents
+        self.observation_size = env.agent_view_size ** 2
+        env.close()
+
+        layout = _buffer_layout(num_envs, self.n_agents, self.observation_size)
+        self._shm = shared_memory.SharedMemory(create=True, size=block_size(layout))
+        self._buf = attach(self._shm.buf, layout)
+
+        ctx = mp.get_context(context)
+        self._remotes, work_remotes = zip(*[ctx.Pipe() for _ in range(num_envs)])
+        self._processes = []
+        for index, (work_remote, remote) in enumerate(zip(work_remotes, self._remotes)):
+            process = ctx.Process(
+                target=_worker,
+                args=(work_remote, remote, self._shm.name, layout, index, self.n_agents, env_kwargs),
+                daemon=True,
+            )
+            process.start()
+            work_remote.close()
+            self._processes.append(process)
+
+        self._waiting = False
+        self.closed = False
+
+    def _wait(self):
+        for remote in self._remotes:
+            remote.recv()
+        self._waiting = False
+
+    def reset(self, *, seed: int | None = None) -> np.ndarray:
+        for index, remote in enumerate(self._remotes):
+            remote.send(("reset", None if seed is None else seed + index))
+        self._wait()
+        return self._buf["obs"]
+
+    def step_async(self, actions: np.ndarray):
+        """
+        Write the (num_envs, n_agents) actions and start every worker
+        """
+
+        self._buf["actions"][:] = actions
+        for remote in self._remotes:
+            remote.send(("step", None))
+        self._waiting = True
+
+    def step_wait(self):
+        """
+        Wait once for all workers and return the results of the step
+        """
+
+        self._wait()
+        buf = self._buf
+        info = {"active": buf["active"], "_final": buf["final"], "final_obs": buf["final_obs"]}
+        return buf["obs"], buf["rewards"], buf["terminated"], buf["truncated"], info
+
+    def step(self, actions: np.ndarray):
+        self.step_async(actions)
+        return self.step_wait()
+
+    def close(self):
+        if self.closed:
+            return
+        if self._waiting:
+            self._wait()
+        for remote in self._remotes:
+            remote.send(("close", None))
+        for process in self._processes:
+            process.join()
+        self._buf = None
+        self._shm.close()
+        self._shm.unlink()
+        self.closed = True
@@ -1,22 +1,34 @@
 from __future__ import annotations
 
-from warehouse.envs.grid import Grid
 from minigrid.core.mission import MissionSpace
 from minigrid.core.world_object import Goal
 from warehouse.envs.minigrid_env_mod import MiniGridEnvMod
 
 from gymnasium import spaces
 
+# Internal walls of one 8x8 bay of the warehouse, as (x, y, width, height)
+# rectangles relative to the corner of the bay's border
+BAY_WALLS = ((4, 2, 5, 1), (4, 3, 1, 3), (1, 7, 2, 2), (6, 5, 1, 4))
+
 
 class WarehouseEnv(MiniGridEnvMod):
 
-    def __init__(self, agent1_pos=None, agent2_pos=None, goal_pos=None, max_steps=100, **kwargs):
-        self._agent1_default_pos = agent1_pos
-        self._agent2_default_pos = agent2_pos
+    def __init__(self, agent1_pos=None, agent2_pos=None, goal_pos=None, max_steps=100,
+                 n_agents=2, agent_pos=None, size=10, **kwargs):
+        # Start positions, None for the agents placed at random. agent_pos
+        # lists one per agent, agent1_pos and agent2_pos set the first two
+        if agent_pos is not None:
+            n_agents = len(agent_pos)
+        else:
+            agent_pos = [agent1_pos, agent2_pos][:n_agents] + [None] * (n_agents - 2)
+        self._agent_default_pos = list(agent_pos)
         self._goal_default_pos = goal_pos
 
         # Grid size (in cells, per side): left border + 8 cells + right border
-        self.size = 10
+        # by default, larger floors repeat the layout of that 8x8 bay. Only
+        # whole bays keep every free cell reachable
+        assert (size - 2) % 8 == 0 and size >= 10, f"size must be 2 + 8 * k, got: {size}"
+        self.size = size
         mission_space = MissionSpace(mission_func=self._gen_mission)
 
         super().__init__(
@@ -24,6 +36,7 @@ class WarehouseEnv(MiniGridEnvMod):
             width=self.size,
             height=self.size,
             agent_view_size=3,
+            n_agents=n_agents,
             max_steps=max_steps,
             **kwargs,
         )
@@ -42,7 +55,7 @@ class WarehouseEnv(MiniGridEnvMod):
 
     def _gen_grid(self, width, height):
         # Create the grid
-        self.grid = Grid(width, height)
+        self.grid = self.grid_cls(width, height)
 
         # Generate the surrounding walls
         self.grid.horz_wall(0, 0)
@@ -50,32 +63,24 @@ class WarehouseEnv(MiniGridEnvMod):
         self.grid.vert_wall(0, 0)
         self.grid.vert_wall(width - 1, 0)
 
-        # Generate the internal walls
-        self.grid.horz_wall(4, 2)
-        self.grid.vert_wall(4, 3, length=3)
-
-        self.grid.vert_wall(1, 7, length=2)
-        self.grid.vert_wall(2, 7, length=2)
-
-        self.grid.vert_wall(6, 5, length=4)
-
-        # Set the start position and orientation of agent 1
-        if self._agent1_default_pos is not None:
-            self.agent1_pos = self._agent1_default_pos
-            self.grid.set(*self._agent1_default_pos, None)
-            # assuming random start direction
-            self.agent1_dir = 1
-        else:
-            self.place_agent1()
-
-        # Set the start position and orientation of agent 2
-        if self._agent2_default_pos is not None:
-            self.agent2_pos = self._agent2_default_pos
-            self.grid.set(*self._agent2_default_pos, None)
-            # assuming random start direction
-            self.agent2_dir = 1
-        else:
-            self.place_agent2()
+        # Generate the internal walls, bay by bay
+        for bay_x in range(0, width - 2, 8):
+            for bay_y in range(0, height - 2, 8):
+                for x, y, w, h in BAY_WALLS:
+                    for j in range(bay_y + y, bay_y + y + h):
+                        self.grid.horz_wall(bay_x + x, j, length=w)
+
+        # Set the start position and orientation of the agents, the fixed
+        # ones first so that the others are placed around them
+        for k, pos in enumerate(self._agent_default_pos):
+            if pos is not None:
+                self.agent_pos[k] = pos
+                self.grid.set(*pos, None)
+                # assuming random start direction
+                self.agent_dir[k] = 1
+        for k, pos in enumerate(self._agent_default_pos):
+            if pos is None:
+                self.place_agent(k + 1)
 
         if self._goal_default_pos is not None:
             goal = Goal()
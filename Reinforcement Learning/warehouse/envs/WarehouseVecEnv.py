@@ -0,0 +1,232 @@
+from __future__ import annotations
+
+import numpy as np
+
+from minigrid.core.constants import TILE_PIXELS
+from minigrid.core.world_object import Goal
+from warehouse.envs.WarehouseEnv import WarehouseEnv
+from warehouse.envs.grid import EMPTY_CELL, WALL_CELL, Grid
+from warehouse.envs.layout import ACTION_TO_VEC, compile_layout, resolve_moves
+from warehouse.envs.views import draw_goals, load_view_table
+
+
+class WarehouseVecEnv:
+    """
+    N copies of the warehouse stepped in lockstep. Every instance is kept as
+    rows of stacked NumPy arrays (agent positions, goal positions, step
+    counters), sharing the static wall mask of a WarehouseEnv of the same
+    size.
+
+    A call to step is one joint tick, exactly as the training loop in
+    main.py runs MiniGridEnvMod.step_all: the agents that already reached
+    the goal stay in place, the step counter advances once, the reward is
+    computed from the counter after the tick and an instance is truncated
+    once the counter reaches max_steps. Instances whose episode ended are
+    reset automatically. With agent_collisions, the agents of an instance
+    block each other as in MiniGridEnvMod, through one occupancy layer
+    covering every instance.
+    """
+
+    def __init__(
+        self,
+        num_envs: int,
+        agent_pos: list[tuple[int, int]] | None = None,
+        goal_pos: tuple[int, int] | None = None,
+        n_agents: int = 2,
+        size: int = 10,
+        max_steps: int = 100,
+        agent_view_size: int = 3,
+        agent_collisions: bool = True,
+        seed: int | None = None,
+        view_cache_dir: str | None = None,
+    ):
+        assert num_envs >= 1
+        assert agent_view_size % 2 == 1
+        if agent_pos is not None:
+            n_agents = len(agent_pos)
+        assert n_agents >= 1
+
+        self.num_envs = num_envs
+        self.n_agents = n_agents
+        self.max_steps = max_steps
+        self.agent_view_size = agent_view_size
+        self.observation_size = agent_view_size ** 2
+
+        self._agent_default_pos = agent_pos
+        self._goal_default_pos = goal_pos
+
+        # Build the static layout once from the single-instance environment
+        env = WarehouseEnv(size=size, max_steps=max_steps)
+        env.reset()
+        layout = compile_layout(env.grid)
+        env.close()
+        self.width = layout.width
+        self.height = layout.height
+        self.wall = layout.wall
+
+        # Static view of every cell (see views.view_table), shared by the
+        # instances, the goal of each instance is drawn in by gen_obs
+        self._pad = agent_view_size // 2
+        self._view_table = load_view_table(self.wall, agent_view_size, np.float32, view_cache_dir)
+
+        # Grid encoding without the goal, (width, height, 3) like Grid.encode
+        self._encoding = np.where(self.wall.T[:, :, None], WALL_CELL, EMPTY_CELL).astype(np.uint8)
+
+        self.np_random = np.random.default_rng(seed)
+
+        self.agent_pos = np.zeros((num_envs, n_agents, 2), dtype=np.int64)
+        self.goal_pos = np.zeros((num_envs, 2), dtype=np.int64)
+        self.step_count = np.zeros(num_envs, dtype=np.int64)
+        self.agent_done = np.zeros((num_envs, n_agents), dtype=bool)
+
+        # Occupancy of the cells of every instance, flat over (instance,
+        # cell): index + 1 of the agent, flat over (instance, agent), in
+        # each cell, 0 when free. The goal cells are shared
+        self.agent_collisions = agent_collisions
+        n_cells = self.width * self.height
+        self._env_cells = np.arange(num_envs)[:, None] * n_cells
+        self.occupancy = np.zeros(num_envs * n_cells, dtype=np.int64)
+        self._shared_cells = np.zeros(num_envs * n_cells, dtype=bool)
+
+    def _place(self, taken: np.ndarray) -> np.ndarray:
+        # Uniform pick of a free cell per instance, the random scores of the
+        # cells that are walls or already taken are masked out
+        scores = self.np_random.random(taken.shape)
+        scores[taken] = -1
+        return np.stack(np.divmod(scores.argmax(axis=1), self.width)[::-1], axis=1)
+
+    def _reset_envs(self, envs: np.ndarray):
+        n = len(envs)
+        if n == 0:
+            return
+
+        taken = np.tile(self.wall.ravel(), (n, 1))
+        rows = np.arange(n)
+        for k in range(self.n_agents):
+            if self._agent_default_pos is not None:
+                pos = np.tile(self._agent_default_pos[k], (n, 1))
+            else:
+                pos = self._place(taken)
+                taken[rows, pos[:, 1] * self.width + pos[:, 0]] = True
+            self.agent_pos[envs, k] = pos
+
+        if self._goal_default_pos is not None:
+            goal = np.tile(self._goal_default_pos, (n, 1))
+        else:
+            goal = self._place(taken)
+
+        self.goal_pos[envs] = goal
+        self.step_count[envs] = 0
+        self.agent_done[envs] = False
+
+        if self.agent_collisions:
+            n_cells = self.width * self.height
+            rows = (self._env_cells[envs] + np.arange(n_cells)).ravel()
+            self.occupancy[rows] = 0
+            self._shared_cells[rows] = False
+            goal_cells = self._env_cells[envs, 0] + goal[:, 1] * self.width + goal[:, 0]
+            self._shared_cells[goal_cells] = True
+
+            cells = (self._env_cells[envs] + self.agent_pos[envs, :, 1] * self.width
+                     + self.agent_pos[envs, :, 0])
+            agents = envs[:, None] * self.n_agents + np.arange(self.n_agents)
+            held = ~self._shared_cells[cells]
+            assert len(np.unique(cells[held])) == held.sum(), "Agents overlap outside of the goal"
+            self.occupancy[cells[held]] = agents[held] + 1
+
+    def reset(self, *, seed: int | None = None) -> np.ndarray:
+        if seed is not None:
+            self.np_random = np.random.default_rng(seed)
+
+        self._reset_envs(np.arange(self.num_envs))
+
+        return self.gen_obs()
+
+    def gen_obs(self) -> np.ndarray:
+        """
+        Encode the view of every agent as a (num_envs, n_agents, view ** 2)
+        float32 array, using the same -1/0/1 values as observationToState
+        """
+
+        pos = self.agent_pos.reshape(-1, 2)
+        obs = self._view_table[pos[:, 1] * self.width + pos[:, 0]]
+        goals = np.repeat(self.goal_pos, self.n_agents, axis=0)[:, None]
+        draw_goals(obs, pos, goals, self.agent_view_size)
+        return obs.reshape(self.num_envs, self.n_agents, self.observation_size)
+
+    def step(self, actions: np.ndarray):
+        """
+        Apply an (num_envs, n_agents) array of actions. Returns the
+        observations, rewards, terminated and truncated flags, each with a
+        leading (num_envs, n_agents) shape, and an info dict.
+
+        info["active"] tells which agents acted in this step. For instances
+        that were reset, info["final_obs"] holds the last observation of the
+        finished episode and info["_final"] marks which rows are valid.
+        """
+
+        actions = np.asarray(actions)
+        assert actions.shape == (self.num_envs, self.n_agents)
+        if actions.min() < 0 or actions.max() >= len(ACTION_TO_VEC):
+            raise ValueError(f"Unknown action in: {np.unique(actions)}")
+
+        active = ~self.agent_done
+
+        self.step_count += 1
+
+        # Moves of every agent of every instance at once, a move into a wall
+        # or by an agent that does not act leaving it in place
+        fwd = self.agent_pos + ACTION_TO_VEC[actions]
+        move = active & ~self.wall[fwd[..., 1], fwd[..., 0]]
+        if self.agent_collisions:
+            cells = self._env_cells + self.agent_pos[..., 1] * self.width + self.agent_pos[..., 0]
+            targets = np.where(move, self._env_cells + fwd[..., 1] * self.width + fwd[..., 0], cells)
+            targets = resolve_moves(self.occupancy, cells.ravel(), targets.ravel(), self._shared_cells)
+            move = targets.reshape(cells.shape) != cells
+        self.agent_pos[move] = fwd[move]
+
+        terminated = active & np.all(fwd == self.goal_pos[:, None], axis=2)
+        # WarehouseEnv._reward reads only step_count and max_steps, so it
+        # gives the reward of every instance at once
+        rewards = np.where(terminated, WarehouseEnv._reward(self)[:, None], 0.0)
+        truncated = active & (self.step_count >= self.max_steps)[:, None]
+
+        self.agent_done |= terminated
+        obs = self.gen_obs()
+
+        finished = self.agent_done.all(axis=1) | truncated.any(axis=1)
+        info = {"active": active, "_final": finished}
+        if finished.any():
+            info["final_obs"] = obs.copy()
+            envs = np.flatnonzero(finished)
+            self._reset_envs(envs)
+            obs[envs] = self.gen_obs()[envs]
+
+        return obs, rewards, terminated, truncated, info
+
+    def render(
+        self, tile_size: int = TILE_PIXELS, highlight: bool = True, out: np.ndarray | None = None
+    ) -> np.ndarray:
+        """
+        Full views of every instance as a (num_envs, height * tile_size,
+        width * tile_size, 3) uint8 array. The tile ID maps are built from
+        the position arrays and the frames gathered from a TileAtlas in one
+        go, into out when given: reusing a buffer is several times faster
+        than filling fresh memory. Agents are drawn facing down, as
+        WarehouseEnv starts them, and the cells in their view are
+        highlighted as in get_frame
+        """
+
+        envs = np.arange(self.num_envs)
+        encodings = np.repeat(self._encoding[None], self.num_envs, axis=0)
+        encodings[envs, self.goal_pos[:, 0], self.goal_pos[:, 1]] = Goal().encode()
+
+        mask = None
+        if highlight:
+            near_x = np.abs(np.arange(self.width) - self.agent_pos[:, :, 0, None]) <= self._pad
+            near_y = np.abs(np.arange(self.height) - self.agent_pos[:, :, 1, None]) <= self._pad
+            mask = (near_x[:, :, :, None] & near_y[:, :, None, :]).any(axis=1)
+
+        agent_dir = np.ones((self.num_envs, self.n_agents), dtype=np.int64)
+        atlas = Grid.tile_atlas(tile_size)
+        return atlas.render(atlas.tile_ids(encodings, self.agent_pos, agent_dir, mask), out)
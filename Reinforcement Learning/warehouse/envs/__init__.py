@@ -1 +1,3 @@
-from warehouse.envs.WarehouseEnv import WarehouseEnv
\ No newline at end of file
+from warehouse.envs.WarehouseEnv import WarehouseEnv
+from warehouse.envs.WarehouseVecEnv import WarehouseVecEnv
+from warehouse.envs.SubprocWarehouseEnv import SubprocWarehouseEnv
\ No newline at end of file
@@ -1,20 +1,12 @@
 from __future__ import annotations
 
-import math
 from typing import Any, Callable
 
 import numpy as np
 
-from minigrid.core.constants import OBJECT_TO_IDX, TILE_PIXELS
+from minigrid.core.constants import COLOR_TO_IDX, OBJECT_TO_IDX, TILE_PIXELS
 from minigrid.core.world_object import Wall, WorldObj
-from minigrid.utils.rendering import (
-    downsample,
-    fill_coords,
-    highlight_img,
-    point_in_rect,
-    point_in_triangle,
-    rotate_fn,
-)
+from warehouse.envs.tiles import TileAtlas, TileCache
 
 
 class Grid:
@@ -22,8 +14,9 @@ class Grid:
     Represent a grid and operations on it
     """
 
-    # Static cache of pre-renderer tiles
-    tile_cache: dict[tuple[Any, ...], Any] = {}
+    # Static cache of pre-rendered tiles and of their atlases, bounded in
+    # size and optionally backed by an atlas file shared between processes
+    tile_cache: TileCache = TileCache()
 
     def __init__(self, width: int, height: int):
         assert width >= 3
@@ -34,6 +27,10 @@ class Grid:
 
         self.grid: list[WorldObj | None] = [None] * (width * height)
 
+        # Flat indices of the cells changed through set, only tracked once a
+        # renderer asks for it by assigning a set
+        self.dirty: set[int] | None = None
+
     def __contains__(self, key: Any) -> bool:
         if isinstance(key, WorldObj):
             for e in self.grid:
@@ -70,6 +67,8 @@ class Grid:
             0 <= j < self.height
         ), f"row index {j} outside of grid of height {self.height}"
         self.grid[j * self.width + i] = v
+        if self.dirty is not None:
+            self.dirty.add(j * self.width + i)
 
     def get(self, i: int, j: int) -> WorldObj | None:
         assert 0 <= i < self.width
@@ -155,47 +154,15 @@ class Grid:
         Render a tile and cache the result
         """
 
-        # Hash map lookup key for the cache
-        key: tuple[Any, ...] = (agent_dir, highlight, tile_size)
-        key = obj.encode() + key if obj else key
-
-        if key in cls.tile_cache:
-            return cls.tile_cache[key]
-
-        img = np.zeros(
-            shape=(tile_size * subdivs, tile_size * subdivs, 3), dtype=np.uint8
-        )
-
-        # Draw the grid lines (top and left edges)
-        fill_coords(img, point_in_rect(0, 0.031, 0, 1), (100, 100, 100))
-        fill_coords(img, point_in_rect(0, 1, 0, 0.031), (100, 100, 100))
-
-        if obj is not None:
-            obj.render(img)
-
-        # Overlay the agent on top
-        if agent_dir is not None:
-            tri_fn = point_in_triangle(
-                (0.12, 0.19),
-                (0.87, 0.50),
-                (0.12, 0.81),
-            )
-
-            # Rotate the agent based on its direction
-            tri_fn = rotate_fn(tri_fn, cx=0.5, cy=0.5, theta=0.5 * math.pi * agent_dir)
-            fill_coords(img, tri_fn, (255, 0, 0))
+        return cls.tile_cache.get(obj, agent_dir, highlight, tile_size, subdivs)
 
-        # Highlight the cell if needed
-        if highlight:
-            highlight_img(img)
-
-        # Downsample the image to perform supersampling/anti-aliasing
-        img = downsample(img, subdivs)
-
-        # Cache the rendered tile
-        cls.tile_cache[key] = img
+    @classmethod
+    def tile_atlas(cls, tile_size: int = TILE_PIXELS, subdivs: int = 3) -> TileAtlas:
+        """
+        Shared atlas of a tile size, built on first use
+        """
 
-        return img
+        return cls.tile_cache.atlas(tile_size, subdivs)
 
     def render(
         self,
@@ -212,38 +179,22 @@ class Grid:
         :param tile_size: tile size in pixels
         """
 
-        if highlight_mask is None:
-            highlight_mask = np.zeros(shape=(self.width, self.height), dtype=bool)
-
-        # Compute the total grid size
-        width_px = self.width * tile_size
-        height_px = self.height * tile_size
-
-        img = np.zeros(shape=(height_px, width_px, 3), dtype=np.uint8)
-
-        # Render the grid
-        for j in range(0, self.height):
-            for i in range(0, self.width):
-                cell = self.get(i, j)
-
-                agent1_here = np.array_equal(agent1_pos, (i, j))
-                agent2_here = np.array_equal(agent2_pos, (i, j))
-
-                assert highlight_mask is not None
-                tile_img = Grid.render_tile(
-                    cell,
-                    agent_dir=agent1_dir if (agent1_here or agent2_here) else None,
-                    highlight=highlight_mask[i, j],
-                    tile_size=tile_size,
-                )
-
-                ymin = j * tile_size
-                ymax = (j + 1) * tile_size
-                xmin = i * tile_size
-                xmax = (i + 1) * tile_size
-                img[ymin:ymax, xmin:xmax, :] = tile_img
-
-        return img
+        # Agents without a direction are not drawn
+        agents = [
+            (pos, d) for pos, d in ((agent1_pos, agent1_dir), (agent2_pos, agent2_dir)) if d is not None
+        ]
+        agent_pos = np.array([[pos for pos, _ in agents]], dtype=np.int64).reshape(1, -1, 2)
+        agent_dir = np.array([[d for _, d in agents]], dtype=np.int64).reshape(1, -1)
+
+        # Tile ID of every cell, then the whole image in one gather
+        atlas = Grid.tile_atlas(tile_size)
+        ids = atlas.tile_ids(
+            self.encode()[None],
+            agent_pos,
+            agent_dir,
+            None if highlight_mask is None else highlight_mask[None],
+        )
+        return atlas.render(ids)[0]
 
     def encode(self, vis_mask: np.ndarray | None = None) -> np.ndarray:
         """
@@ -293,40 +244,262 @@ class Grid:
         return grid, vis_mask
 
     def process_vis(self, agent_pos: tuple[int, int]) -> np.ndarray:
-        mask = np.zeros(shape=(self.width, self.height), dtype=bool)
+        see_through = np.array(
+            [cell is None or cell.see_behind() for cell in self.grid], dtype=bool
+        ).reshape(self.height, self.width)
+        mask = _propagate_vis(see_through, agent_pos)
+
+        # Clear the cells out of sight directly in the list
+        hidden = np.flatnonzero(~mask.T).tolist()
+        for idx in hidden:
+            self.grid[idx] = None
+        if self.dirty is not None:
+            self.dirty.update(hidden)
 
-        mask[agent_pos[0], agent_pos[1]] = True
+        return mask
 
-        for j in reversed(range(0, self.height)):
-            for i in range(0, self.width - 1):
-                if not mask[i, j]:
-                    continue
+# Encodings written into an ArrayGrid for empty cells and for the walls
+# that surround a slice taken past the edge of the grid
+EMPTY_CELL = (OBJECT_TO_IDX["empty"], 0, 0)
+WALL_CELL = (OBJECT_TO_IDX["wall"], COLOR_TO_IDX["grey"], 0)
 
-                cell = self.get(i, j)
-                if cell and not cell.see_behind():
-                    continue
 
-                mask[i + 1, j] = True
-                if j > 0:
-                    mask[i + 1, j - 1] = True
-                    mask[i, j - 1] = True
+class ArrayGrid(Grid):
+    """
+    Grid whose source of truth is a compact (width, height, 3) uint8 array
+    of (type, color, state) triples, laid out like the output of encode.
+    WorldObj instances are only created when a cell is requested through get
+    """
 
-            for i in reversed(range(1, self.width)):
-                if not mask[i, j]:
-                    continue
+    def __init__(self, width: int, height: int):
+        assert width >= 3
+        assert height >= 3
 
-                cell = self.get(i, j)
-                if cell and not cell.see_behind():
-                    continue
+        self.width: int = width
+        self.height: int = height
+
+        self.array: np.ndarray = np.empty((width, height, 3), dtype=np.uint8)
+        self.array[:, :] = EMPTY_CELL
+
+        # Objects handed out by get or stored through set, keyed by flat index
+        self._objs: dict[int, WorldObj] = {}
+
+        self.dirty: set[int] | None = None
+
+    @classmethod
+    def from_array(cls, array: np.ndarray) -> ArrayGrid:
+        """
+        Build a grid that takes ownership of an existing encoding
+        """
+
+        width, height, channels = array.shape
+        assert channels == 3
+
+        grid = cls.__new__(cls)
+        grid.width = width
+        grid.height = height
+        grid.array = np.ascontiguousarray(array, dtype=np.uint8)
+        grid._objs = {}
+        grid.dirty = None
+        return grid
+
+    @property
+    def grid(self) -> list[WorldObj | None]:
+        """
+        Row-major list of cells, materialized on demand for code written
+        against the list-backed Grid
+        """
 
-                mask[i - 1, j] = True
-                if j > 0:
-                    mask[i - 1, j - 1] = True
-                    mask[i, j - 1] = True
+        return [self.get(i, j) for j in range(self.height) for i in range(self.width)]
 
-        for j in range(0, self.height):
-            for i in range(0, self.width):
-                if not mask[i, j]:
-                    self.set(i, j, None)
+    def _sync(self):
+        # Doors are the only objects whose encoding changes in place
+        for idx, v in self._objs.items():
+            if v.type == "door":
+                self.array[idx % self.width, idx // self.width] = v.encode()
+
+    def __contains__(self, key: Any) -> bool:
+        if isinstance(key, WorldObj):
+            return any(v is key for v in self._objs.values())
+        elif isinstance(key, tuple):
+            color, obj_type = key
+            match = self.array[:, :, 0] == OBJECT_TO_IDX[obj_type]
+            if color is not None:
+                match &= self.array[:, :, 1] == COLOR_TO_IDX[color]
+            return bool(match.any())
+        return False
+
+    def set(self, i: int, j: int, v: WorldObj | None):
+        assert (
+            0 <= i < self.width
+        ), f"column index {j} outside of grid of width {self.width}"
+        assert (
+            0 <= j < self.height
+        ), f"row index {j} outside of grid of height {self.height}"
+        idx = j * self.width + i
+        if v is None:
+            self.array[i, j] = EMPTY_CELL
+            self._objs.pop(idx, None)
+        else:
+            self.array[i, j] = v.encode()
+            self._objs[idx] = v
+        if self.dirty is not None:
+            self.dirty.add(idx)
+
+    def get(self, i: int, j: int) -> WorldObj | None:
+        assert 0 <= i < self.width
+        assert 0 <= j < self.height
+        idx = j * self.width + i
+        v = self._objs.get(idx)
+        if v is None:
+            type_idx, color_idx, state = self.array[i, j]
+            v = WorldObj.decode(type_idx, color_idx, state)
+            if v is not None:
+                self._objs[idx] = v
+        return v
+
+    def horz_wall(
+        self,
+        x: int,
+        y: int,
+        length: int | None = None,
+        obj_type: Callable[[], WorldObj] = Wall,
+    ):
+        if obj_type is not Wall:
+            return super().horz_wall(x, y, length, obj_type)
+        if length is None:
+            length = self.width - x
+        assert 0 <= x and x + length <= self.width and 0 <= y < self.height
+        self.array[x : x + length, y] = WALL_CELL
+        for i in range(x, x + length):
+            self._objs.pop(y * self.width + i, None)
+            if self.dirty is not None:
+                self.dirty.add(y * self.width + i)
+
+    def vert_wall(
+        self,
+        x: int,
+        y: int,
+        length: int | None = None,
+        obj_type: Callable[[], WorldObj] = Wall,
+    ):
+        if obj_type is not Wall:
+            return super().vert_wall(x, y, length, obj_type)
+        if length is None:
+            length = self.height - y
+        assert 0 <= x < self.width and 0 <= y and y + length <= self.height
+        self.array[x, y : y + length] = WALL_CELL
+        for j in range(y, y + length):
+            self._objs.pop(j * self.width + x, None)
+            if self.dirty is not None:
+                self.dirty.add(j * self.width + x)
+
+    def rotate_left(self) -> ArrayGrid:
+        """
+        Rotate the grid to the left (counter-clockwise)
+        """
+
+        self._sync()
+        return ArrayGrid.from_array(np.rot90(self.array, k=-1).copy())
+
+    def slice(self, topX: int, topY: int, width: int, height: int) -> ArrayGrid:
+        """
+        Get a subset of the grid, cells outside of it are walls
+        """
+
+        self._sync()
+        array = np.empty((width, height, 3), dtype=np.uint8)
+
+        x0, x1 = max(topX, 0), min(topX + width, self.width)
+        y0, y1 = max(topY, 0), min(topY + height, self.height)
+        if x0 >= x1 or y0 >= y1:
+            array[:, :] = WALL_CELL
+        else:
+            if x0 > topX or x1 < topX + width or y0 > topY or y1 < topY + height:
+                array[:, :] = WALL_CELL
+            array[x0 - topX : x1 - topX, y0 - topY : y1 - topY] = self.array[
+                x0:x1, y0:y1
+            ]
+
+        return ArrayGrid.from_array(array)
+
+    def encode(self, vis_mask: np.ndarray | None = None) -> np.ndarray:
+        """
+        Produce a compact numpy encoding of the grid
+        """
+
+        self._sync()
+        array = self.array.copy()
+        if vis_mask is not None:
+            array[~vis_mask] = 0
+        return array
+
+    @staticmethod
+    def decode(array: np.ndarray) -> tuple[ArrayGrid, np.ndarray]:
+        """
+        Decode an array grid encoding back into a grid
+        """
+
+        grid = ArrayGrid.from_array(array.copy())
+        vis_mask = grid.array[:, :, 0] != OBJECT_TO_IDX["unseen"]
+        grid.array[~vis_mask] = EMPTY_CELL
+        return grid, vis_mask
+
+    def process_vis(self, agent_pos: tuple[int, int]) -> np.ndarray:
+        self._sync()
+        types = self.array[:, :, 0]
+        opaque = (types == OBJECT_TO_IDX["wall"]) | (
+            (types == OBJECT_TO_IDX["door"]) & (self.array[:, :, 2] != 0)
+        )
+        mask = _propagate_vis(~opaque.T, agent_pos)
+
+        if self.dirty is not None:
+            self.dirty.update(np.flatnonzero(~mask.T).tolist())
+        self.array[~mask] = EMPTY_CELL
+        for idx in [k for k in self._objs if not mask[k % self.width, k // self.width]]:
+            del self._objs[idx]
 
         return mask
+
+
+def _propagate_vis(see_through: np.ndarray, agent_pos: tuple[int, int]) -> np.ndarray:
+    """
+    (width, height) visibility mask from the agent at agent_pos, given the
+    (height, width) cells that can be seen through. The mask is built row by
+    row from the bottom up, as each row seeds the one above it, but each
+    row is swept with array operations and spreads upwards through shifted
+    masks
+    """
+
+    height, width = see_through.shape
+    rows = np.zeros(shape=(height, width), dtype=bool)
+    rows[agent_pos[1], agent_pos[0]] = True
+
+    for j in reversed(range(0, height)):
+        reached = _sweep(rows[j], see_through[j])
+        spread = reached[:-1] & see_through[j, :-1]
+        reached = _sweep(reached[::-1], see_through[j, ::-1])[::-1]
+        back = reached[1:] & see_through[j, 1:]
+        rows[j] = reached
+
+        if j > 0:
+            above = rows[j - 1]
+            above[:-1] |= spread | back
+            above[1:] |= spread | back
+
+    return rows.T.copy()
+
+
+def _sweep(seen: np.ndarray, see_through: np.ndarray) -> np.ndarray:
+    """
+    Spread visibility left to right along a row: a cell is reached when a
+    seen cell lies to its left with only see-through cells in between
+    """
+
+    idx = np.arange(seen.shape[0])
+    last_seen = np.maximum.accumulate(np.where(seen, idx, -1))
+    last_opaque = np.maximum.accumulate(np.where(see_through, -1, idx))
+
+    reached = seen.copy()
+    reached[1:] |= last_seen[:-1] > last_opaque[:-1]
+    return reached
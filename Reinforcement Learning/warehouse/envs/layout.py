@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import numpy as np
+
+from minigrid.core.constants import OBJECT_TO_IDX, STATE_TO_IDX
+from warehouse.envs.grid import Grid
+
+# (dx, dy) of the movement actions, in action order: left, right, up, down, stay
+ACTION_TO_VEC = np.array([(-1, 0), (1, 0), (0, -1), (0, 1), (0, 0)], dtype=np.int64)
+
+# Object types an agent can walk onto, doors only when open
+OVERLAP_TYPES = ("empty", "goal", "floor", "lava")
+
+
+class Layout:
+    """
+    Static layout of a grid compiled into integer lookup tables over flat
+    cell indices (j * width + i):
+
+    next_cell[c, a] is the cell an agent in cell c ends up in after action
+    a, which is c itself when the move is blocked, and hits_goal[c, a]
+    tells whether the cell in front of the agent is the goal, the test
+    stepN uses to terminate.
+
+    wall masks the walls, the part of the layout agents see, and plain
+    tells whether the grid holds nothing but walls and goals.
+    """
+
+    def __init__(self, width: int, height: int, blocked: np.ndarray, goal: np.ndarray,
+                 wall: np.ndarray | None = None, plain: bool = False):
+        self.width = width
+        self.height = height
+        self.n_cells = width * height
+        self.n_actions = len(ACTION_TO_VEC)
+
+        # (height, width) masks
+        self.blocked = blocked
+        self.goal = goal
+        self.wall = blocked if wall is None else wall
+        self.plain = plain
+
+        cells = np.arange(self.n_cells)
+        y, x = np.divmod(cells, width)
+        fx = x[:, None] + ACTION_TO_VEC[:, 0]
+        fy = y[:, None] + ACTION_TO_VEC[:, 1]
+        inside = (fx >= 0) & (fx < width) & (fy >= 0) & (fy < height)
+        fwd = np.where(inside, fy * width + fx, cells[:, None])
+
+        self.hits_goal = inside & goal.ravel()[fwd]
+        self.next_cell = np.where(inside & ~blocked.ravel()[fwd], fwd, cells[:, None])
+
+    @property
+    def free_cells(self) -> np.ndarray:
+        """
+        Flat indices of the cells an agent can stand on
+        """
+
+        return np.flatnonzero(~self.blocked.ravel())
+
+
+def compile_layout(grid: Grid) -> Layout:
+    """
+    Compile the static content of a grid (walls, doors, goals) into a Layout
+    """
+
+    array = grid.encode()
+    types = array[:, :, 0].T
+    states = array[:, :, 2].T
+
+    walkable = np.isin(types, [OBJECT_TO_IDX[t] for t in OVERLAP_TYPES]) | (
+        (types == OBJECT_TO_IDX["door"]) & (states == STATE_TO_IDX["open"])
+    )
+    goal = types == OBJECT_TO_IDX["goal"]
+    wall = types == OBJECT_TO_IDX["wall"]
+    plain = bool((goal | wall | (types == OBJECT_TO_IDX["empty"])).all())
+
+    return Layout(grid.width, grid.height, ~walkable, goal, wall, plain)
+
+
+def resolve_moves(
+    occupancy: np.ndarray, cells: np.ndarray, targets: np.ndarray, shared: np.ndarray | None = None
+) -> np.ndarray:
+    """
+    Resolve the agent-agent conflicts of a joint move and apply it to the
+    occupancy, a flat array holding, per cell, the index + 1 of the agent
+    standing in it (0 when free). cells are the flat cells of the agents
+    and targets the cells they move to, their own cell when they stay.
+    Cells marked in shared (the goal) take any number of agents and are
+    left at 0 in the occupancy.
+
+    Every rule is deterministic and checked with lookups in the occupancy
+    rather than by comparing agent pairs:
+
+    - an agent cannot enter the cell of an agent that stays
+    - two agents cannot swap cells
+    - of several agents moving to the same cell, the lowest index wins
+
+    A blocked agent stays where it is, which can in turn block the agents
+    moving into its cell, so the checks repeat until no agent is blocked.
+    Returns the cells the agents end up in.
+    """
+
+    targets = targets.copy()
+    moving = targets != cells
+    movers = np.flatnonzero(moving)
+    while len(movers):
+        fwd = targets[movers]
+
+        # Agent in the target cell, which must leave it and not towards us.
+        # Shared cells are always free in the occupancy
+        other = occupancy[fwd] - 1
+        blocked = (other >= 0) & (~moving[other] | (targets[other] == cells[movers]))
+
+        # Same target: movers come in index order, the first of each run of
+        # equal targets keeps its move
+        order = np.argsort(fwd, kind="stable")
+        fwd_sorted = fwd[order]
+        same = order[1:][fwd_sorted[1:] == fwd_sorted[:-1]]
+        if len(same):
+            if shared is not None:
+                same = same[~shared[fwd[same]]]
+            blocked[same] = True
+
+        if not blocked.any():
+            break
+        stopped = movers[blocked]
+        targets[stopped] = cells[stopped]
+        moving[stopped] = False
+        movers = movers[~blocked]
+
+    occupancy[cells[movers]] = 0
+    if shared is not None:
+        movers = movers[~shared[targets[movers]]]
+    occupancy[targets[movers]] = movers + 1
+    return targets
@@ -11,13 +11,22 @@ import numpy as np
 from gymnasium import spaces
 
 from minigrid.core.constants import COLOR_NAMES, DIR_TO_VEC, TILE_PIXELS
-from warehouse.envs.grid import Grid
+from warehouse.envs.grid import ArrayGrid, Grid
+from warehouse.envs.layout import ACTION_TO_VEC, Layout, compile_layout, resolve_moves
+from warehouse.envs.rendering import FrameRenderer
+from warehouse.envs.views import goal_view_table
 from minigrid.core.mission import MissionSpace
-from minigrid.core.world_object import Point, WorldObj
+from minigrid.core.world_object import Point, Wall, WorldObj
 from minigrid.utils.window import Window
 
 T = TypeVar("T")
 
+# Direction vectors as a (4, 2) array, indexed by agent direction
+DIR_VECS = np.array(DIR_TO_VEC)
+
+# Wall standing for every wall cell of the grid views read from a view table
+VIEW_WALL = Wall()
+
 
 class MiniGridEnvMod(gym.Env):
     """
@@ -49,10 +58,18 @@ class MiniGridEnvMod(gym.Env):
         max_steps: int = 100,
         see_through_walls: bool = False,
         agent_view_size: int = 7,
+        n_agents: int = 2,
+        agent_collisions: bool = True,
         render_mode: str | None = None,
         highlight: bool = True,
         tile_size: int = TILE_PIXELS,
         agent_pov: bool = False,
+        atlas_render: bool = False,
+        array_grid: bool = False,
+        fast_step: bool = False,
+        obs_mode: str = "grid",
+        obs_dtype: np.dtype = np.float32,
+        view_cache_dir: str | None = None,
     ):
         # Initialize mission
         self.mission = mission_space.sample()
@@ -110,14 +127,27 @@ class MiniGridEnvMod(gym.Env):
 
         self.see_through_walls = see_through_walls
 
-        # Current position and direction of the agent
-        self.agent1_pos: np.ndarray | tuple[int, int] = None
-        self.agent1_dir: int = None
-        self.agent2_pos: np.ndarray | tuple[int, int] = None
-        self.agent2_dir: int = None
+        # Current position and direction of every agent, one row per agent.
+        # Agent k (1-based, as in stepN) is row k - 1
+        assert n_agents >= 1
+        self.n_agents = n_agents
+        self.agent_pos: np.ndarray = np.full((n_agents, 2), -1, dtype=np.int64)
+        self.agent_dir: np.ndarray = np.full(n_agents, -1, dtype=np.int64)
+
+        # Occupancy layer: agentN of the agent in each cell, 0 when free, as a
+        # flat (height * width) array kept in sync by the steps. Agents
+        # cannot walk through each other, except on the goal cells, which
+        # hold any number of them and stay at 0. None without collisions
+        self.agent_collisions = agent_collisions
+        self.occupancy: np.ndarray | None = None
+        self._shared_cells: np.ndarray | None = None
+
+        # Grid implementation, the array-backed one keeps cells as a uint8
+        # encoding so slicing and encoding run as array operations
+        self.grid_cls = ArrayGrid if array_grid else Grid
 
         # Current grid and mission and carrying
-        self.grid = Grid(width, height)
+        self.grid = self.grid_cls(width, height)
         self.carrying = None
 
         # Rendering attributes
@@ -126,36 +156,91 @@ class MiniGridEnvMod(gym.Env):
         self.tile_size = tile_size
         self.agent_pov = agent_pov
 
+        # Frame buffer of the full render, only dirty tiles are repainted
+        self.frame_renderer = FrameRenderer()
+
+        # Render full frames from a tile ID map with one gather from a
+        # TileAtlas instead, into a frame buffer reused across calls
+        self.atlas_render = atlas_render
+        self._atlas_frame: np.ndarray | None = None
+
+        # Use the table-driven stepN, positions are then kept as plain int tuples
+        self.fast_step = fast_step
+
+        # Transition tables of the static layout, compiled lazily after a
+        # reset; the fast stepN reads them as nested lists
+        self.layout: Layout | None = None
+        self._layout_tables = None
+
+        # Optional trajectory recorder, called on every reset, stepN and step_all
+        self.recorder = None
+
+        # Observation mode: "grid" returns the sliced WorldObj lists, "state"
+        # returns each agent's view already encoded as -1 (wall), 0 (empty)
+        # and 1 (goal), written into preallocated arrays
+        assert obs_mode in ("grid", "state"), f"Unknown obs_mode: {obs_mode}"
+        self.obs_mode = obs_mode
+
+        # Two slots per agent, written alternately, so the state returned by
+        # the previous step stays valid while the next one is generated
+        self._state_buf = np.zeros((n_agents, 2, agent_view_size ** 2), dtype=obs_dtype)
+        self._state_slot = [0] * n_agents
+
+        # Observation of every agent, only the entries of the agent that
+        # moved are regenerated by a step
+        self._obs: dict | None = None
+
+        # Encoded view of every cell, built lazily after a reset from the
+        # static views of the layout (see views.view_table) with the goals
+        # drawn over them, and the goals as (x, y, goal). The static views
+        # are computed once per layout and process, and once for all
+        # processes with view_cache_dir, where they are kept on disk
+        self.view_cache_dir = view_cache_dir
+        self._view_table: np.ndarray | None = None
+        self._goals: list | None = None
+
+        # Offset from the agent to the world cell shown at (vis_i, vis_j) of
+        # its view, per facing direction: the agent sits at the centre of the
+        # view, as in gen_obs_grid, with the cells in front of it in the rows
+        # above. Shape (4, view, view, 2)
+        pad = agent_view_size // 2
+        vis_i, vis_j = np.meshgrid(np.arange(agent_view_size), np.arange(agent_view_size), indexing="ij")
+        f_vec = DIR_VECS[:, None, None, :]
+        r_vec = np.stack((-f_vec[..., 1], f_vec[..., 0]), axis=-1)
+        self._view_offsets_by_dir = (
+            f_vec * (pad - vis_j)[..., None] + r_vec * (vis_i - pad)[..., None]
+        )
+
     def reset(self, *, seed=None, options=None):
         super().reset(seed=seed)
 
         # Reinitialize episode-specific variables
-        self.agent1_pos = (-1, -1)
-        self.agent1_dir = -1
-        self.agent2_pos = (-1, -1)
-        self.agent2_dir = -1
+        self.agent_pos.fill(-1)
+        self.agent_dir.fill(-1)
+        self.occupancy = None
 
         # Generate a new random grid at the start of each episode
         self._gen_grid(self.width, self.height)
+        self._view_table = None
+        self._obs = None
+        self.layout = None
+        self._layout_tables = None
+        self.frame_renderer.invalidate()
 
         # These fields should be defined by _gen_grid
-        assert (
-            self.agent1_pos >= (0, 0)
-            if isinstance(self.agent1_pos, tuple)
-            else all(self.agent1_pos >= 0) and self.agent1_dir >= 0
-        )
-
-        assert (
-            self.agent2_pos >= (0, 0)
-            if isinstance(self.agent2_pos, tuple)
-            else all(self.agent2_pos >= 0) and self.agent2_dir >= 0
-        )
+        assert (self.agent_pos >= 0).all() and (self.agent_dir >= 0).all()
 
         # Check that the agents don't overlap with an object
-        start_cell1 = self.grid.get(*self.agent1_pos)
-        assert start_cell1 is None or start_cell1.can_overlap()
-        start_cell2 = self.grid.get(*self.agent2_pos)
-        assert start_cell2 is None or start_cell2.can_overlap()
+        for x, y in self.agent_pos.tolist():
+            start_cell = self.grid.get(x, y)
+            assert start_cell is None or start_cell.can_overlap()
+
+        # and, outside of the goal, with each other
+        if self.agent_collisions:
+            cells = self.sync_occupancy()
+            assert (
+                (self.occupancy[cells] == np.arange(1, self.n_agents + 1)) | self._shared_cells[cells]
+            ).all(), "Agents overlap outside of the goal"
 
         # Item picked up, being carried, initially nothing
         self.carrying = None
@@ -169,15 +254,38 @@ class MiniGridEnvMod(gym.Env):
         # Return first observation
         obs = self.gen_obs()
 
+        if self.recorder is not None:
+            self.recorder.record_reset(self)
+
         return obs
 
+    def set_grid(self, grid):
+        """
+        Put another grid in place of the current one, e.g. a recorded one,
+        and rebuild what is compiled from it: the layout, the view table and
+        the occupancy layer. The agents are expected at their positions on
+        the new grid already
+        """
+
+        self.grid = grid
+        self.width, self.height = grid.width, grid.height
+        self.layout = None
+        self._layout_tables = None
+        self._obs = None
+        self.frame_renderer.invalidate()
+
+        self.get_layout()
+        self.load_views()
+        if self.agent_collisions:
+            self.sync_occupancy()
+
     def hash(self, size=16):
         """Compute a hash that uniquely identifies the current state of the environment.
         :param size: Size of the hashing
         """
         sample_hash = hashlib.sha256()
 
-        to_encode = [self.grid.encode().tolist(), self.agent_pos, self.agent_dir]
+        to_encode = [self.grid.encode().tolist(), self.agent_pos.tolist(), self.agent_dir.tolist()]
         for item in to_encode:
             sample_hash.update(str(item).encode("utf8"))
 
@@ -209,17 +317,16 @@ class MiniGridEnvMod(gym.Env):
         # Map agent's direction to short string
         AGENT_DIR_TO_STR = {0: ">", 1: "V", 2: "<", 3: "^"}
 
+        # Direction of the agent in each occupied cell, the first agent wins
+        agents = dict(zip(map(tuple, self.agent_pos.tolist()[::-1]), self.agent_dir.tolist()[::-1]))
+
         str = ""
 
         for j in range(self.grid.height):
 
             for i in range(self.grid.width):
-                if i == self.agent1_pos[0] and j == self.agent1_pos[1]:
-                    str += 2 * AGENT_DIR_TO_STR[self.agent1_dir]
-                    continue
-
-                if i == self.agent2_pos[0] and j == self.agent2_pos[1]:
-                    str += 2 * AGENT_DIR_TO_STR[self.agent2_dir]
+                if (i, j) in agents:
+                    str += 2 * AGENT_DIR_TO_STR[agents[i, j]]
                     continue
 
                 c = self.grid.get(i, j)
@@ -364,10 +471,8 @@ class MiniGridEnvMod(gym.Env):
             if self.grid.get(*pos) is not None:
                 continue
 
-            # Don't place the object where the agent is
-            if np.array_equal(pos, self.agent1_pos):
-                continue
-            if np.array_equal(pos, self.agent2_pos):
+            # Don't place the object where an agent is
+            if (self.agent_pos == pos).all(axis=1).any():
                 continue
 
             # Check if there is a filtering criterion
@@ -393,203 +498,291 @@ class MiniGridEnvMod(gym.Env):
         obj.init_pos = (i, j)
         obj.cur_pos = (i, j)
 
-    def place_agent1(self, top=None, size=None, rand_dir=True, max_tries=math.inf):
+    def place_agent(self, agentN: int, top=None, size=None, rand_dir=True, max_tries=math.inf):
         """
-        Set the agent's starting point at an empty position in the grid
+        Set the starting point of agent agentN (1-based) at an empty
+        position in the grid
         """
 
-        self.agent1_pos = (-1, -1)
+        k = agentN - 1
+        self.agent_pos[k] = -1
         pos = self.place_obj(None, top, size, max_tries=max_tries)
-        self.agent1_pos = pos
+        self.agent_pos[k] = pos
 
         if rand_dir:
-            self.agent1_dir = self._rand_int(0, 4)
+            self.agent_dir[k] = self._rand_int(0, 4)
 
         return pos
 
-    def place_agent2(self, top=None, size=None, rand_dir=True, max_tries=math.inf):
-        """
-        Set the agent's starting point at an empty position in the grid
-        """
-
-        self.agent2_pos = (-1, -1)
-        pos = self.place_obj(None, top, size, max_tries=max_tries)
-        self.agent2_pos = pos
+    # Two-agent accessors, kept for the code written against the original
+    # environment, which had named variables for both robots
 
-        if rand_dir:
-            self.agent2_dir = self._rand_int(0, 4)
+    @property
+    def agent1_pos(self) -> tuple[int, int]:
+        return tuple(self.agent_pos[0].tolist())
 
-        return pos
+    @agent1_pos.setter
+    def agent1_pos(self, pos):
+        self.agent_pos[0] = pos
+        if self.occupancy is not None:
+            self.sync_occupancy()
 
     @property
-    def dir_vec1(self):
-        """
-        Get the direction vector for the agent, pointing in the direction
-        of forward movement.
-        """
+    def agent2_pos(self) -> tuple[int, int]:
+        return tuple(self.agent_pos[1].tolist())
 
-        assert (
-            self.agent1_dir >= 0 and self.agent1_dir < 4
-        ), f"Invalid agent_dir: {self.agent1_dir} is not within range(0, 4)"
-        return DIR_TO_VEC[self.agent1_dir]
+    @agent2_pos.setter
+    def agent2_pos(self, pos):
+        self.agent_pos[1] = pos
+        if self.occupancy is not None:
+            self.sync_occupancy()
 
     @property
-    def dir_vec2(self):
-        """
-        Get the direction vector for the agent, pointing in the direction
-        of forward movement.
-        """
+    def agent1_dir(self) -> int:
+        return int(self.agent_dir[0])
 
-        assert (
-                self.agent2_dir >= 0 and self.agent2_dir < 4
-        ), f"Invalid agent_dir: {self.agent2_dir} is not within range(0, 4)"
-        return DIR_TO_VEC[self.agent2_dir]
+    @agent1_dir.setter
+    def agent1_dir(self, agent_dir):
+        self.agent_dir[0] = agent_dir
 
     @property
-    def right_vec1(self):
-        """
-        Get the vector pointing to the right of the agent.
-        """
+    def agent2_dir(self) -> int:
+        return int(self.agent_dir[1])
 
-        dx, dy = self.dir_vec1
-        return np.array((-dy, dx))
+    @agent2_dir.setter
+    def agent2_dir(self, agent_dir):
+        self.agent_dir[1] = agent_dir
 
     @property
-    def right_vec2(self):
+    def dir_vec(self) -> np.ndarray:
         """
-        Get the vector pointing to the right of the agent.
+        Get the (N, 2) direction vectors of the agents, pointing in the
+        direction of forward movement.
         """
 
-        dx, dy = self.dir_vec2
-        return np.array((-dy, dx))
+        assert (
+            (self.agent_dir >= 0) & (self.agent_dir < 4)
+        ).all(), f"Invalid agent_dir: {self.agent_dir} is not within range(0, 4)"
+        return DIR_VECS[self.agent_dir]
 
     @property
-    def front_pos1(self):
+    def right_vec(self) -> np.ndarray:
         """
-        Get the position of the cell that is right in front of the agent
+        Get the (N, 2) vectors pointing to the right of the agents.
         """
 
-        return self.agent1_pos + self.dir_vec1
+        dx, dy = self.dir_vec.T
+        return np.stack((-dy, dx), axis=1)
 
     @property
-    def front_pos2(self):
+    def front_pos(self) -> np.ndarray:
         """
-        Get the position of the cell that is right in front of the agent
+        Get the (N, 2) positions of the cells right in front of the agents
         """
 
-        return self.agent2_pos + self.dir_vec2
+        return self.agent_pos + self.dir_vec
 
     def get_view_coords(self, i, j):
         """
-        Translate and rotate absolute grid coordinates (i, j) into the
+        Translate and rotate absolute grid coordinates (i, j) into each
         agent's partially observable view (sub-grid). Note that the resulting
         coordinates may be negative or outside of the agent's view size.
+        Returns two (N,) arrays
         """
 
-        ax1, ay1 = self.agent1_pos
-        dx1, dy1 = self.dir_vec1
-        rx1, ry1 = self.right_vec1
-
-        ax2, ay2 = self.agent2_pos
-        dx2, dy2 = self.dir_vec2
-        rx2, ry2 = self.right_vec2
+        ax, ay = self.agent_pos.T
+        dx, dy = self.dir_vec.T
+        rx, ry = self.right_vec.T
 
         # Compute the absolute coordinates of the top-left view corner
         sz = self.agent_view_size
         hs = self.agent_view_size // 2
-        tx1 = ax1 + (dx1 * (sz - 1)) - (rx1 * hs)
-        ty1 = ay1 + (dy1 * (sz - 1)) - (ry1 * hs)
-        tx2 = ax2 + (dx2 * (sz - 1)) - (rx2 * hs)
-        ty2 = ay2 + (dy2 * (sz - 1)) - (ry2 * hs)
+        tx = ax + (dx * (sz - 1)) - (rx * hs)
+        ty = ay + (dy * (sz - 1)) - (ry * hs)
 
-        lx1 = i - tx1
-        ly1 = j - ty1
-        lx2 = i - tx2
-        ly2 = j - ty2
+        lx = i - tx
+        ly = j - ty
 
         # Project the coordinates of the object relative to the top-left
         # corner onto the agent's own coordinate system
-        vx1 = rx1 * lx1 + ry1 * ly1
-        vy1 = -(dx1 * lx1 + dy1 * ly1)
-
-        vx2 = rx2 * lx2 + ry2 * ly2
-        vy2 = -(dx2 * lx2 + dy2 * ly2)
+        vx = rx * lx + ry * ly
+        vy = -(dx * lx + dy * ly)
 
-        return vx1, vy1, vx2, vy2
+        return vx, vy
 
     def get_view_exts(self, agent_view_size=None):
         """
-        Get the extents of the square set of tiles visible to the agent
+        Get the extents of the square set of tiles visible to each agent,
+        as an (N, 4) array of (topX, topY, botX, botY) rows
         Note: the bottom extent indices are not included in the set
         if agent_view_size is None, use self.agent_view_size
         """
 
         agent_view_size = agent_view_size or self.agent_view_size
 
-        topX1 = self.agent1_pos[0] - agent_view_size // 2
-        topY1 = self.agent1_pos[1] - agent_view_size // 2
-
-        botX1 = topX1 + agent_view_size - agent_view_size // 2
-        botY1 = topY1 + agent_view_size - agent_view_size // 2
-
-        topX2 = self.agent2_pos[0] - agent_view_size // 2
-        topY2 = self.agent2_pos[1] - agent_view_size // 2
+        top = self.agent_pos - agent_view_size // 2
+        bot = top + agent_view_size - agent_view_size // 2
 
-        botX2 = topX2 + agent_view_size - agent_view_size // 2
-        botY2 = topY2 + agent_view_size - agent_view_size // 2
-
-        return (topX1, topY1, botX1, botY1, topX2, topY2, botX2, botY2)
+        return np.concatenate((top, bot), axis=1)
 
     def relative_coords(self, x, y):
         """
-        Check if a grid position belongs to the agent's field of view, and returns the corresponding coordinates
+        Check if a grid position belongs to each agent's field of view, and
+        returns the corresponding coordinates, None for the agents that do
+        not see it
         """
 
         vx, vy = self.get_view_coords(x, y)
 
-        if vx < 0 or vy < 0 or vx >= self.agent_view_size or vy >= self.agent_view_size:
-            return None
+        sz = self.agent_view_size
+        inside = (vx >= 0) & (vy >= 0) & (vx < sz) & (vy < sz)
 
-        return vx, vy
+        return [(a, b) if ok else None for a, b, ok in zip(vx.tolist(), vy.tolist(), inside.tolist())]
 
     def in_view(self, x, y):
         """
-        check if a grid position is visible to the agent
+        check if a grid position is visible to each agent, as an (N,) array
         """
 
-        return self.relative_coords(x, y) is not None
+        vx, vy = self.get_view_coords(x, y)
+
+        sz = self.agent_view_size
+        return (vx >= 0) & (vy >= 0) & (vx < sz) & (vy < sz)
 
-    def agent_sees(self, x, y):
+    def agent_sees(self, x, y, agentN: int = 1):
         """
-        Check if a non-empty grid position is visible to the agent
+        Check if a non-empty grid position is visible to an agent (1-based,
+        as in stepN), in the view centred on it that gen_obs_grid slices
         """
 
-        coordinates = self.relative_coords(x, y)
-        if coordinates is None:
+        k = agentN - 1
+        ax, ay = self.agent_pos[k].tolist()
+        hs = self.agent_view_size // 2
+        vx, vy = x - ax + hs, y - ay + hs
+        if not (0 <= vx < self.agent_view_size and 0 <= vy < self.agent_view_size):
             return False
-        vx, vy = coordinates
 
-        obs = self.gen_obs()
-
-        obs_grid, _ = Grid.decode(obs["image"])
+        (obs_grid,), vis_masks = self.gen_obs_grid(agents=[k])
         obs_cell = obs_grid.get(vx, vy)
         world_cell = self.grid.get(x, y)
 
         assert world_cell is not None
 
-        return obs_cell is not None and obs_cell.type == world_cell.type
+        return bool(vis_masks[0, vx, vy]) and obs_cell is not None and obs_cell.type == world_cell.type
 
     def stepN(self, action, agentN, reward):
+        if self.recorder is not None:
+            pos = tuple(self.agent_pos[agentN - 1].tolist())
+
+        if self.fast_step:
+            result = self._stepN_fast(action, agentN)
+        else:
+            result = self._stepN_grid(action, agentN)
+
+        if self.recorder is not None:
+            self.recorder.record_step(self, agentN, action, pos, result)
+        return result
+
+    def step_all(self, actions, active=None):
+        """
+        Joint step of all the agents, one action each. active, if given,
+        masks the agents that act; the others, typically the ones that
+        reached the goal, stay in place. The moves are simultaneous, their
+        conflicts resolved for the whole tick at once by resolve_moves, the
+        step counter advances once and the observation of every agent is
+        generated once.
+
+        Returns the observation, the (N,) rewards and terminated flags, the
+        truncated flag of the episode and an info dict whose "active" entry
+        is the mask used
+        """
+
+        actions = np.asarray(actions)
+        if actions.shape != (self.n_agents,):
+            raise ValueError(f"Expected {self.n_agents} actions, got an array of shape {actions.shape}")
+        if actions.min() < 0 or actions.max() >= len(ACTION_TO_VEC):
+            raise ValueError(f"Unknown action in: {actions.tolist()}")
+        if active is None:
+            active = np.ones(self.n_agents, dtype=bool)
+        else:
+            active = np.asarray(active, dtype=bool)
+
+        if self.recorder is not None:
+            pos = self.agent_pos.tolist()
+
+        self.step_count += 1
+
+        cells = self.agent_pos[:, 1] * self.width + self.agent_pos[:, 0]
+        if self.fast_step:
+            # Every move read from the layout tables at once
+            layout = self.get_layout()
+            targets = layout.next_cell[cells, actions]
+            hits_goal = layout.hits_goal[cells, actions]
+        else:
+            targets = cells.copy()
+            hits_goal = np.zeros(self.n_agents, dtype=bool)
+            for k in np.flatnonzero(active).tolist():
+                targets[k], hits_goal[k] = self._target_grid(actions[k], k)
+        targets = np.where(active, targets, cells)
+        terminated = hits_goal & active
+
+        if self.occupancy is not None:
+            targets = resolve_moves(self.occupancy, cells, targets, self._shared_cells)
+        y, x = np.divmod(targets, self.width)
+        self.agent_pos[:, 0] = x
+        self.agent_pos[:, 1] = y
+
+        rewards = np.where(terminated, self._reward(), 0.0)
+        truncated = self.step_count >= self.max_steps
+
+        if self.render_mode == "human":
+            self.render()
+
+        obs = self.gen_obs()
+        info = {"active": active}
+
+        if self.recorder is not None:
+            for k in np.flatnonzero(active).tolist():
+                result = (obs, rewards.item(k), terminated.item(k), truncated, info)
+                self.recorder.record_step(self, k + 1, actions.item(k), tuple(pos[k]), result)
+
+        return obs, rewards, terminated, truncated, info
+
+    def _stepN_grid(self, action, agentN):
         self.step_count += 1
 
         reward = 0
         terminated = False
         truncated = False
 
-        if agentN == 1:
-            agent_pos = self.agent1_pos
-        elif agentN == 2:
-            agent_pos = self.agent2_pos
+        if not 1 <= agentN <= self.n_agents:
+            raise ValueError(f"Unknown agent: {agentN}")
+        x, y = self.agent_pos[agentN - 1].tolist()
+
+        target, hits_goal = self._target_grid(action, agentN - 1)
+        self._move(agentN, y * self.width + x, target)
+
+        if hits_goal:
+            terminated = True
+            reward = self._reward()
+
+        if self.step_count >= self.max_steps:
+            truncated = True
+
+        if self.render_mode == "human":
+            self.render()
+
+        obs = self.gen_obs(agentN)
+
+        return obs, reward, terminated, truncated, {}
+
+    def _target_grid(self, action, k) -> tuple[int, bool]:
+        """
+        Flat index of the cell agent k (0-based) moves to on the grid, the
+        other agents aside, and whether the cell in front of it is the goal
+        """
+
+        agent_pos = self.agent_pos[k]
 
         # Set next cell to the left
         if action == self.actions.left:
@@ -628,133 +821,305 @@ class MiniGridEnvMod(gym.Env):
         else:
             raise ValueError(f"Unknown action: {action}")
 
-        # Move robot
-        if fwd_cell is None or fwd_cell.can_overlap():
-            if agentN == 1:
-                self.agent1_pos = tuple(fwd_pos)
-            elif agentN == 2:
-                self.agent2_pos = tuple(fwd_pos)
+        # Move robot, a blocked move leaves it in its cell
+        if fwd_cell is not None and not fwd_cell.can_overlap():
+            fwd_pos = agent_pos
+        x, y = fwd_pos.tolist()
+
+        return y * self.width + x, fwd_cell is not None and fwd_cell.type == "goal"
+
+    def _move(self, agentN: int, cell: int, target: int):
+        """
+        Move an agent from cell to target (flat indices). It stays in its
+        cell if another agent holds target, which the occupancy tells in O(1)
+        """
+
+        occupancy = self.occupancy
+        if occupancy is not None and target != cell:
+            if occupancy[target]:
+                return
+            occupancy[cell] = 0
+            if not self._shared_cells[target]:
+                occupancy[target] = agentN
+
+        y, x = divmod(target, self.width)
+        self.agent_pos[agentN - 1] = (x, y)
+
+    def sync_occupancy(self) -> np.ndarray:
+        """
+        Rebuild the occupancy layer from the agent positions, for positions
+        set directly rather than by a step. Where agents overlap outside of
+        the goal, the first one holds the cell. Returns the flat cells of
+        the agents
+        """
+
+        self._shared_cells = self.get_layout().goal.ravel()
+        cells = self.agent_pos[:, 1] * self.width + self.agent_pos[:, 0]
+        held = np.flatnonzero(~self._shared_cells[cells])
+        held_cells, first = np.unique(cells[held], return_index=True)
+
+        self.occupancy = np.zeros(self.width * self.height, dtype=np.int64)
+        self.occupancy[held_cells] = held[first] + 1
+        return cells
+
+    def get_layout(self) -> Layout:
+        """
+        Compiled transition tables of the current grid. The layout is
+        assumed static between two resets
+        """
+
+        if self.layout is None:
+            self.layout = compile_layout(self.grid)
+            self._layout_tables = (
+                self.layout.next_cell.tolist(),
+                self.layout.hits_goal.tolist(),
+            )
+        return self.layout
+
+    def _stepN_fast(self, action, agentN):
+        """
+        Same transition as stepN, read from the next-cell and goal tables of
+        the compiled layout on int coordinates, without touching the grid
+        """
+
+        self.step_count += 1
+
+        if not 0 <= action < len(ACTION_TO_VEC):
+            raise ValueError(f"Unknown action: {action}")
+
+        if not 1 <= agentN <= self.n_agents:
+            raise ValueError(f"Unknown agent: {agentN}")
+        k = agentN - 1
+        x, y = self.agent_pos[k].tolist()
+
+        if self._layout_tables is None:
+            self.get_layout()
+        next_cell, hits_goal = self._layout_tables
 
-        if fwd_cell is not None and fwd_cell.type == "goal":
+        # Move robot, a blocked move leaves it in its cell
+        cell = y * self.width + x
+        self._move(agentN, cell, next_cell[cell][action])
+
+        reward = 0
+        terminated = False
+        if hits_goal[cell][action]:
             terminated = True
             reward = self._reward()
 
-        if self.step_count >= self.max_steps:
-            truncated = True
+        truncated = self.step_count >= self.max_steps
 
         if self.render_mode == "human":
             self.render()
 
-        obs = self.gen_obs()
+        obs = self.gen_obs(agentN)
 
         return obs, reward, terminated, truncated, {}
 
-    def gen_obs_grid(self, agent_view_size=None):
+    def gen_obs_grid(self, agent_view_size=None, agents=None):
         """
-        Generate the sub-grid observed by the agent.
-        This method also outputs a visibility mask telling us which grid
-        cells the agent can actually see.
+        Generate the sub-grid observed by each agent, or by the agents of
+        the given (0-based) indices.
+        This method also outputs the visibility masks telling us which grid
+        cells the agents can actually see, as an (N, view, view) array.
         if agent_view_size is None, self.agent_view_size is used
         """
 
-        topX1, topY1, botX1, botY1, topX2, topY2, botX2, botY2 = self.get_view_exts(self.agent_view_size)
-
         agent_view_size = agent_view_size or self.agent_view_size
+        hs = agent_view_size // 2
 
-        grid1 = self.grid.slice(topX1, topY1, agent_view_size, agent_view_size)
-        vis_mask1 = np.ones(shape=(grid1.width, grid1.height), dtype=bool)
+        # Slicing is done per agent anyway, the top-left corners of the
+        # views are computed on the positions as ints
+        pos = self.agent_pos if agents is None else self.agent_pos[agents]
+        grids = [
+            self.grid.slice(x - hs, y - hs, agent_view_size, agent_view_size)
+            for x, y in pos.tolist()
+        ]
+        vis_masks = np.ones(shape=(len(grids), agent_view_size, agent_view_size), dtype=bool)
 
-        grid2 = self.grid.slice(topX2, topY2, agent_view_size, agent_view_size)
-        vis_mask2 = np.ones(shape=(grid2.width, grid2.height), dtype=bool)
+        return grids, vis_masks
 
-        return grid1, vis_mask1, grid2, vis_mask2
+    def load_views(self) -> np.ndarray:
+        """
+        Build the view table of the episode: the static views of the
+        layout with its goals drawn over them, as -1 (wall), 0 (empty) and
+        1 (goal), one row per flat cell
+        """
+
+        layout = self.get_layout()
+        table = goal_view_table(
+            layout.wall, layout.goal, self.agent_view_size, self._state_buf.dtype, self.view_cache_dir
+        )
+
+        gy, gx = np.nonzero(layout.goal)
+        self._view_table = table
+        self._goals = [(x, y, self.grid.get(x, y)) for x, y in zip(gx.tolist(), gy.tolist())]
+        return table
 
-    def gen_obs(self):
+    def gen_state(self, agentN: int) -> np.ndarray:
         """
-        Generate the agent's view (partially observable, low-resolution encoding)
+        Write the encoded view of an agent into its next buffer slot and
+        return it. The array is overwritten two calls later for that agent
         """
 
-        grid1, vis_mask1, grid2, vis_mask2 = self.gen_obs_grid()
+        table = self._view_table if self._view_table is not None else self.load_views()
 
-        obs = {"grid1": grid1.grid, "mask1": vis_mask1, "direction1": self.agent1_dir,
-            "grid2": grid2.grid, "mask2": vis_mask2, "direction2": self.agent2_dir}
+        k = agentN - 1
+        x, y = self.agent_pos[k].tolist()
+        slot = self._state_slot[k] ^ 1
+        self._state_slot[k] = slot
+        state = self._state_buf[k, slot]
+        state[:] = table[y * self.width + x]
+        return state
 
-        return obs
+    def gen_states(self) -> np.ndarray:
+        """
+        Write the encoded views of all the agents into their next buffer
+        slots, looked up in one gather, and return them as an
+        (N, view ** 2) array
+        """
+
+        table = self._view_table if self._view_table is not None else self.load_views()
+
+        agents = np.arange(self.n_agents)
+        slots = np.array(self._state_slot) ^ 1
+        self._state_slot = slots.tolist()
+        states = table[self.agent_pos[:, 1] * self.width + self.agent_pos[:, 0]]
+        self._state_buf[agents, slots] = states
+        return states
+
+    def gen_grid_views(self, agents=None):
+        """
+        Cells seen by each agent, or by the agents of the given (0-based)
+        indices, as the cell lists of the sub-grids of gen_obs_grid, with
+        their visibility masks. On plain layouts (see Layout.plain) the
+        views are read from the view table rather than sliced, every wall
+        being VIEW_WALL
+        """
+
+        if not self.get_layout().plain:
+            grids, vis_masks = self.gen_obs_grid(agents=agents)
+            return [grid.grid for grid in grids], vis_masks
+
+        table = self._view_table if self._view_table is not None else self.load_views()
+        view = self.agent_view_size
+        pad = view // 2
+
+        pos = self.agent_pos if agents is None else self.agent_pos[agents]
+        views = []
+        for x, y in pos.tolist():
+            cells = [VIEW_WALL if v < 0 else None for v in table[y * self.width + x].tolist()]
+            for gx, gy, goal in self._goals:
+                i, j = gx - x + pad, gy - y + pad
+                if 0 <= i < view and 0 <= j < view:
+                    cells[j * view + i] = goal
+            views.append(cells)
+        vis_masks = np.ones(shape=(len(views), view, view), dtype=bool)
+
+        return views, vis_masks
+
+    def gen_obs(self, agentN: int | None = None):
+        """
+        Generate the agents' views (partially observable, low-resolution encoding)
+        When agentN is given only its view is regenerated, the others are
+        kept from the previous call: a view depends on nothing but the static
+        layout and the position of its agent
+        """
 
-    def get_pov_render(self, tile_size):
+        if agentN is not None and self._obs is not None:
+            if self.obs_mode == "state":
+                self._obs[f"state{agentN}"] = self.gen_state(agentN)
+            else:
+                (cells,), vis_masks = self.gen_grid_views(agents=[agentN - 1])
+                self._obs[f"grid{agentN}"] = cells
+                self._obs[f"mask{agentN}"] = vis_masks[0]
+            self._obs[f"direction{agentN}"] = self.agent_dir.item(agentN - 1)
+            return self._obs.copy()
+
+        self._obs = {}
+        directions = self.agent_dir.tolist()
+
+        if self.obs_mode == "state":
+            self.gen_states()
+            for k, slot in enumerate(self._state_slot):
+                self._obs[f"state{k + 1}"] = self._state_buf[k, slot]
+                self._obs[f"direction{k + 1}"] = directions[k]
+        else:
+            views, vis_masks = self.gen_grid_views()
+            for k, cells in enumerate(views):
+                self._obs[f"grid{k + 1}"] = cells
+                self._obs[f"mask{k + 1}"] = vis_masks[k]
+                self._obs[f"direction{k + 1}"] = directions[k]
+
+        return self._obs.copy()
+
+    def get_pov_render(self, tile_size, agentN: int = 1):
         """
-        Render an agent's POV observation for visualization
+        Render the view of an agent (1-based, as in stepN) for
+        visualization, with the agent at its centre
         """
-        grid, vis_mask = self.gen_obs_grid()
+        k = agentN - 1
+        (grid,), vis_masks = self.gen_obs_grid(agents=[k])
 
-        # Render the whole grid
+        # Render the whole sub-grid
+        hs = self.agent_view_size // 2
         img = grid.render(
             tile_size,
-            agent_pos=(self.agent_view_size // 2, self.agent_view_size - 1),
-            agent_dir=3,
-            highlight_mask=vis_mask,
+            agent1_pos=(hs, hs),
+            agent2_pos=None,
+            agent1_dir=self.agent_dir.item(k),
+            highlight_mask=vis_masks[0],
         )
 
         return img
 
-    def get_full_render(self, highlight, tile_size):
+    def gen_highlight_mask(self, vis_masks: np.ndarray | None = None) -> np.ndarray:
         """
-        Render a non-partial observation for visualization
+        (width, height) mask of the cells seen by any agent. vis_masks holds
+        the (N, view, view) visibility masks of the agents, as returned by
+        gen_obs_grid; by default every cell of a view is visible, as
+        gen_obs_grid does not occlude the views
         """
-        # Compute which cells are visible to the agent
-        grid1, vis_mask1, grid2, vis_mask2 = self.gen_obs_grid()
-
-        # Compute the world coordinates of the bottom-left corner
-        # of the agent's view area
-        f_vec1 = self.dir_vec1
-        f_vec2 = self.dir_vec2
-        r_vec1 = self.right_vec1
-        r_vec2 = self.right_vec2
-        top_left1 = (
-            self.agent1_pos
-            + f_vec1 * (self.agent_view_size // 2)
-            - r_vec1 * (self.agent_view_size // 2)
-        )
-        top_left2 = (
-            self.agent2_pos
-            + f_vec2 * (self.agent_view_size // 2)
-            - r_vec2 * (self.agent_view_size // 2)
+
+        # World coordinates of every view cell of every agent, (N, view, view, 2)
+        cells = self.agent_pos[:, None, None, :] + self._view_offsets_by_dir[self.agent_dir]
+        seen = (
+            (cells >= 0).all(axis=3)
+            & (cells[..., 0] < self.width)
+            & (cells[..., 1] < self.height)
         )
+        if vis_masks is not None:
+            seen &= np.asarray(vis_masks, dtype=bool)
 
-        # Mask of which cells to highlight
         highlight_mask = np.zeros(shape=(self.width, self.height), dtype=bool)
+        highlight_mask[cells[seen, 0], cells[seen, 1]] = True
+        return highlight_mask
 
-        # For each cell in the visibility mask
-        for vis_j in range(0, self.agent_view_size):
-            for vis_i in range(0, self.agent_view_size):
-                # If this cell is not visible, don't highlight it
-                if not vis_mask1[vis_i, vis_j] and not vis_mask2[vis_i, vis_j]:
-                    continue
-
-                # Compute the world coordinates of this cell
-                abs_i1, abs_j1 = top_left1 - (f_vec1 * vis_j) + (r_vec1 * vis_i)
-                abs_i2, abs_j2 = top_left2 - (f_vec2 * vis_j) + (r_vec2 * vis_i)
-
-                if (abs_i1 < 0 or abs_i1 >= self.width) and (abs_i2 < 0 or abs_i2 >= self.width):
-                    continue
-                if (abs_j1 < 0 or abs_j1 >= self.height) and (abs_j2 < 0 or abs_j2 >= self.height):
-                    continue
-
-                if (abs_i1 >= 0 and abs_i1 < self.width) and (abs_j1 >= 0 and abs_j1 < self.height):
-                    # Mark this cell to be highlighted
-                    highlight_mask[abs_i1, abs_j1] = True
-                if (abs_i2 >= 0 and abs_i2 < self.width) and (abs_j2 >= 0 and abs_j2 < self.height):
-                    # Mark this cell to be highlighted
-                    highlight_mask[abs_i2, abs_j2] = True
-
-        # Render the whole grid
-        img = self.grid.render(
+    def get_full_render(self, highlight, tile_size):
+        """
+        Render a non-partial observation for visualization
+        """
+        highlight_mask = self.gen_highlight_mask() if highlight else None
+
+        if self.atlas_render:
+            # Whole frame in one gather from the atlas of this tile size
+            atlas = Grid.tile_atlas(tile_size)
+            ids = atlas.tile_ids(
+                self.grid.encode()[None],
+                self.agent_pos[None],
+                self.agent_dir[None],
+                None if highlight_mask is None else highlight_mask[None],
+            )
+            shape = (1, self.height * tile_size, self.width * tile_size, 3)
+            if self._atlas_frame is None or self._atlas_frame.shape != shape:
+                self._atlas_frame = np.empty(shape, dtype=np.uint8)
+            return atlas.render(ids, out=self._atlas_frame)[0]
+
+        # Bring the persistent frame up to date, repainting the dirty tiles
+        img = self.frame_renderer.render(
+            self.grid,
             tile_size,
-            self.agent1_pos,
-            self.agent2_pos,
-            self.agent1_dir,
-            self.agent2_dir,
-            highlight_mask=highlight_mask if highlight else None
+            list(zip(map(tuple, self.agent_pos.tolist()), self.agent_dir.tolist())),
+            highlight_mask=highlight_mask,
         )
 
         return img
@@ -764,6 +1129,7 @@ class MiniGridEnvMod(gym.Env):
         highlight: bool = True,
         tile_size: int = TILE_PIXELS,
         agent_pov: bool = False,
+        agentN: int = 1,
     ):
         """Returns an RGB image corresponding to the whole environment or the agent's point of view.
 
@@ -772,15 +1138,17 @@ class MiniGridEnvMod(gym.Env):
             highlight (bool): If true, the agent's field of view or point of view is highlighted with a lighter gray color.
             tile_size (int): How many pixels will form a tile from the NxM grid.
             agent_pov (bool): If true, the rendered frame will only contain the point of view of the agent.
+            agentN (int): Agent (1-based) whose point of view is rendered with agent_pov.
 
         Returns:
 
             frame (np.ndarray): A frame of type numpy.ndarray with shape (x, y, 3) representing RGB values for the x-by-y pixel image.
+                The full view is the env's persistent frame buffer and is updated in place by the next call.
 
         """
 
         if agent_pov:
-            return self.get_pov_render(tile_size)
+            return self.get_pov_render(tile_size, agentN)
         else:
             return self.get_full_render(highlight, tile_size)
 
@@ -795,7 +1163,7 @@ class MiniGridEnvMod(gym.Env):
             self.window.set_caption(self.mission)
             self.window.show_img(img)
         elif self.render_mode == "rgb_array":
-            return img
+            return img.copy()
 
     def close(self):
         if self.window:
@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import numpy as np
+
+from minigrid.core.constants import TILE_PIXELS
+from warehouse.envs.grid import Grid
+
+
+class FrameRenderer:
+    """
+    Persistent frame buffer for the full view of an environment. Between two
+    frames only the dirty tiles are re-blitted: cells changed through
+    Grid.set, cells an agent left or entered and cells whose highlight
+    changed. A full repaint happens for a new grid, after invalidate or
+    when the tile size changes.
+    """
+
+    def __init__(self):
+        self.frame: np.ndarray | None = None
+        self.tile_size: int | None = None
+
+        self._grid: Grid | None = None
+        self._agents: list[tuple[tuple[int, int], int]] = []
+        self._highlight: np.ndarray | None = None
+
+    def invalidate(self):
+        """
+        Force a full repaint on the next render
+        """
+
+        self.frame = None
+
+    def render(
+        self,
+        grid: Grid,
+        tile_size: int,
+        agents: list[tuple[tuple[int, int], int]],
+        highlight_mask: np.ndarray | None = None,
+    ) -> np.ndarray:
+        """
+        Bring the frame up to date and return it. agents lists the
+        (position, direction) of each agent, the first one wins when two
+        share a cell. The returned array is reused by the next render, so
+        callers that keep frames must copy them.
+        """
+
+        if highlight_mask is None:
+            highlight_mask = np.zeros(shape=(grid.width, grid.height), dtype=bool)
+
+        agents = [((int(pos[0]), int(pos[1])), agent_dir) for pos, agent_dir in agents]
+
+        if (
+            self.frame is None
+            or tile_size != self.tile_size
+            or grid is not self._grid
+            or grid.dirty is None
+        ):
+            self.frame = np.zeros(
+                shape=(grid.height * tile_size, grid.width * tile_size, 3), dtype=np.uint8
+            )
+            self.tile_size = tile_size
+            self._grid = grid
+            dirty = range(grid.width * grid.height)
+        else:
+            dirty = grid.dirty
+            if agents != self._agents:
+                for (i, j), _ in self._agents + agents:
+                    dirty.add(j * grid.width + i)
+            changed = highlight_mask != self._highlight
+            if changed.any():
+                # The mask is indexed [i, j], flat indices are row-major
+                dirty.update(np.flatnonzero(changed.T).tolist())
+
+        # Start tracking the changes made to the grid until the next frame
+        grid.dirty = set()
+
+        agent_dirs: dict[tuple[int, int], int] = {}
+        for pos, agent_dir in agents:
+            agent_dirs.setdefault(pos, agent_dir)
+
+        for idx in dirty:
+            j, i = divmod(idx, grid.width)
+            tile_img = Grid.render_tile(
+                grid.get(i, j),
+                agent_dir=agent_dirs.get((i, j)),
+                highlight=highlight_mask[i, j],
+                tile_size=tile_size,
+            )
+
+            ymin = j * tile_size
+            xmin = i * tile_size
+            self.frame[ymin : ymin + tile_size, xmin : xmin + tile_size, :] = tile_img
+
+        self._agents = agents
+        self._highlight = highlight_mask.copy()
+
+        return self.frame
+
+
+def render_envs(envs: list, tile_size: int = TILE_PIXELS, highlight: bool = True) -> np.ndarray:
+    """
+    Full views of a batch of environments with grids of the same size and
+    the same number of agents, as a (B, height, width, 3) array, rendered
+    from a shared TileAtlas
+    """
+
+    atlas = Grid.tile_atlas(tile_size)
+    encodings = np.stack([env.grid.encode() for env in envs])
+    agent_pos = np.stack([env.agent_pos for env in envs])
+    agent_dir = np.stack([env.agent_dir for env in envs])
+    masks = np.stack([env.gen_highlight_mask() for env in envs]) if highlight else None
+    return atlas.render(atlas.tile_ids(encodings, agent_pos, agent_dir, masks))
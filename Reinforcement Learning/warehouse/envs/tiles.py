@@ -0,0 +1,330 @@
+from __future__ import annotations
+
+import json
+import math
+import os
+from collections import OrderedDict
+from typing import Any, Iterable
+
+import numpy as np
+
+from minigrid.core.constants import COLOR_TO_IDX, OBJECT_TO_IDX, STATE_TO_IDX, TILE_PIXELS
+from minigrid.core.world_object import Goal, Wall, WorldObj
+from minigrid.utils.rendering import (
+    downsample,
+    fill_coords,
+    highlight_img,
+    point_in_rect,
+    point_in_triangle,
+    rotate_fn,
+)
+
+# Objects of the warehouse layouts, None being an empty cell
+WAREHOUSE_OBJECTS = (None, Wall(), Goal())
+
+# Agent directions a tile can show, None when there is no agent
+AGENT_DIRS = (None, 0, 1, 2, 3)
+
+
+def tile_key(
+    obj: WorldObj | None, agent_dir: int | None, highlight: bool, tile_size: int, subdivs: int = 3
+) -> tuple[Any, ...]:
+    key: tuple[Any, ...] = (agent_dir, bool(highlight), tile_size, subdivs)
+    return obj.encode() + key if obj else key
+
+
+def draw_tile(
+    obj: WorldObj | None,
+    agent_dir: int | None = None,
+    highlight: bool = False,
+    tile_size: int = TILE_PIXELS,
+    subdivs: int = 3,
+) -> np.ndarray:
+    """
+    Draw a tile with supersampling
+    """
+
+    img = np.zeros(shape=(tile_size * subdivs, tile_size * subdivs, 3), dtype=np.uint8)
+
+    # Draw the grid lines (top and left edges)
+    fill_coords(img, point_in_rect(0, 0.031, 0, 1), (100, 100, 100))
+    fill_coords(img, point_in_rect(0, 1, 0, 0.031), (100, 100, 100))
+
+    if obj is not None:
+        obj.render(img)
+
+    # Overlay the agent on top
+    if agent_dir is not None:
+        tri_fn = point_in_triangle(
+            (0.12, 0.19),
+            (0.87, 0.50),
+            (0.12, 0.81),
+        )
+
+        # Rotate the agent based on its direction
+        tri_fn = rotate_fn(tri_fn, cx=0.5, cy=0.5, theta=0.5 * math.pi * agent_dir)
+        fill_coords(img, tri_fn, (255, 0, 0))
+
+    # Highlight the cell if needed
+    if highlight:
+        highlight_img(img)
+
+    # Downsample the image to perform supersampling/anti-aliasing. The mean
+    # is float64, truncated to uint8 as it would be when blitted to a frame
+    return downsample(img, subdivs).astype(np.uint8)
+
+
+class TileCache:
+    """
+    Cache of rendered tiles in two layers:
+
+    - an LRU dict of the tiles drawn by this process, bounded by max_bytes
+      so that trying many tile sizes does not grow it without limit
+    - optionally, a read-only atlas file mapped with np.memmap (see save
+      and attach), shared through the page cache by every process that
+      attaches it, so render workers start with the tiles already drawn
+
+    prewarm draws every tile of a set of objects and tile sizes ahead of
+    time. Returned tiles must not be modified.
+
+    The cache also keeps the TileAtlas of each tile size it renders. The
+    atlases share max_bytes with the tiles, and the least recently used
+    ones are dropped first.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 2**20):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._tiles: OrderedDict[tuple[Any, ...], np.ndarray] = OrderedDict()
+        self._shared: dict[tuple[Any, ...], np.ndarray] = {}
+        self._atlas: np.ndarray | None = None
+        self._atlases: OrderedDict[tuple[int, int], TileAtlas] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._shared) + len(self._tiles)
+
+    def __contains__(self, key: tuple[Any, ...]) -> bool:
+        return key in self._shared or key in self._tiles
+
+    def get(
+        self,
+        obj: WorldObj | None,
+        agent_dir: int | None = None,
+        highlight: bool = False,
+        tile_size: int = TILE_PIXELS,
+        subdivs: int = 3,
+    ) -> np.ndarray:
+        key = tile_key(obj, agent_dir, highlight, tile_size, subdivs)
+
+        img = self._shared.get(key)
+        if img is not None:
+            return img
+
+        img = self._tiles.get(key)
+        if img is not None:
+            self._tiles.move_to_end(key)
+            return img
+
+        img = draw_tile(obj, agent_dir, highlight, tile_size, subdivs)
+        img.flags.writeable = False
+        self._tiles[key] = img
+        self.nbytes += img.nbytes
+
+        # Evict the least recently used tiles, but never the new one
+        while self.nbytes > self.max_bytes and len(self._tiles) > 1:
+            _, old = self._tiles.popitem(last=False)
+            self.nbytes -= old.nbytes
+
+        return img
+
+    def prewarm(
+        self,
+        tile_sizes: Iterable[int] = (TILE_PIXELS,),
+        objects: Iterable[WorldObj | None] = WAREHOUSE_OBJECTS,
+        subdivs: int = 3,
+    ) -> int:
+        """
+        Draw every combination of object, agent direction and highlight
+        for the given tile sizes, return the number of tiles cached
+        """
+
+        for tile_size in tile_sizes:
+            for obj in objects:
+                for agent_dir in AGENT_DIRS:
+                    for highlight in (False, True):
+                        self.get(obj, agent_dir, highlight, tile_size, subdivs)
+        return len(self)
+
+    def atlas(self, tile_size: int = TILE_PIXELS, subdivs: int = 3) -> TileAtlas:
+        """
+        TileAtlas of a tile size, built from this cache on first use. An
+        atlas grows as new objects show, so the cap is checked on every
+        call; the atlas returned is never dropped
+        """
+
+        key = (tile_size, subdivs)
+        atlas = self._atlases.get(key)
+        if atlas is None:
+            atlas = self._atlases[key] = TileAtlas(self, tile_size, subdivs)
+        self._atlases.move_to_end(key)
+
+        while len(self._atlases) > 1 and self.nbytes + self.atlas_nbytes > self.max_bytes:
+            self._atlases.popitem(last=False)
+        return atlas
+
+    @property
+    def atlas_nbytes(self) -> int:
+        return sum(atlas.nbytes for atlas in self._atlases.values())
+
+    def clear(self):
+        self._tiles.clear()
+        self._atlases.clear()
+        self.nbytes = 0
+
+    def save(self, path: str):
+        """
+        Write every cached tile to an atlas file (path) with its index
+        (path + ".json"), both replaced atomically
+        """
+
+        tiles = {**self._tiles, **self._shared}
+        index = []
+        offset = 0
+        for key, img in tiles.items():
+            index.append([list(key), offset, img.shape[0]])
+            offset += img.nbytes
+
+        atlas = np.empty(offset, dtype=np.uint8)
+        for (_, start, _), img in zip(index, tiles.values()):
+            atlas[start : start + img.nbytes] = img.reshape(-1)
+
+        with open(path + ".tmp", "wb") as f:
+            atlas.tofile(f)
+        with open(path + ".json.tmp", "w") as f:
+            json.dump(index, f)
+        os.replace(path + ".tmp", path)
+        os.replace(path + ".json.tmp", path + ".json")
+
+    def attach(self, path: str):
+        """
+        Map an atlas file written by save read-only. Its tiles take
+        precedence over the ones drawn locally
+        """
+
+        with open(path + ".json") as f:
+            index = json.load(f)
+        if not index:
+            return
+        self._atlas = np.memmap(path, dtype=np.uint8, mode="r")
+        self._shared = {}
+        for key, offset, tile_size in index:
+            n = tile_size * tile_size * 3
+            self._shared[tuple(key)] = self._atlas[offset : offset + n].reshape(tile_size, tile_size, 3)
+
+
+class TileAtlas:
+    """
+    Every tile of one size stacked in a single array, so that a frame, or a
+    batch of frames, is assembled with one gather instead of a loop over
+    the cells.
+
+    A tile ID packs the object of a cell, the direction of the agent drawn
+    on it and the highlight as (slot * 5 + agent_dir + 1) * 2 + highlight,
+    agent_dir being -1 when there is no agent. The slot of an object comes
+    from its (type, color, state) encoding; slots are added, and their
+    tiles taken from the TileCache, the first time an encoding shows.
+    """
+
+    def __init__(self, cache: TileCache, tile_size: int = TILE_PIXELS, subdivs: int = 3):
+        self.cache = cache
+        self.tile_size = tile_size
+        self.subdivs = subdivs
+
+        # Slot of each (type, color, state) encoding, -1 until it is drawn
+        self._slots = np.full(
+            (len(OBJECT_TO_IDX), len(COLOR_TO_IDX), len(STATE_TO_IDX)), -1, dtype=np.int64
+        )
+        # Tiles as rows of pixels: row tile_id * tile_size + y is the row y
+        # of that tile, which lets render gather whole frame rows at once
+        self._rows = np.empty((0, tile_size * 3), dtype=np.uint8)
+        self._tile_y = np.arange(tile_size)
+
+        for obj in WAREHOUSE_OBJECTS:
+            self._add(obj.encode() if obj else (OBJECT_TO_IDX["empty"], 0, 0))
+
+    def __len__(self) -> int:
+        return len(self._rows) // self.tile_size
+
+    @property
+    def nbytes(self) -> int:
+        return self._rows.nbytes
+
+    def _add(self, encoding: tuple[int, int, int]):
+        obj = WorldObj.decode(*encoding)
+        tiles = [
+            self.cache.get(obj, agent_dir, highlight, self.tile_size, self.subdivs)
+            for agent_dir in AGENT_DIRS
+            for highlight in (False, True)
+        ]
+        self._slots[tuple(encoding)] = len(self) // (2 * len(AGENT_DIRS))
+        self._rows = np.concatenate(
+            [self._rows] + [tile.reshape(self.tile_size, -1) for tile in tiles]
+        )
+
+    def tile_ids(
+        self,
+        encodings: np.ndarray,
+        agent_pos: np.ndarray,
+        agent_dir: np.ndarray,
+        highlight_mask: np.ndarray | None = None,
+    ) -> np.ndarray:
+        """
+        (B, height, width) tile IDs of a batch of B grids, from their
+        (B, width, height, 3) encodings, the (B, N, 2) positions and (B, N)
+        directions of their N agents and their (B, width, height)
+        highlight masks. The first agent wins when two share a cell, agents
+        outside of the grid are not drawn.
+        """
+
+        cells = encodings.transpose(0, 2, 1, 3)
+        slots = self._slots[cells[..., 0], cells[..., 1], cells[..., 2]]
+        if (slots < 0).any():
+            for encoding in np.unique(cells[slots < 0], axis=0):
+                self._add(tuple(encoding))
+            slots = self._slots[cells[..., 0], cells[..., 1], cells[..., 2]]
+
+        dirs = np.zeros(slots.shape, dtype=np.int64)
+        envs = np.arange(len(dirs))
+        agent_pos = np.asarray(agent_pos)
+        agent_dir = np.asarray(agent_dir)
+        _, height, width = dirs.shape
+        inside = (
+            (agent_pos >= 0).all(axis=2) & (agent_pos[:, :, 0] < width) & (agent_pos[:, :, 1] < height)
+        )
+        for k in reversed(range(agent_pos.shape[1])):
+            rows = envs[inside[:, k]]
+            dirs[rows, agent_pos[rows, k, 1], agent_pos[rows, k, 0]] = agent_dir[rows, k] + 1
+
+        ids = (slots * len(AGENT_DIRS) + dirs) * 2
+        if highlight_mask is not None:
+            ids += highlight_mask.transpose(0, 2, 1)
+        return ids
+
+    def render(self, ids: np.ndarray, out: np.ndarray | None = None) -> np.ndarray:
+        """
+        (B, height * tile_size, width * tile_size, 3) frames of a batch of
+        tile ID maps, gathered in one np.take. out, if given, must be a
+        C-contiguous array of that shape and is filled in place.
+        """
+
+        n, height, width = ids.shape
+        ts = self.tile_size
+
+        # Pixel row y of the cell (i, j) comes from row ids[j, i] * ts + y of
+        # the atlas; ordered (B, j, y, i) the gathered rows are the frame
+        rows = ids[:, :, None, :] * ts + self._tile_y[:, None]
+        if out is None:
+            out = np.empty((n, height * ts, width * ts, 3), dtype=np.uint8)
+        np.take(self._rows, rows, axis=0, out=out.reshape(n, height, ts, width, ts * 3))
+        return out
+
@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import hashlib
+import os
+
+import numpy as np
+
+# Tables loaded or computed by this process, by layout key
+_tables: dict[str, np.ndarray] = {}
+
+
+def layout_key(wall: np.ndarray, view_size: int, dtype=np.float32) -> str:
+    """
+    Hash of a (height, width) wall mask, view size and dtype, naming the
+    view table of that layout
+    """
+
+    key = hashlib.sha256()
+    key.update(str((wall.shape, view_size, np.dtype(dtype).str)).encode("utf8"))
+    key.update(np.packbits(wall).tobytes())
+    return key.hexdigest()[:16]
+
+
+def view_table(wall: np.ndarray, view_size: int, dtype=np.float32) -> np.ndarray:
+    """
+    Encoded static view centred on every cell of a (height, width) wall
+    mask, as a (height * width, view_size ** 2) table indexed by flat cell
+    (y * width + x): -1 for the walls and the cells outside the grid, 0
+    for the others
+    """
+
+    pad = view_size // 2
+    padded = np.pad(wall, pad, constant_values=True)
+    windows = np.lib.stride_tricks.sliding_window_view(padded, (view_size, view_size))
+    table = np.where(windows.reshape(wall.size, view_size ** 2), -1, 0).astype(dtype)
+    table.flags.writeable = False
+    return table
+
+
+def load_view_table(
+    wall: np.ndarray, view_size: int, dtype=np.float32, cache_dir: str | None = None
+) -> np.ndarray:
+    """
+    view_table of a layout, computed once per process. With cache_dir,
+    the table is also kept there as a .npy file named by layout_key and
+    mapped read-only, so that the worker processes running the same
+    layout load it instead of computing it again. The file is replaced
+    atomically, concurrent writers leave one complete table
+    """
+
+    key = layout_key(wall, view_size, dtype)
+    table = _tables.get(key)
+    if table is not None:
+        return table
+
+    path = None if cache_dir is None else os.path.join(cache_dir, key + ".npy")
+    if path is not None and os.path.exists(path):
+        table = np.load(path, mmap_mode="r")
+    else:
+        table = view_table(wall, view_size, dtype)
+        if path is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                np.save(f, table)
+            os.replace(tmp, path)
+
+    _tables[key] = table
+    return table
+
+
+def draw_goals(views: np.ndarray, pos: np.ndarray, goals: np.ndarray, view_size: int) -> np.ndarray:
+    """
+    Draw goals into encoded views, in place: views is an (R, view_size ** 2)
+    array of the views centred on the (R, 2) positions pos, goals the
+    (x, y) of the goals as an (R, G, 2) or (G, 2) array. A goal inside a
+    view shows as 1. Returns views
+    """
+
+    pad = view_size // 2
+    offset = goals - pos[:, None, :] + pad
+    inside = ((offset >= 0) & (offset < view_size)).all(axis=2)
+    rows, which = np.nonzero(inside)
+    views[rows, offset[rows, which, 1] * view_size + offset[rows, which, 0]] = 1
+    return views
+
+
+def goal_view_table(
+    wall: np.ndarray, goal: np.ndarray, view_size: int, dtype=np.float32, cache_dir: str | None = None
+) -> np.ndarray:
+    """
+    Encoded view centred on every cell of a layout with its goals, as a
+    writable (height * width, view_size ** 2) table: the static views of
+    load_view_table with the cells of the (height, width) goal mask drawn
+    over them as 1
+    """
+
+    table = np.array(load_view_table(wall, view_size, dtype, cache_dir))
+    y, x = np.divmod(np.arange(wall.size), wall.shape[1])
+    gy, gx = np.nonzero(goal)
+    return draw_goals(table, np.stack((x, y), axis=1), np.stack((gx, gy), axis=1), view_size)
@@ -0,0 +1,29 @@
+"""
+NumPy arrays packed into one shared-memory block. A layout lists the
+(name, shape, dtype) of the arrays, each starting 64-byte aligned.
+"""
+from __future__ import annotations
+
+import numpy as np
+
+
+def aligned_size(shape, dtype) -> int:
+    # keep every array 64-byte aligned in the block
+    return -(-int(np.prod(shape)) * np.dtype(dtype).itemsize // 64) * 64
+
+
+def block_size(layout) -> int:
+    return sum(aligned_size(shape, dtype) for _, shape, dtype in layout)
+
+
+def attach(buf, layout) -> dict[str, np.ndarray]:
+    """
+    Arrays of the layout as views of buf, by name
+    """
+
+    arrays = {}
+    offset = 0
+    for name, shape, dtype in layout:
+        arrays[name] = np.ndarray(shape, dtype=dtype, buffer=buf, offset=offset)
+        offset += aligned_size(shape, dtype)
+    return arrays